@@ -1,112 +1,77 @@
+import startup
 import json
-import boto3
-import psycopg2
-from psycopg2 import sql
-from datetime import datetime,date
-current_date=date.today()
-def lambda_handler(event, context):
-    # Step 1: Extract user message
-    message = event.get('message', '')
-    if not message:
-        return {"statusCode": 400, "body": "No message found"}
+from datetime import date
 
-    # Step 2: Create Bedrock prompt
-    prompt = f"""
-You are an intelligent goal analyzer.
-Your task is to extract structured financial goal details from the user's message.
-Current date={current_date}
-Return a valid JSON object with the following keys:
-- goal_name: short title of the goal
-- target_amount: numeric value (no currency symbols)
-- target_date: in YYYY-MM-DD format if a time period or date is mentioned, else null
-- category: classify the goal as one of ["savings", "investment", "loan_repayment", "education", "travel", "health", "emergency", "other"]
-if target_date is provided as 1 year from now calculate it using current date.
+import bedrock_gateway
+import data_version
+import db
+import extraction
+import metrics
+import prompt_builder
 
-If no date or timespan is provided by default set it to 1 year or calculate from statement if it says i want to save 30000 for my trip and monthly i will save 5000 so it will take 6 months. Be smart be productive.
-Example Input: "I want to save 50,000 rupees for a vacation by March 2026"
-Example Output:
-{{
-  "goal_name": "Vacation Savings",
-  "target_amount": 50000,
-  "target_date": "2026-03-01",
-  "category": "travel"
-}}
 
-Example Input: I want to plan a trip to Tokyo, Japan for that I need to save 300000, my monthly saving for that trip should be 20000.
-Example Output:
-{{
-    "goal_name": "Tokyo, Japan trip"
-    "target_amount": 300000,
-    "target_date": "2027-01-19"
-    "category": "Travel"
-}}
-In above example I calculated the time as the date for e.g. I considered 19th October 2025 and then 300000/20000 = 15 months so 15 months would be 19th January 2027.
+def extract_with_bedrock(message):
+    """Ask Bedrock for the goal fields: (fields, None) or (None, reason)."""
+    prompt = f"""Record the financial goal in the message with the record_goal tool.
+Today is {date.today()}. Resolve relative dates ("in 1 year", "by March") from today.
+If a monthly saving is given, target_date = today + ceil(target_amount / monthly) months.
+If there is no date, timespan or monthly saving, use today + 1 year.
 
-Now, analyze this message:
-{message}
+Message: {prompt_builder.truncate(message, 200)}
 """
 
-    # Step 3: Initialize Bedrock client
-    client = boto3.client('bedrock-runtime', region_name='eu-north-1')
-
-    # Step 4: Prepare Bedrock messages
-    messages = [
-        {
-            "role": "user",
-            "content": [{"text": prompt}]
-        }
-    ]
-
-    # Step 5: Call Bedrock model
-    response = client.converse(
-        modelId="amazon.nova-lite-v1:0",
-        messages=messages,
-        inferenceConfig={
-            "maxTokens": 300,
-            "temperature": 0.7,
-            "topP": 0.9
-        }
+    return extraction.extract_structured(
+        "extract_goal", "goal", prompt, extraction.GOAL_SCHEMA, extraction.clean_goal, "Store one savings goal.",
     )
 
-    # Step 6: Extract raw text output
-    raw_output = response["output"]["message"]["content"][0]["text"]
 
-    # Step 7: Clean and parse model response
-    try:
-        cleaned_output = raw_output.strip().strip("```json").strip("```").strip()
-        extracted_data = json.loads(cleaned_output)
-    except Exception:
-        extracted_data = {"error": "Invalid JSON", "raw": raw_output}
+def lambda_handler(event, context):
+    startup.report_once()
+    # Step 1: Extract user message
+    message = event.get('message', '')
+    user_id = str(event.get('user_id') or db.DEFAULT_USER_ID)
+    if not message:
+        return {"statusCode": 400, "body": "No message found"}
 
-    # Step 8: Insert parsed goal into PostgreSQL
-    try:
-        conn = psycopg2.connect(
-            host="finprod.cvcamc60mtim.eu-north-1.rds.amazonaws.com",
-            port="5432",
-            database="finprod",
-            user="postgres",
-            password="Siddhesh"
-        )
-        cursor = conn.cursor()
+    # Step 2: Use fields already extracted by the router, else ask Bedrock
+    extracted_data, error = extraction.clean_goal(event.get('extracted'))
+    if extracted_data is not None:
+        metrics.incr("extraction.prefilled")
+    else:
+        try:
+            extracted_data, error = extract_with_bedrock(message)
+        except bedrock_gateway.BedrockUnavailable as e:
+            return {"statusCode": 503, "body": json.dumps({
+                "message": "I can't set up that goal right now. Please try again in a few minutes.",
+                "details": str(e),
+            })}
+        metrics.log_stats("extraction", lambda: extraction.stats("goal"))
+    if extracted_data is None:
+        return {"statusCode": 422, "body": json.dumps({
+            "message": "I couldn't work out that goal. Could you include the amount and a date, "
+                       "like 'save 50,000 for a vacation by March'?",
+            "details": error,
+        })}
 
-        # Insert new goal record
-        cursor.execute(
-            sql.SQL("""
-                INSERT INTO goal (goal_name, target_amount, target_date, category, raw_message)
-                VALUES (%s, %s, %s, %s, %s)
-            """),
-            (
-                extracted_data.get("goal_name"),
-                extracted_data.get("target_amount"),
-                extracted_data.get("target_date"),
-                extracted_data.get("category"),
-                message
+    # Step 3: Insert parsed goal into PostgreSQL
+    try:
+        with db.connection() as conn, conn.cursor() as cursor:
+            # Insert new goal record
+            cursor.execute(
+                """
+                    INSERT INTO goal (user_id, goal_name, target_amount, target_date, category, raw_message)
+                    VALUES (%s, %s, %s, %s, %s, %s)
+                """,
+                (
+                    user_id,
+                    extracted_data.get("goal_name"),
+                    extracted_data.get("target_amount"),
+                    extracted_data.get("target_date"),
+                    extracted_data.get("category"),
+                    message
+                )
             )
-        )
-
-        conn.commit()
-        cursor.close()
-        conn.close()
+            data_version.bump(cursor, [user_id])
 
     except Exception as e:
         return {
@@ -118,7 +83,7 @@ Now, analyze this message:
             })
         }
 
-    # Step 9: Return final result
+    # Step 4: Return final result
     return {
         "statusCode": 200,
         "body": json.dumps({
@@ -0,0 +1,53 @@
+"""AWS clients created once per container, on first use."""
+import os
+import threading
+
+from startup import lazy_import
+
+boto3 = lazy_import("boto3")
+botocore_config = lazy_import("botocore.config")
+
+BEDROCK_REGION = os.environ.get("BEDROCK_REGION", "eu-north-1")
+
+_clients = {}
+_lock = threading.Lock()
+
+
+def get_client(service, region_name=None, config=None):
+    """Return the shared client for `service`, creating it the first time.
+
+    `config` is a zero-argument callable returning a botocore Config, used only
+    when the client is created.
+    """
+    key = (service, region_name)
+    client = _clients.get(key)
+    if client is None:
+        with _lock:
+            client = _clients.get(key)
+            if client is None:
+                kwargs = {"config": config()} if config else {}
+                if region_name:
+                    client = boto3.client(service, region_name=region_name, **kwargs)
+                else:
+                    client = boto3.client(service, **kwargs)
+                _clients[key] = client
+    return client
+
+
+def _bedrock_config():
+    # bedrock_gateway owns retries and backoff; one botocore attempt per gateway attempt
+    return botocore_config.Config(retries={"max_attempts": 1, "mode": "standard"})
+
+
+def bedrock():
+    return get_client("bedrock-runtime", BEDROCK_REGION, config=_bedrock_config)
+
+
+def lambda_client():
+    return get_client("lambda")
+
+
+def set_client(service, client, region_name=None):
+    """Replace the shared client for `service` (e.g. with a local fake from fakes.py)."""
+    with _lock:
+        _clients[(service, region_name)] = client
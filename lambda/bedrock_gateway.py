@@ -0,0 +1,282 @@
+"""Single entry point for Bedrock calls.
+
+Every `converse` / `converse_stream` call goes through the same four steps:
+
+- single-flight: identical requests already in flight in this container
+  (e.g. from prefetch or background threads) share one model call;
+- a per-model token bucket (BEDROCK_RPS, BEDROCK_BURST). The bucket halves
+  its rate on each throttle and creeps back up with successes, so a burst
+  waits locally instead of hammering a throttled endpoint;
+- retries of throttling, timeout and 5xx errors with full-jitter
+  exponential backoff; botocore's own retries are switched off in aws_clients;
+- a per-model circuit breaker. After BEDROCK_BREAKER_FAILURES consecutive
+  failed calls it rejects calls for BEDROCK_BREAKER_COOLDOWN seconds. A
+  caller-supplied `fallback` then answers immediately. After the cooldown
+  one trial call is let through; the rest keep short-circuiting until it
+  succeeds (closing the circuit) or fails (re-opening it).
+
+A call that cannot be served raises BedrockUnavailable, or returns the
+fallback's text in the usual response shape with "fallback": True.
+"""
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+
+import aws_clients
+import metrics
+
+BEDROCK_RPS = float(os.environ.get("BEDROCK_RPS", "5"))  # per model, per container
+BEDROCK_BURST = float(os.environ.get("BEDROCK_BURST", "10"))
+BEDROCK_MAX_WAIT = float(os.environ.get("BEDROCK_MAX_WAIT", "5"))  # seconds a call may queue for a token
+BEDROCK_MAX_ATTEMPTS = int(os.environ.get("BEDROCK_MAX_ATTEMPTS", "4"))
+BEDROCK_BACKOFF_BASE = float(os.environ.get("BEDROCK_BACKOFF_BASE", "0.2"))
+BEDROCK_BACKOFF_CAP = float(os.environ.get("BEDROCK_BACKOFF_CAP", "4"))
+BEDROCK_BREAKER_FAILURES = int(os.environ.get("BEDROCK_BREAKER_FAILURES", "5"))
+BEDROCK_BREAKER_COOLDOWN = float(os.environ.get("BEDROCK_BREAKER_COOLDOWN", "30"))
+
+THROTTLE_ERRORS = {"ThrottlingException", "TooManyRequestsException", "ServiceQuotaExceededException"}
+TRANSIENT_ERRORS = THROTTLE_ERRORS | {
+    "ServiceUnavailableException", "InternalServerException", "ModelTimeoutException", "ModelNotReadyException",
+    "EndpointConnectionError", "ConnectTimeoutError", "ReadTimeoutError", "ConnectionClosedError",
+}
+
+
+class BedrockUnavailable(RuntimeError):
+    """Bedrock could not serve the call: circuit open, rate limited or retries exhausted."""
+
+
+class TokenBucket:
+    """Request-rate limiter that backs off on throttles (AIMD)."""
+
+    def __init__(self, rate=BEDROCK_RPS, burst=BEDROCK_BURST):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, max_wait=BEDROCK_MAX_WAIT):
+        """Take one token, waiting up to max_wait seconds; returns the time waited."""
+        started = time.monotonic()
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return now - started
+                wait = (1 - self.tokens) / self.rate
+            if now - started + wait > max_wait:
+                raise BedrockUnavailable("Bedrock request rate limit reached")
+            time.sleep(wait)
+
+    def on_throttle(self):
+        with self._lock:
+            self.rate = max(self.max_rate / 16, self.rate / 2)
+
+    def on_success(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+
+class CircuitBreaker:
+    """Opens after consecutive failures; after the cooldown, a single trial call decides whether it closes."""
+
+    def __init__(self, failures=BEDROCK_BREAKER_FAILURES, cooldown=BEDROCK_BREAKER_COOLDOWN):
+        self.threshold = failures
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self._trial_owner = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        return "open" if time.monotonic() - self.opened_at < self.cooldown else "half_open"
+
+    def allow(self):
+        """True when the call may go ahead; in half-open state only the first caller gets through."""
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "open" or self.trial_in_flight:
+                return False
+            self.trial_in_flight = True
+            self._trial_owner = threading.get_ident()
+            return True
+
+    def abandon_trial(self):
+        """Free the trial slot when this thread's trial call ended without an outcome (e.g. rate limited)."""
+        with self._lock:
+            if self.trial_in_flight and self._trial_owner == threading.get_ident():
+                self.trial_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self.trial_in_flight = False
+            # A failed trial call in half-open re-opens at once
+            if self.failures >= self.threshold or self.opened_at is not None:
+                if self.state != "open":
+                    metrics.incr("bedrock.breaker_opened")
+                self.opened_at = time.monotonic()
+
+
+_buckets = {}
+_breakers = {}
+_registry_lock = threading.Lock()
+
+
+def _for_model(registry, model_id, factory):
+    with _registry_lock:
+        if model_id not in registry:
+            registry[model_id] = factory()
+        return registry[model_id]
+
+
+def _error_code(error):
+    response = getattr(error, "response", None)
+    if isinstance(response, dict):
+        code = response.get("Error", {}).get("Code")
+        if code:
+            return code
+    return type(error).__name__
+
+
+def _backoff(attempt):
+    return random.uniform(0, min(BEDROCK_BACKOFF_CAP, BEDROCK_BACKOFF_BASE * 2 ** attempt))
+
+
+def _call(method, request):
+    model_id = request.get("modelId", "")
+    breaker = _for_model(_breakers, model_id, CircuitBreaker)
+    bucket = _for_model(_buckets, model_id, TokenBucket)
+    if not breaker.allow():
+        metrics.incr("bedrock.short_circuited")
+        raise BedrockUnavailable(f"Bedrock circuit open for {model_id}")
+    try:
+        return _attempt(method, request, breaker, bucket)
+    finally:
+        breaker.abandon_trial()
+
+
+def _attempt(method, request, breaker, bucket):
+    for attempt in range(BEDROCK_MAX_ATTEMPTS):
+        waited = bucket.acquire()
+        metrics.observe("bedrock.limiter_wait", waited * 1000)
+        try:
+            metrics.incr("bedrock.calls")
+            with metrics.timer(f"bedrock.{method}"):
+                response = getattr(aws_clients.bedrock(), method)(**request)
+        except Exception as e:
+            code = _error_code(e)
+            if code not in TRANSIENT_ERRORS:
+                breaker.record_success()  # the service answered; the request itself was bad
+                raise
+            if code in THROTTLE_ERRORS:
+                metrics.incr("bedrock.throttled")
+                bucket.on_throttle()
+            if attempt + 1 == BEDROCK_MAX_ATTEMPTS:
+                metrics.incr("bedrock.exhausted")
+                breaker.record_failure()
+                raise BedrockUnavailable(f"Bedrock {method} failed after {BEDROCK_MAX_ATTEMPTS} attempts: {code}") from e
+            metrics.incr("bedrock.retries")
+            time.sleep(_backoff(attempt))
+            continue
+        bucket.on_success()
+        breaker.record_success()
+        return response
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.response = None
+        self.error = None
+
+
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+def _single_flight(key, fn):
+    with _inflight_lock:
+        flight = _inflight.get(key)
+        leader = flight is None
+        if leader:
+            flight = _inflight[key] = _Flight()
+    if not leader:
+        metrics.incr("bedrock.coalesced")
+        flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.response
+    try:
+        flight.response = fn()
+        return flight.response
+    except Exception as e:
+        flight.error = e
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+        flight.done.set()
+
+
+def fallback_response(text):
+    """A converse-shaped response carrying locally produced text."""
+    return {
+        "output": {"message": {"role": "assistant", "content": [{"text": text}]}},
+        "stopReason": "fallback",
+        "usage": {},
+        "fallback": True,
+    }
+
+
+def converse(fallback=None, **request):
+    """Bedrock `converse` through the gateway; `fallback()` supplies text when Bedrock is unavailable."""
+    key = hashlib.sha256(json.dumps(request, sort_keys=True, default=str).encode()).hexdigest()
+    try:
+        return _single_flight(key, lambda: _call("converse", request))
+    except BedrockUnavailable as e:
+        if fallback is None:
+            raise
+        metrics.incr("bedrock.fallbacks")
+        print(f"Bedrock unavailable, using fallback: {e}")
+        return fallback_response(fallback())
+
+
+def converse_stream(**request):
+    """Bedrock `converse_stream` through the limiter, retries and breaker (streams are not shared)."""
+    return _call("converse_stream", request)
+
+
+def stats():
+    return {
+        "calls": metrics.counter("bedrock.calls"),
+        "coalesced": metrics.counter("bedrock.coalesced"),
+        "retries": metrics.counter("bedrock.retries"),
+        "throttled": metrics.counter("bedrock.throttled"),
+        "fallbacks": metrics.counter("bedrock.fallbacks"),
+        "short_circuited": metrics.counter("bedrock.short_circuited"),
+        "breakers": {model: breaker.state for model, breaker in _breakers.items()},
+        "rates": {model: round(bucket.rate, 2) for model, bucket in _buckets.items()},
+    }
@@ -1,79 +1,87 @@
-import os
+import startup
 import json
-import boto3
 from datetime import datetime, timedelta
-import psycopg2
 
-# Initialize Bedrock
-bedrock = boto3.client("bedrock-runtime", region_name="eu-north-1")
-
-# PostgreSQL connection settings
-DB_HOST = os.environ["DB_HOST"]
-DB_NAME = os.environ["DB_NAME"]
-DB_USER = os.environ["DB_USER"]
-DB_PASSWORD = os.environ["DB_PASSWORD"]
-
-MEMORY_FILE = "/tmp/memory.json"  # ephemeral Lambda memory
-
-def load_memory():
-    """Load chat memory (context) from /tmp"""
-    if os.path.exists(MEMORY_FILE):
-        with open(MEMORY_FILE, "r") as f:
-            return json.load(f)
-    return []
-
-def save_memory(memory):
-    """Save chat memory to /tmp"""
-    with open(MEMORY_FILE, "w") as f:
-        json.dump(memory[-20:], f)  # limit to last 20 exchanges for efficiency
-
-def get_recent_transactions(days=1):
-    """Fetch recent transactions from PostgreSQL"""
+import conversation_memory
+import db
+import goal_projections
+import prompt_builder
+import streaming
+
+MEMORY_NAMESPACE = "budget_guardian"
+
+def load_memory(user_id, limit=5):
+    """Load the user's recent exchanges with Budget Guardian"""
+    return conversation_memory.get_store().recent(MEMORY_NAMESPACE, user_id, limit)
+
+def save_turn(user_id, user_input, reply):
+    """Append one exchange to the user's bounded history"""
+    conversation_memory.get_store().append(MEMORY_NAMESPACE, user_id, user_input, reply)
+
+# Summary windows: label used in the prompt -> first day of the window
+WINDOWS = {
+    "today": lambda today: today,
+    "this week": lambda today: today - timedelta(days=today.weekday()),
+    "this month": lambda today: today.replace(day=1),
+}
+
+def detect_window(user_input):
+    """Pick the summary window the user is asking about (defaults to today)"""
+    text = user_input.lower()
+    if "month" in text:
+        return "this month"
+    if "week" in text:
+        return "this week"
+    return "today"
+
+def get_spending_rollups(user_id, window="today"):
+    """Fetch the user's pre-aggregated per-day, per-category rows from the daily_spending rollup"""
     end_date = datetime.utcnow().date()
-    start_date = end_date - timedelta(days=days)
-    conn = psycopg2.connect(
-        host=DB_HOST,
-        port="5432",
-        database=DB_NAME,
-        user=DB_USER,
-        password=DB_PASSWORD
-    )
-    cursor = conn.cursor()
-    query = f"""
-        SELECT amount, transaction_type, category, transaction_date
-        FROM transactions
-        WHERE transaction_date >= '{start_date}' AND transaction_date <= '{end_date}';
+    start_date = WINDOWS[window](end_date)
+    query = """
+        SELECT category, SUM(spent), SUM(earned), SUM(txn_count)
+        FROM daily_spending
+        WHERE user_id = %s AND day >= %s AND day <= %s
+        GROUP BY category;
     """
-    cursor.execute(query)
-    rows = cursor.fetchall()
-    cursor.close()
-    conn.close()
-
-    txns = [
-        {
-            "amount": float(r[0]),
-            "type": r[1],
-            "category": r[2],
-            "date": str(r[3])
-        }
+    with db.connection() as conn, conn.cursor() as cursor:
+        cursor.execute(query, (user_id, start_date, end_date))
+        rows = cursor.fetchall()
+
+    return [
+        {"category": r[0], "spent": float(r[1]), "earned": float(r[2]), "count": int(r[3])}
         for r in rows
     ]
-    return txns
 
-def summarize_spending(txns):
-    """Aggregate basic stats"""
-    total_spent = sum(t["amount"] for t in txns if t["type"] == "debit")
-    total_earned = sum(t["amount"] for t in txns if t["type"] == "credit")
+def get_active_goals(user_id, limit=5):
+    """The user's open goals with their precomputed progress, soonest target date first"""
+    return goal_projections.active(goal_projections.for_user(user_id), limit)
+
+def summarize_spending(rollups):
+    """Aggregate basic stats from rollup rows"""
+    total_spent = sum(r["spent"] for r in rollups)
+    total_earned = sum(r["earned"] for r in rollups)
+    top = sorted((r for r in rollups if r["spent"] > 0), key=lambda r: r["spent"], reverse=True)[:3]
     return {
         "spent": round(total_spent, 2),
         "earned": round(total_earned, 2),
-        "net_balance": round(total_earned - total_spent, 2)
+        "net_balance": round(total_earned - total_spent, 2),
+        "transactions": sum(r["count"] for r in rollups),
+        "top_categories": {r["category"]: round(r["spent"], 2) for r in top},
     }
 
-def generate_context(memory, user_input, spending_summary):
+def describe_goal(goal):
+    """One-line goal status for the prompt"""
+    text = f"{goal['goal_name']} ₹{goal['saved']} of ₹{goal['target_amount']} saved, due {goal['target_date'] or 'no date'}"
+    if goal.get("required_monthly") is not None:
+        text += f", needs ₹{goal['required_monthly']}/month"
+    return f"{text}, {goal['status'].replace('_', ' ')}"
+
+def generate_context(memory, user_input, spending_summary, window="today", goals=None):
     """Prepare prompt for Bedrock model with context"""
     context_snippets = "\n".join(
-        [f"User: {m['user']}\nAgent: {m['agent']}" for m in memory[-5:]]
+        [f"User: {m['user']}\nAgent: {m['agent']}"
+         for m in prompt_builder.fit_turns(memory[-5:], prompt_builder.PROMPT_CONTEXT_TOKENS, "Agent")]
     )
 
     prompt = f"""
@@ -83,9 +91,11 @@ Here is the recent memory of the conversation and events:
 {context_snippets}
 
 User's spending summary:
-- Total spent today: ₹{spending_summary['spent']}
-- Total earned today: ₹{spending_summary['earned']}
+- Total spent {window}: ₹{spending_summary['spent']}
+- Total earned {window}: ₹{spending_summary['earned']}
 - Net balance: ₹{spending_summary['net_balance']}
+- Top spending categories {window}: {spending_summary['top_categories']}
+- Active goals: {"; ".join(describe_goal(g) for g in goals) if goals else "none"}
 
 Now the user says: "{user_input}"
 
@@ -94,42 +104,57 @@ Mention patterns if noticed (e.g., overspending, improvement, consistency).
     """
     return prompt.strip()
 
-def query_bedrock(prompt):
-    """Send the contextual prompt to Bedrock"""
-    response = bedrock.converse(
-        modelId="amazon.nova-lite-v1:0",
-        messages=[{"role": "user", "content": [{"text": prompt}]}],
-        inferenceConfig={"maxTokens": 300, "temperature": 0.4},
-    )
-    return response["output"]["message"]["content"][0]["text"]
+def fallback_reply(spending_summary, window="today"):
+    """Plain summary used when Bedrock is unavailable"""
+    reply = (f"Spent {window}: ₹{spending_summary['spent']}, earned: ₹{spending_summary['earned']}, "
+             f"net: ₹{spending_summary['net_balance']}.")
+    if spending_summary["top_categories"]:
+        reply += " Top categories: " + ", ".join(
+            f"{category} ₹{amount}" for category, amount in spending_summary["top_categories"].items()
+        ) + "."
+    return reply
+
+def query_bedrock(prompt, chat_id=None, fallback=None):
+    """Send the contextual prompt to Bedrock, streaming the reply to the chat when chat_id is given"""
+    return streaming.converse_text("guardian", prompt, chat_id=chat_id, fallback=fallback)
 
 def lambda_handler(event, context):
+    startup.report_once()
     user_input = event.get("message", "")
+    user_id = str(event.get("user_id") or db.DEFAULT_USER_ID)
     if not user_input:
         return {"statusCode": 400, "body": "No input message"}
 
+    # Values the router already loaded while classifying the message
+    prefetched = event.get("prefetched") or {}
+
     # Step 1. Load conversation memory
-    memory = load_memory()
+    memory = prefetched["guardian_memory"] if "guardian_memory" in prefetched else load_memory(user_id)
 
-    # Step 2. Fetch spending summary
-    transactions = get_recent_transactions(days=1)
-    spending_summary = summarize_spending(transactions)
+    # Step 2. Fetch spending summary from the daily rollup, and active goals
+    window = detect_window(user_input)
+    spending_summary = prefetched.get("spending") or summarize_spending(get_spending_rollups(user_id, window))
+    goals = prefetched["goals"] if "goals" in prefetched else get_active_goals(user_id)
 
     # Step 3. Generate contextual prompt
-    prompt = generate_context(memory, user_input, spending_summary)
+    prompt = generate_context(memory, user_input, spending_summary, window, goals)
 
     # Step 4. Query Bedrock
-    bedrock_reply = query_bedrock(prompt)
+    stream_chat_id = event.get("stream_chat_id")
+    bedrock_reply = query_bedrock(
+        prompt, stream_chat_id, fallback=lambda: fallback_reply(spending_summary, window)
+    )
 
-    # Step 5. Update memory
-    memory.append({"user": user_input, "agent": bedrock_reply, "timestamp": datetime.utcnow().isoformat()})
-    save_memory(memory)
+    # Step 5. Update memory (written behind; the router flushes it after replying)
+    save_turn(user_id, user_input, bedrock_reply)
+    conversation_memory.log_stats()
 
     # Step 6. Return result
     return {
         "statusCode": 200,
         "body": json.dumps({
             "agent": "budget_guardian",
-            "response": bedrock_reply
+            "response": bedrock_reply,
+            "streamed": bool(stream_chat_id)
         })
     }
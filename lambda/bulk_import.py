@@ -0,0 +1,268 @@
+"""Bulk ingestion of pasted bank SMS / statement lines and CSV statements.
+
+Records are parsed locally where possible (CSV columns, transaction_parser),
+the rest are sent to Bedrock in batches of many records per call, and valid
+rows are written with one multi-row INSERT per batch. Rows that cannot be
+extracted or stored are reported individually instead of failing the import;
+that includes CSV rows whose date is missing or in an unrecognized format,
+which are never given a default date.
+"""
+import csv
+import io
+import json
+import os
+import re
+from datetime import date, datetime
+
+import db
+import extraction
+import metrics
+import transaction_parser
+import transaction_store
+
+LLM_BATCH_SIZE = int(os.environ.get("BULK_LLM_BATCH_SIZE", "20"))
+INSERT_BATCH_SIZE = int(os.environ.get("BULK_INSERT_BATCH_SIZE", "500"))
+MAX_RECORDS = int(os.environ.get("BULK_MAX_RECORDS", "5000"))
+
+CSV_COLUMNS = {
+    "date": ["date", "txn date", "transaction date", "value date", "posting date"],
+    "description": ["description", "narration", "particulars", "details", "remarks", "transaction details"],
+    "amount": ["amount", "transaction amount", "amount (inr)"],
+    "debit": ["debit", "withdrawal", "withdrawal amt", "withdrawal amount", "dr", "debit amount"],
+    "credit": ["credit", "deposit", "deposit amt", "deposit amount", "cr", "credit amount"],
+    "type": ["type", "dr/cr", "cr/dr", "transaction type"],
+}
+DATE_FORMATS = ["%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y", "%d/%m/%y", "%d-%m-%y", "%d %b %Y", "%d-%b-%Y", "%d %b %y",
+                "%d-%b-%y", "%d.%m.%Y"]
+
+
+# ---- Splitting input into records ----
+
+def looks_like_csv(text):
+    first_line = text.strip().splitlines()[0].lower() if text.strip() else ""
+    if "," not in first_line:
+        return False
+    headers = [h.strip() for h in first_line.split(",")]
+    return any(h in CSV_COLUMNS["date"] for h in headers) and any(
+        h in CSV_COLUMNS["amount"] + CSV_COLUMNS["debit"] + CSV_COLUMNS["credit"] for h in headers
+    )
+
+
+def split_lines(text):
+    """One record per non-empty line (pasted SMS / statement lines)."""
+    return [{"line": i + 1, "raw": line.strip()} for i, line in enumerate(text.splitlines()) if line.strip()]
+
+
+def _column(row, key):
+    for name, value in row.items():
+        if name and name.strip().lower() in CSV_COLUMNS[key] and value not in (None, ""):
+            return value.strip()
+    return None
+
+
+def _parse_date(value):
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(value.strip(), fmt).date()
+        except ValueError:
+            continue
+    return None
+
+
+def _parse_money(value):
+    try:
+        return abs(float(re.sub(r"[^\d.\-]", "", value)))
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_csv_row(row):
+    """Fields from statement columns; category comes from the description keywords."""
+    description = _column(row, "description") or ""
+    row_date = _parse_date(_column(row, "date") or "")
+    debit, credit = _column(row, "debit"), _column(row, "credit")
+    amount, transaction_type = None, None
+    if debit and _parse_money(debit):
+        amount, transaction_type = _parse_money(debit), "debit"
+    elif credit and _parse_money(credit):
+        amount, transaction_type = _parse_money(credit), "credit"
+    elif _column(row, "amount"):
+        raw_amount = _column(row, "amount")
+        amount = _parse_money(raw_amount)
+        type_hint = (_column(row, "type") or "").lower()
+        if type_hint.startswith(("cr", "credit")):
+            transaction_type = "credit"
+        elif type_hint.startswith(("dr", "debit")) or raw_amount.strip().startswith("-"):
+            transaction_type = "debit"
+        else:
+            transaction_type = transaction_parser.parse_type(description.lower())
+    category = transaction_parser.parse_category(description.lower(), transaction_type)
+    if category is None and transaction_type == "credit" and "salary" in description.lower():
+        category = "salary"
+    return {
+        "amount": amount,
+        "transaction_type": transaction_type,
+        "transaction_date": row_date.isoformat() if row_date else None,
+        "category": category,
+    }
+
+
+def split_csv(text):
+    """One record per statement row, numbered by the file line the row starts on."""
+    reader = csv.reader(io.StringIO(text))
+    header = next((values for values in reader if values), [])
+    records = []
+    while True:
+        line = reader.line_num + 1  # quoted fields may span lines, so rows are not one line each
+        values = next(reader, None)
+        if values is None:
+            break
+        if not values:
+            continue  # blank line
+        row = dict(zip(header, values))
+        description = _column(row, "description") or ""
+        record = {
+            "line": line,
+            "raw": ", ".join(v.strip() for v in values if v.strip()),
+            "description": description,
+            "fields": parse_csv_row(row),
+        }
+        if record["fields"]["transaction_date"] is None:
+            raw_date = _column(row, "date")
+            record["error"] = f"unrecognized date '{raw_date}'" if raw_date else "missing date"
+        records.append(record)
+    return records
+
+
+# ---- Extraction ----
+
+def extract_batch_with_bedrock(records, today):
+    """Extract many records in one schema-constrained model call.
+
+    Returns ({line: cleaned fields}, {line: reason}) for the lines that could not be extracted.
+    """
+    numbered = "\n".join(f"{r['line']}. {r['raw']}" for r in records)
+    prompt = f"""You are an intelligent financial transaction parser.
+Each numbered line below is one bank transaction (SMS, statement line or note).
+Record them with the record_transactions tool, one item per line, carrying the line number.
+
+Current date = {today}
+If a date is not mentioned use the current date; today means current date, yesterday means current date - 1.
+
+Lines:
+{numbered}"""
+
+    metrics.incr("bulk.llm_calls")
+    return extraction.extract_structured_batch(
+        "extract_batch", "transaction", prompt, [r["line"] for r in records], extraction.TRANSACTION_SCHEMA,
+        extraction.clean_transaction, "Store bank transactions, one item per numbered input line.",
+        maxTokens=80 * len(records) + 100,
+    )
+
+
+def _merge(extracted, known):
+    """Prefer values the statement itself provided over extracted ones."""
+    return dict(extracted, **{k: v for k, v in (known or {}).items() if v not in (None, "")})
+
+
+def extract_records(records, today):
+    """Fill in fields for every record; returns (rows, errors)."""
+    pending = []
+    for record in records:
+        if record.get("error"):
+            continue
+        fields = record.get("fields")
+        if fields and extraction.is_complete(fields, extraction.TRANSACTION_FIELDS):
+            record["path"] = "csv"
+            continue
+        parsed = transaction_parser.parse_transaction(record.get("description") or record["raw"], today)
+        if parsed:
+            record["fields"] = _merge(parsed, fields)
+            record["path"] = "fast"
+        else:
+            pending.append(record)
+
+    for start in range(0, len(pending), LLM_BATCH_SIZE):
+        batch = pending[start:start + LLM_BATCH_SIZE]
+        try:
+            extracted, failed = extract_batch_with_bedrock(batch, today)
+        except Exception as e:
+            for record in batch:
+                record["error"] = f"extraction failed: {e}"
+            continue
+        for record in batch:
+            record["path"] = "llm"
+            fields = extracted.get(record["line"])
+            if fields is None:
+                record["error"] = failed.get(record["line"], "missing from model output")
+            else:
+                record["fields"] = _merge(fields, record.get("fields"))
+
+    rows, errors = [], []
+    for record in records:
+        error = record.get("error")
+        if not error:
+            cleaned, error = extraction.clean_transaction(record.get("fields"))
+        if error:
+            errors.append({"line": record["line"], "input": record["raw"], "error": error})
+            continue
+        rows.append(dict(cleaned, raw_message=record["raw"], line=record["line"], path=record["path"]))
+    return rows, errors
+
+
+# ---- Storage ----
+
+def store_rows(rows):
+    """Write rows in multi-row INSERT batches; a failing batch is retried row by row."""
+    inserted, errors = 0, []
+    for start in range(0, len(rows), INSERT_BATCH_SIZE):
+        batch = rows[start:start + INSERT_BATCH_SIZE]
+        try:
+            with db.connection() as conn, conn.cursor() as cursor:
+                inserted += transaction_store.insert_transactions(cursor, batch)
+            continue
+        except Exception as e:
+            print(f"Bulk batch insert failed, isolating rows: {e}")
+        with db.connection() as conn, conn.cursor() as cursor:
+            failed = transaction_store.insert_transactions_isolated(cursor, batch)
+        failed_indexes = {index for index, _ in failed}
+        inserted += len(batch) - len(failed_indexes)
+        errors.extend(
+            {"line": batch[index]["line"], "input": batch[index]["raw_message"], "error": message}
+            for index, message in failed
+        )
+    return inserted, errors
+
+
+def import_text(text, user_id, today=None):
+    """Import a CSV statement or multi-line message for one user; returns a per-import report."""
+    today = today or date.today()
+    records = split_csv(text) if looks_like_csv(text) else split_lines(text)
+    if len(records) > MAX_RECORDS:
+        return {"inserted": 0, "failed": [], "error": f"Too many records ({len(records)} > {MAX_RECORDS})"}
+
+    with metrics.timer("bulk.extract"):
+        rows, errors = extract_records(records, today)
+    for row in rows:
+        row["user_id"] = user_id
+    with metrics.timer("bulk.insert"):
+        inserted, insert_errors = store_rows(rows)
+    errors = sorted(errors + insert_errors, key=lambda e: e["line"])
+
+    # Rows inserted per extraction path; records that failed extraction or insert are not counted
+    failed_lines = {e["line"] for e in insert_errors}
+    paths = {path: 0 for path in ("csv", "fast", "llm")}
+    for row in rows:
+        if row["line"] not in failed_lines:
+            paths[row["path"]] += 1
+    for path, count in paths.items():
+        metrics.incr(f"bulk.path.{path}", count)
+    report = {
+        "records": len(records),
+        "inserted": inserted,
+        "failed": errors,
+        "paths": paths,
+    }
+    print(json.dumps({"bulk_import": {k: v for k, v in report.items() if k != "failed"},
+                      "failed": len(errors)}))
+    return report
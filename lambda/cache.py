@@ -0,0 +1,160 @@
+"""Small caching layer: normalized keys, an in-process LRU with TTL, and an
+optional PostgreSQL-backed store shared by every container."""
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import db
+import metrics
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+
+
+def normalize_text(text):
+    """Lowercase, drop punctuation and fold whitespace: "How much did I spend?!" -> "how much did i spend"."""
+    text = _PUNCTUATION.sub(" ", (text or "").lower())
+    return " ".join(text.split())
+
+
+class LRUCache:
+    """Bounded in-process cache with least-recently-used and TTL eviction."""
+
+    def __init__(self, maxsize=1024, ttl=3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class PostgresStore:
+    """Key/value rows in the shared `kv_cache` table (migrations/010_kv_cache.sql), namespaced per cache."""
+
+    def __init__(self, namespace):
+        self.namespace = namespace
+
+    def get(self, key):
+        with db.connection() as conn, conn.cursor() as cursor:
+            cursor.execute(
+                "SELECT value FROM kv_cache WHERE namespace = %s AND key = %s AND expires_at > now()",
+                (self.namespace, key),
+            )
+            row = cursor.fetchone()
+        return row[0] if row else None
+
+    def set(self, key, value, ttl):
+        with db.connection() as conn, conn.cursor() as cursor:
+            cursor.execute(
+                """
+                INSERT INTO kv_cache (namespace, key, value, expires_at)
+                VALUES (%s, %s, %s, now() + make_interval(secs => %s))
+                ON CONFLICT (namespace, key)
+                DO UPDATE SET value = EXCLUDED.value, expires_at = EXCLUDED.expires_at
+                """,
+                (self.namespace, key, json.dumps(value), ttl),
+            )
+
+    def delete(self, key):
+        with db.connection() as conn, conn.cursor() as cursor:
+            cursor.execute("DELETE FROM kv_cache WHERE namespace = %s AND key = %s", (self.namespace, key))
+
+
+class TieredCache:
+    """LRU cache in front of an optional shared store, with hit/miss counters.
+
+    Counters are recorded as `cache.<name>.hit`, `.store_hit` and `.miss`. Store
+    errors are logged and treated as misses so the cache never fails a request.
+    """
+
+    def __init__(self, name, maxsize=1024, ttl=3600, store=None):
+        self.name = name
+        self.ttl = ttl
+        self.local = LRUCache(maxsize, ttl)
+        self.store = store
+
+    def get(self, key):
+        value = self.local.get(key)
+        if value is not None:
+            metrics.incr(f"cache.{self.name}.hit")
+            return value
+        if self.store is not None:
+            try:
+                value = self.store.get(key)
+            except Exception as e:
+                print(f"Cache store read failed ({self.name}): {e}")
+                value = None
+            if value is not None:
+                metrics.incr(f"cache.{self.name}.store_hit")
+                self.local.set(key, value)
+                return value
+        metrics.incr(f"cache.{self.name}.miss")
+        return None
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        self.local.set(key, value, ttl)
+        if self.store is not None:
+            try:
+                self.store.set(key, value, ttl)
+            except Exception as e:
+                print(f"Cache store write failed ({self.name}): {e}")
+
+    def delete(self, key):
+        self.local.delete(key)
+        if self.store is not None:
+            try:
+                self.store.delete(key)
+            except Exception as e:
+                print(f"Cache store delete failed ({self.name}): {e}")
+
+    def stats(self):
+        hits = metrics.counter(f"cache.{self.name}.hit")
+        store_hits = metrics.counter(f"cache.{self.name}.store_hit")
+        misses = metrics.counter(f"cache.{self.name}.miss")
+        lookups = hits + store_hits + misses
+        return {
+            "hits": hits,
+            "store_hits": store_hits,
+            "misses": misses,
+            "hit_rate": round((hits + store_hits) / lookups, 3) if lookups else 0.0,
+            "size": len(self.local),
+        }
+
+
+def make_store(kind, namespace):
+    """Build the backing store selected by an env setting ("postgres" or none)."""
+    if kind == "postgres":
+        return PostgresStore(namespace)
+    return None
@@ -1,10 +1,26 @@
+import startup
+import importlib
 import json
-import boto3
 import os
-
-# Initialize AWS clients
-bedrock = boto3.client('bedrock-runtime', region_name='eu-north-1')
-lambda_client = boto3.client('lambda')
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import date
+
+import aws_clients
+import bedrock_gateway
+import extraction
+import investment_insights
+import local_intent
+import metrics
+import model_registry
+import prefetch
+import streaming
+import telegram
+import webhook_queue
+from cache import LRUCache, TieredCache, make_store, normalize_text
 
 # Child Lambda names (for routing)
 TRANSACTION_LAMBDA = os.environ.get('TRANSACTION_LAMBDA')
@@ -12,19 +28,144 @@ GOAL_LAMBDA = os.environ.get('GOAL_LAMBDA')
 QUERY_LAMBDA = os.environ.get('QUERY_LAMBDA')
 BUDGET_LAMBDA = os.environ.get('BUDGET_LAMBDA')
 
+# "combined": one Bedrock call returns the intent plus transaction/goal fields
+CLASSIFY_MODE = os.environ.get('CLASSIFY_MODE', 'separate')
+
+# "async": acknowledge the webhook at once and reply via sendMessage from a background worker
+WEBHOOK_MODE = os.environ.get('WEBHOOK_MODE', 'sync')
+WEBHOOK_QUEUE = os.environ.get('WEBHOOK_QUEUE', 'lambda')  # "lambda" (Event invoke) or "local"
+
+# "inprocess": call the child handlers directly in this process (one deployment package);
+# intents listed in ROUTE_REMOTE_INTENTS still go through a Lambda invoke
+ROUTING_MODE = os.environ.get('ROUTING_MODE', 'remote')
+ROUTE_REMOTE_INTENTS = {i.strip() for i in os.environ.get('ROUTE_REMOTE_INTENTS', '').split(',') if i.strip()}
+
+INTENTS = ("transaction", "goal", "query", "budget_guardian")
+# Share of locally classified messages also labelled by Bedrock (off the reply path), for evaluation
+INTENT_SHADOW_RATE = float(os.environ.get('INTENT_SHADOW_RATE', '0.05'))
+# Child intents whose reply is streamed to the chat when STREAM_REPLIES=1
+STREAMED_INTENTS = ("query", "budget_guardian")
+
+# intent -> (child handler module, child Lambda name)
+CHILD_ROUTES = {
+    "transaction": ("financial_extraction", TRANSACTION_LAMBDA),
+    "statement": ("financial_extraction", TRANSACTION_LAMBDA),
+    "goal": ("addGoalLambda", GOAL_LAMBDA),
+    "query": ("lambda_query_agent", QUERY_LAMBDA),
+    "budget_guardian": ("budget_guardian", BUDGET_LAMBDA),
+}
+
+# Normalized message -> intent, so repeated phrasings skip the Bedrock call
+intent_cache = TieredCache(
+    "intent",
+    maxsize=int(os.environ.get('INTENT_CACHE_SIZE', '2048')),
+    ttl=int(os.environ.get('INTENT_CACHE_TTL', '86400')),
+    store=make_store(os.environ.get('INTENT_CACHE_STORE'), "intent"),
+)
+
 # ---- Intent Classification ----
-def classify_intent(user_input: str) -> str:
+def apply_budget_fallback(intent: str, cleaned_input: str) -> str:
+    """Spending-window questions go to Budget Guardian rather than the query agent."""
+    if intent == "query" and any(
+        k in cleaned_input for k in ["today", "week", "daily", "limit", "over budget", "spent"]
+    ):
+        return "budget_guardian"
+    return intent
+
+
+def classify_without_bedrock(user_input: str):
+    """(intent, decision) from greetings, investment keywords, local classifier and cache.
+
+    The intent is None when Bedrock is needed. `decision` describes how the
+    message was answered, for the intent log.
+    """
     cleaned_input = user_input.lower().strip()
     greetings = ["hi", "hello", "hey", "heya", "yo"]
     if cleaned_input in greetings:
-        return "greeting"
+        return "greeting", {"stage": "greeting", "answer": "greeting"}
 
     # 🔹 New: detect if it’s an investment-related query
     investment_keywords = ["invest", "investment", "returns", "mutual fund", "stock", "sip", "etf", "portfolio"]
     if any(k in cleaned_input for k in investment_keywords):
-        return "investment"
+        return "investment", {"stage": "investment", "answer": "investment"}
 
-    # Otherwise, use Bedrock for classification
+    # Confident local answer (rules / trained model) skips the Bedrock round trip. It runs
+    # before the cache, whose shared store (INTENT_CACHE_STORE) costs a database round trip.
+    # The local prediction is logged for every message, confident or not.
+    local, confidence, local_stage, accepted = local_intent.explain(user_input)
+    decision = {"local_intent": local, "local_stage": local_stage, "confidence": round(confidence, 3)}
+    if accepted:
+        metrics.incr(f"intent.local.{local_stage}")
+        intent = apply_budget_fallback(local, cleaned_input)
+        return intent, dict(decision, stage=local_stage, answer=intent, shadow_rate=INTENT_SHADOW_RATE)
+
+    cached_intent = intent_cache.get(normalize_text(user_input))
+    if cached_intent:
+        return cached_intent, dict(decision, stage="cache", answer=cached_intent)
+
+    return None, dict(decision, stage="bedrock")
+
+
+def remember_intent(user_input: str, intent: str):
+    """Cache a Bedrock label for repeated phrasings."""
+    intent_cache.set(normalize_text(user_input), intent)
+
+
+def intent_cache_stats():
+    return dict(intent_cache.stats(), bedrock_calls=metrics.counter("intent.bedrock_calls"))
+
+
+def log_intent(user_input: str, decision, label=None):
+    """One `intent_log` line per message: how it was answered and, when known, the Bedrock label.
+
+    Cached answers are earlier Bedrock labels; locally answered messages are
+    labelled only when picked for a shadow call.
+    """
+    source = {"bedrock": "bedrock", "cache": "cache"}.get(decision["stage"], "shadow")
+    if label is None and decision["stage"] == "cache":
+        label = decision["answer"]
+    record = dict(decision, message=user_input, intent=label, label_source=source if label else None)
+    print(json.dumps({"intent_log": record}))
+
+
+_shadow_executor = None
+
+
+def _shadow_label(user_input: str, decision):
+    label = None
+    try:
+        label, response = bedrock_label(user_input)
+        if response.get("fallback") or label not in INTENTS:
+            label = None
+    except Exception as e:
+        print(f"Shadow classification failed: {e}")
+    if label:
+        metrics.incr("intent.shadow_labelled")
+        metrics.incr("intent.shadow_agree" if label == decision["answer"] else "intent.shadow_disagree")
+    log_intent(user_input, decision, label)
+
+
+def record_decision(user_input: str, decision):
+    """Log a locally answered message, first asking Bedrock for a label on a sample of them.
+
+    The shadow call runs on a background thread, so it never delays the reply.
+    """
+    global _shadow_executor
+    if decision["stage"] in local_intent.STAGES and random.random() < INTENT_SHADOW_RATE:
+        metrics.incr("intent.shadow_calls")
+        if _shadow_executor is None:
+            _shadow_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="intent-shadow")
+        _shadow_executor.submit(_shadow_label, user_input, decision)
+    else:
+        log_intent(user_input, decision)
+
+
+def is_intent_label(text):
+    return str(text).lower().strip() in INTENTS
+
+
+def bedrock_label(user_input: str, fallback=None):
+    """(intent text, response) from the Bedrock classifier, after the budget keyword fallback."""
     prompt = f"""
 You are a financial assistant intent classifier. Classify the user input into one of these categories:
 
@@ -38,50 +179,111 @@ Respond with only one word: transaction, goal, query, or budget_guardian.
 Input: "{user_input}"
 """
 
-    response = bedrock.converse(
-        modelId="amazon.nova-lite-v1:0",
-        messages=[{"role": "user", "content": [{"text": prompt}]}],
-        inferenceConfig={"maxTokens": 50, "temperature": 0.3}
-    )
-
-    output_text = response["output"]["message"]["content"][0]["text"].lower().strip()
+    metrics.incr("intent.bedrock_calls")
+    response = model_registry.converse("classify", prompt, validate=is_intent_label, fallback=fallback)
+    output_text = model_registry.text(response).lower().strip()
 
     # Fallback keyword logic for budget_guardian
-    if output_text == "query" and any(
-        k in cleaned_input for k in ["today", "week", "daily", "limit", "over budget", "spent"]
-    ):
-        output_text = "budget_guardian"
+    return apply_budget_fallback(output_text, user_input.lower().strip()), response
+
 
-    if output_text in ["transaction", "goal", "query", "budget_guardian"]:
+def classify_intent(user_input: str, before_model=None) -> str:
+    """Intent label; `before_model` is called just before falling back to Bedrock."""
+    local_intent_result, decision = classify_without_bedrock(user_input)
+    if local_intent_result:
+        record_decision(user_input, decision)
+        return local_intent_result
+    if before_model:
+        before_model()
+
+    # Otherwise, use Bedrock for classification
+    output_text, response = bedrock_label(user_input, fallback=lambda: local_intent.best_guess(user_input))
+
+    if output_text in INTENTS:
+        if response.get("fallback"):
+            log_intent(user_input, dict(decision, stage="fallback", answer=output_text))
+        else:
+            remember_intent(user_input, output_text)
+            log_intent(user_input, dict(decision, answer=output_text), output_text)
         return output_text
 
+    log_intent(user_input, dict(decision, answer="unknown"))
     return "unknown"
 
 
-# ---- Investment Suggestions ----
-def get_investment_suggestions(user_input: str):
-    """Use Bedrock to generate top 5 investment options based on current factors."""
-    prompt = f"""
-You are a financial advisor at Blackrock who has salary of 7 crore. If they are giving it to you then you are absolutely best and accurate at your job. Now i want your help with my financial planning. Based on the current market environment, inflation trends, and general risk tolerance,
-suggest the 5 best investment options for an Indian investor. Before suggesting anything do a clear analysis of stocks that you will be suggesting to the users verify their performance.
+def classify_and_extract(user_input: str, before_model=None):
+    """Return (intent, extracted_fields) using a single Bedrock call for both.
 
-Remember you are a advisor and should not be a LLM
+    Extracted fields are only returned for transaction and goal messages that
+    needed the model; locally classified messages return None and the child
+    handler extracts as usual.
+    """
+    local_intent_result, decision = classify_without_bedrock(user_input)
+    if local_intent_result:
+        record_decision(user_input, decision)
+        return local_intent_result, None
+    if before_model:
+        before_model()
+    cleaned_input = user_input.lower().strip()
 
-Consider:
-the factors mentioned below if not provided you already know what are the best factors .
-User query: "{user_input}"
+    prompt = f"""
+You are a financial assistant. Classify the user input and, for transactions and goals, extract its details in the same answer.
 
+Intents:
+1. transaction - money spent or received
+2. goal - saving or future targets
+3. query - general finance questions or data requests
+4. budget_guardian - user asking about spending alerts or daily budget status
+
+Current date = {date.today()}
+Return only a JSON object with these keys:
+- intent: one of "transaction", "goal", "query", "budget_guardian"
+- transaction: for transactions only, else null. Object with
+  amount (number, no currency symbols), transaction_type ("debit" or "credit"),
+  transaction_date (YYYY-MM-DD; today if not mentioned, yesterday = current date - 1),
+  category (one of {json.dumps(extraction.TRANSACTION_CATEGORIES)})
+- goal: for goals only, else null. Object with
+  goal_name (short title), target_amount (number, no currency symbols),
+  target_date (YYYY-MM-DD; 1 year from current date if no date or timespan is given,
+  or target_amount / monthly saving months from current date when a monthly saving is given),
+  category (one of {json.dumps(extraction.GOAL_CATEGORIES)})
 
-If users are asking yes no question answer then in that way. Please if he is asking will this stock go up you should start with Yes thsi will go up ...... or No this will not go up due to .....
+Input: "{user_input}"
 """
 
-    response = bedrock.converse(
-        modelId="amazon.nova-lite-v1:0",
-        messages=[{"role": "user", "content": [{"text": prompt}]}],
-        inferenceConfig={"maxTokens": 300, "temperature": 0.5}
+    metrics.incr("intent.bedrock_calls")
+    metrics.incr("intent.combined_calls")
+    response = model_registry.converse(
+        "classify_extract", prompt, validate=lambda text: is_intent_label(extraction.parse_model_json(text)["intent"]),
+        fallback=lambda: json.dumps({"intent": local_intent.best_guess(user_input)}),
     )
+    raw_output = model_registry.text(response)
 
-    return response["output"]["message"]["content"][0]["text"].strip()
+    try:
+        parsed = extraction.parse_model_json(raw_output)
+        intent = str(parsed.get("intent", "")).lower().strip()
+    except Exception:
+        parsed = {}
+        intent = raw_output.lower().strip()
+
+    intent = apply_budget_fallback(intent, cleaned_input)
+    if intent not in INTENTS:
+        log_intent(user_input, dict(decision, answer="unknown"))
+        return "unknown", None
+
+    if response.get("fallback"):
+        log_intent(user_input, dict(decision, stage="fallback", answer=intent))
+    else:
+        remember_intent(user_input, intent)
+        log_intent(user_input, dict(decision, answer=intent), intent)
+    extracted = parsed.get(intent) if intent in ["transaction", "goal"] else None
+    return intent, extracted if isinstance(extracted, dict) else None
+
+
+# ---- Investment Suggestions ----
+def get_investment_suggestions(user_input: str, chat_id=None):
+    """Investment answer built on today's precomputed brief; None when it was sent to chat_id."""
+    return investment_insights.answer(user_input, chat_id)
 
 
 # ---- Lambda Invocation ----
@@ -89,7 +291,7 @@ def invoke_lambda(function_name, payload):
     if not function_name:
         return {"text": "Error: A required child function is not configured."}
 
-    response = lambda_client.invoke(
+    response = aws_clients.lambda_client().invoke(
         FunctionName=function_name,
         InvocationType='RequestResponse',
         Payload=json.dumps(payload)
@@ -98,7 +300,36 @@ def invoke_lambda(function_name, payload):
     return response_payload
 
 
+def route_to_child(intent, payload, mode=None):
+    """Run the child handler for an intent, in process or through a Lambda invoke.
+
+    In-process handlers share this container's Bedrock client and DB pool.
+    """
+    module_name, function_name = CHILD_ROUTES[intent]
+    mode = mode or ROUTING_MODE
+    if mode == "inprocess" and intent not in ROUTE_REMOTE_INTENTS:
+        handler = importlib.import_module(module_name).lambda_handler
+        with metrics.timer(f"route.inprocess.{intent}"):
+            # JSON round trip: the child gets its own copy, as with an invoke payload
+            return handler(json.loads(json.dumps(payload)), None)
+    with metrics.timer(f"route.remote.{intent}"):
+        return invoke_lambda(function_name, payload)
+
+
 # ---- Extract Response ----
+def child_reply(child_response):
+    """Reply text from a child handler, or None when the child already streamed it to the chat."""
+    body = child_response.get('body') if isinstance(child_response, dict) else None
+    try:
+        if isinstance(body, str):
+            body = json.loads(body)
+    except ValueError:
+        pass
+    if isinstance(body, dict) and body.get('streamed'):
+        return None
+    return extract_response_text(child_response)
+
+
 def extract_response_text(child_response):
     try:
         if isinstance(child_response, dict) and 'body' in child_response:
@@ -118,46 +349,166 @@ def extract_response_text(child_response):
         return "Error processing child response."
 
 
-# ---- Main Lambda Handler ----
-def lambda_handler(event, context):
+def is_csv_document(document):
+    """True for an uploaded CSV bank statement."""
+    if not document:
+        return False
+    file_name = (document.get('file_name') or '').lower()
+    return file_name.endswith('.csv') or document.get('mime_type') in ('text/csv', 'text/comma-separated-values')
+
+
+# ---- Update Processing ----
+def process_update(body):
+    """Classify and route one Telegram update; returns (chat_id, reply text).
+
+    The reply text is None when it was already streamed to the chat, and
+    (None, None) means there was nothing to answer.
+    """
+    chat_id = None
+    pending = None  # prefetch started during classification
+    stages = {}
+
+    @contextmanager
+    def stage(name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            stages[name] = (time.perf_counter() - started) * 1000
+            metrics.observe(f"pipeline.{name}", stages[name])
+
     try:
-        body = json.loads(event.get('body', '{}'))
         message = body.get('message', {})
         chat_id = message.get('chat', {}).get('id')
         message_text = message.get('text', '')
 
-        if not message_text or not chat_id:
-            return {"statusCode": 200, "body": "No message or chat_id found"}
-
-        # Step 1: classify intent
-        intent = classify_intent(message_text)
-        payload = {"message": message_text}
+        if chat_id and is_csv_document(message.get('document')):
+            # Uploaded statement: bulk import through the transaction handler
+            csv_text = telegram.download_file(message['document']['file_id'])
+            intent = "statement"
+            payload = {"message": message.get('caption', ''), "csv": csv_text, "user_id": str(chat_id)}
+        else:
+            if not message_text or not chat_id:
+                return None, None
+
+            # Step 1: classify intent (and extract fields in combined mode). When Bedrock is
+            # needed, the user's context is prefetched while the model call is in flight.
+            def start_prefetch():
+                nonlocal pending
+                pending = prefetch.start(chat_id, message_text)
+
+            hook = start_prefetch if prefetch.PREFETCH_ENABLED else None
+            with stage("classify"):
+                if CLASSIFY_MODE == "combined":
+                    intent, extracted = classify_and_extract(message_text, before_model=hook)
+                else:
+                    intent, extracted = classify_intent(message_text, before_model=hook), None
+            metrics.log_stats("intent_cache", intent_cache_stats)
+            payload = {"message": message_text, "user_id": str(chat_id)}
+            if streaming.STREAM_REPLIES and intent in STREAMED_INTENTS:
+                payload["stream_chat_id"] = chat_id
+            if extracted:
+                payload["extracted"] = extracted
+            if pending is not None:
+                with stage("prefetch_wait"):
+                    prefetched = pending.collect(intent)
+                if prefetched:
+                    payload["prefetched"] = prefetched
 
         # Step 2: route or handle locally
         if intent == "greeting":
             response_text = "Hi 👋 How may I help you with your finances today?"
-        elif intent == "transaction":
-            response_text = extract_response_text(invoke_lambda(TRANSACTION_LAMBDA, payload))
-        elif intent == "goal":
-            response_text = extract_response_text(invoke_lambda(GOAL_LAMBDA, payload))
-        elif intent == "query":
-            response_text = extract_response_text(invoke_lambda(QUERY_LAMBDA, payload))
-        elif intent == "budget_guardian":
-            response_text = extract_response_text(invoke_lambda(BUDGET_LAMBDA, payload))
+        elif intent in CHILD_ROUTES:
+            with stage("route"):
+                response_text = child_reply(route_to_child(intent, payload))
         elif intent == "investment":
-            # Handle investment within same Lambda
-            response_text = get_investment_suggestions(message_text)
+            # Handle investment within same Lambda; when streaming, the reply is already in the chat
+            response_text = get_investment_suggestions(message_text, chat_id if streaming.STREAM_REPLIES else None)
         else:
             response_text = "Sorry, I couldn’t understand that. Could you rephrase?"
 
     except Exception as e:
         print(f"Error processing request: {e}")
         response_text = "Sorry, something went wrong on my end."
-        try:
-            body = json.loads(event.get('body', '{}'))
-            chat_id = body.get('message', {}).get('chat', {}).get('id')
-        except:
-            chat_id = None
+
+    if stages:
+        prefetch.log_pipeline(stages, pending)
+    metrics.log_stats("bedrock", bedrock_gateway.stats)
+    metrics.log_stats("models", model_registry.stats)
+    return chat_id, response_text
+
+
+def after_reply():
+    """Work that must finish before the container may freeze, run once the user has the reply.
+
+    Persists conversation turns the in-process handlers wrote behind. The module
+    is only loaded when a handler ran here, so remote routing skips this.
+    """
+    memory = sys.modules.get("conversation_memory")
+    if memory is not None:
+        with metrics.timer("pipeline.after_reply"):
+            memory.flush()
+
+
+def reply_in_background(job):
+    """Worker side of async mode: process the update and send the reply through the Bot API."""
+    chat_id, response_text = process_update(job["update"])
+    if chat_id and response_text is not None:
+        telegram.call("sendMessage", chat_id=chat_id, text=response_text)
+    after_reply()
+
+
+webhook_jobs = webhook_queue.make_queue(WEBHOOK_QUEUE, reply_in_background)
+_seen_updates = LRUCache(maxsize=4096, ttl=3600)  # update_ids already accepted, to drop redeliveries
+
+
+# ---- Main Lambda Handler ----
+def lambda_handler(event, context):
+    startup.report_once()
+
+    # Async worker invocation (Event invoke from the webhook side)
+    if "async_update" in event:
+        webhook_queue.run_job(reply_in_background, event["async_update"])
+        metrics.log_stats("webhook", lambda: webhook_queue.stats(webhook_jobs))
+        return {"statusCode": 200}
+
+    try:
+        body = json.loads(event.get('body') or '{}')
+    except ValueError:
+        body = {}
+
+    if WEBHOOK_MODE == "async":
+        # Acknowledge at once; the reply is sent with sendMessage when processing finishes
+        with metrics.timer("webhook.ack"):
+            update_id = body.get('update_id')
+            if update_id is not None and _seen_updates.get(update_id):
+                metrics.incr("webhook.duplicate")
+            else:
+                job = {"update": body, "received_at": time.time()}
+                try:
+                    webhook_jobs.put(job)
+                except Exception as e:
+                    # Never drop the update: process it now, as in sync mode
+                    metrics.incr("webhook.enqueue_failed")
+                    print(f"Enqueue failed, processing update synchronously: {e}")
+                    try:
+                        reply_in_background(job)
+                    except Exception as e:
+                        # Not marked as seen: Telegram redelivers after an error response
+                        print(f"Synchronous fallback failed: {e}")
+                        return {"statusCode": 500, "body": ""}
+                # Only a queued or processed update counts as seen, so Telegram's redelivery is not dropped
+                if update_id is not None:
+                    _seen_updates.set(update_id, True)
+        metrics.log_stats("webhook", lambda: webhook_queue.stats(webhook_jobs))
+        return {"statusCode": 200, "body": ""}
+
+    chat_id, response_text = process_update(body)
+    if chat_id is None and response_text is None:
+        return {"statusCode": 200, "body": "No message or chat_id found"}
+    if response_text is None:
+        after_reply()
+        return {"statusCode": 200, "body": ""}  # reply was streamed to the chat
 
     # Step 3: send response back to Telegram
     if chat_id:
@@ -0,0 +1,402 @@
+"""Per-user conversation memory shared by the agents.
+
+Turns are keyed by (namespace, user_id) with an index, so reading or appending
+touches only one user's recent turns, and each (namespace, user) keeps a
+bounded ring buffer of MEMORY_MAX_TURNS turns. Namespaces keep the agents
+apart ("budget_guardian", "query_agent"). Each (namespace, user) also has at
+most one rolling summary of older turns, kept next to the turns (see
+prompt_builder.refresh_summary).
+
+Backends: SQLite in WAL mode under /tmp (local stand-in, per container) or the
+PostgreSQL conversation_turns and conversation_summaries tables (MEMORY_BACKEND=postgres, durable and
+shared across containers). Either way the store is fronted by an in-process
+read-through cache, and new turns are written behind the response path by a
+background thread. The router calls `flush` once the reply has been
+delivered (see classification_function.after_reply), so turns are not left
+queued in a container that may be frozen or never thawed, and the user never
+waits on the write. Handlers deployed as separate Lambdas cannot do that; with
+the Postgres backend set MEMORY_WRITE_BEHIND=0 on them.
+"""
+import atexit
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+import db
+import metrics
+from cache import LRUCache
+from startup import lazy_import
+
+psycopg2_extras = lazy_import("psycopg2.extras")
+
+MEMORY_DB = os.environ.get("MEMORY_DB", "/tmp/conversation_memory.db")
+MEMORY_MAX_TURNS = int(os.environ.get("MEMORY_MAX_TURNS", "20"))
+MEMORY_BACKEND = os.environ.get("MEMORY_BACKEND", "sqlite")  # "sqlite" or "postgres"
+MEMORY_CACHE_TTL = int(os.environ.get("MEMORY_CACHE_TTL", "60"))  # bounds staleness across containers
+MEMORY_CACHE_USERS = int(os.environ.get("MEMORY_CACHE_USERS", "1000"))
+MEMORY_WRITE_BEHIND = os.environ.get("MEMORY_WRITE_BEHIND", "1") == "1"
+MEMORY_FLUSH_TIMEOUT = float(os.environ.get("MEMORY_FLUSH_TIMEOUT", "2.0"))  # seconds to wait for queued turns after a reply
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS turns (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    namespace TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    user_text TEXT NOT NULL,
+    agent_text TEXT NOT NULL,
+    created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS turns_user_idx ON turns (namespace, user_id, id);
+CREATE TABLE IF NOT EXISTS summaries (
+    namespace TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    summary TEXT NOT NULL,
+    covered_through TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    PRIMARY KEY (namespace, user_id)
+);
+"""
+
+
+class SqliteTurnStore:
+    """Bounded per-user turn history in SQLite (one connection per thread)."""
+
+    def __init__(self, path=MEMORY_DB, max_turns=MEMORY_MAX_TURNS):
+        self.path = path
+        self.max_turns = max_turns
+        self._local = threading.local()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def append(self, namespace, user_id, user_text, agent_text, created_at=None):
+        """Add one turn and trim the user's history to the newest max_turns."""
+        created_at = created_at or datetime.utcnow().isoformat()
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "INSERT INTO turns (namespace, user_id, user_text, agent_text, created_at) VALUES (?, ?, ?, ?, ?)",
+                (namespace, str(user_id), user_text, agent_text, created_at),
+            )
+            conn.execute(
+                """
+                DELETE FROM turns
+                WHERE namespace = ? AND user_id = ? AND id <= (
+                    SELECT id FROM turns WHERE namespace = ? AND user_id = ?
+                    ORDER BY id DESC LIMIT 1 OFFSET ?
+                )
+                """,
+                (namespace, str(user_id), namespace, str(user_id), self.max_turns),
+            )
+
+    def recent(self, namespace, user_id, limit=None):
+        """The user's newest turns, oldest first, as {"user", "agent", "timestamp"} dicts."""
+        rows = self._conn().execute(
+            """
+            SELECT user_text, agent_text, created_at FROM turns
+            WHERE namespace = ? AND user_id = ?
+            ORDER BY id DESC LIMIT ?
+            """,
+            (namespace, str(user_id), limit or self.max_turns),
+        ).fetchall()
+        return [{"user": u, "agent": a, "timestamp": t} for u, a, t in reversed(rows)]
+
+    def append_many(self, turns):
+        for turn in turns:
+            self.append(turn["namespace"], turn["user_id"], turn["user"], turn["agent"], turn["timestamp"])
+
+    def summary(self, namespace, user_id):
+        """{"text", "covered_through"} for the user's rolling summary, or None."""
+        row = self._conn().execute(
+            "SELECT summary, covered_through FROM summaries WHERE namespace = ? AND user_id = ?",
+            (namespace, str(user_id)),
+        ).fetchone()
+        return {"text": row[0], "covered_through": row[1]} if row else None
+
+    def set_summary(self, namespace, user_id, text, covered_through):
+        self._conn().execute(
+            """
+            INSERT INTO summaries (namespace, user_id, summary, covered_through, updated_at)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (namespace, user_id) DO UPDATE
+            SET summary = excluded.summary, covered_through = excluded.covered_through, updated_at = excluded.updated_at
+            """,
+            (namespace, str(user_id), text, covered_through, datetime.utcnow().isoformat()),
+        )
+
+    def clear(self, namespace, user_id):
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM turns WHERE namespace = ? AND user_id = ?", (namespace, str(user_id)))
+            conn.execute("DELETE FROM summaries WHERE namespace = ? AND user_id = ?", (namespace, str(user_id)))
+
+
+class PostgresTurnStore:
+    """Bounded per-user turn history in the shared conversation_turns table."""
+
+    TRIM_SQL = """
+        DELETE FROM conversation_turns
+        WHERE namespace = %s AND user_id = %s AND id <= (
+            SELECT id FROM conversation_turns WHERE namespace = %s AND user_id = %s
+            ORDER BY id DESC LIMIT 1 OFFSET %s
+        )
+    """
+
+    def __init__(self, max_turns=MEMORY_MAX_TURNS):
+        self.max_turns = max_turns
+
+    def append(self, namespace, user_id, user_text, agent_text, created_at=None):
+        self.append_many([{
+            "namespace": namespace, "user_id": user_id, "user": user_text, "agent": agent_text,
+            "timestamp": created_at or datetime.utcnow().isoformat(),
+        }])
+
+    def append_many(self, turns):
+        """Insert a batch of turns in one statement, then trim each affected user."""
+        with db.connection() as conn, conn.cursor() as cursor:
+            psycopg2_extras.execute_values(
+                cursor,
+                "INSERT INTO conversation_turns (namespace, user_id, user_text, agent_text, created_at) VALUES %s",
+                [(t["namespace"], str(t["user_id"]), t["user"], t["agent"], t["timestamp"]) for t in turns],
+            )
+            for namespace, user_id in sorted({(t["namespace"], str(t["user_id"])) for t in turns}):
+                cursor.execute(self.TRIM_SQL, (namespace, user_id, namespace, user_id, self.max_turns))
+
+    def recent(self, namespace, user_id, limit=None):
+        with db.connection() as conn, conn.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT user_text, agent_text, created_at FROM conversation_turns
+                WHERE namespace = %s AND user_id = %s
+                ORDER BY id DESC LIMIT %s
+                """,
+                (namespace, str(user_id), limit or self.max_turns),
+            )
+            rows = cursor.fetchall()
+        return [{"user": u, "agent": a, "timestamp": t.isoformat()} for u, a, t in reversed(rows)]
+
+    def summary(self, namespace, user_id):
+        with db.connection() as conn, conn.cursor() as cursor:
+            cursor.execute(
+                "SELECT summary, covered_through FROM conversation_summaries WHERE namespace = %s AND user_id = %s",
+                (namespace, str(user_id)),
+            )
+            row = cursor.fetchone()
+        return {"text": row[0], "covered_through": row[1]} if row else None
+
+    def set_summary(self, namespace, user_id, text, covered_through):
+        with db.connection() as conn, conn.cursor() as cursor:
+            cursor.execute(
+                """
+                INSERT INTO conversation_summaries (namespace, user_id, summary, covered_through)
+                VALUES (%s, %s, %s, %s)
+                ON CONFLICT (namespace, user_id) DO UPDATE
+                SET summary = EXCLUDED.summary, covered_through = EXCLUDED.covered_through, updated_at = now()
+                """,
+                (namespace, str(user_id), text, covered_through),
+            )
+
+    def clear(self, namespace, user_id):
+        with db.connection() as conn, conn.cursor() as cursor:
+            cursor.execute(
+                "DELETE FROM conversation_turns WHERE namespace = %s AND user_id = %s", (namespace, str(user_id))
+            )
+            cursor.execute(
+                "DELETE FROM conversation_summaries WHERE namespace = %s AND user_id = %s", (namespace, str(user_id))
+            )
+
+
+class CachedMemory:
+    """Read-through cache and write-behind queue in front of a turn store.
+
+    Reads are served from the cache when the user's history was loaded recently.
+    Appends update the cache immediately, so later reads in this container see
+    them, and are persisted by a background thread. Turns still queued when the
+    container is frozen are written once it thaws, or at interpreter exit.
+    """
+
+    def __init__(self, backend, write_behind=MEMORY_WRITE_BEHIND):
+        self.backend = backend
+        self.max_turns = backend.max_turns
+        self.write_behind = write_behind
+        self._cache = LRUCache(MEMORY_CACHE_USERS, MEMORY_CACHE_TTL)
+        self._summaries = LRUCache(MEMORY_CACHE_USERS, MEMORY_CACHE_TTL)
+        self._queue = queue.Queue()
+        self._pending = {}  # (namespace, user_id) -> turns queued but not yet persisted
+        self._pending_lock = threading.Lock()
+        self._writer = None
+        self._writer_lock = threading.Lock()
+
+    def _history(self, namespace, user_id):
+        key = (namespace, str(user_id))
+        turns = self._cache.get(key)
+        if turns is not None:
+            metrics.incr("memory.cache_hit")
+            return turns
+        metrics.incr("memory.cache_miss")
+        with metrics.timer("memory.load"):
+            turns = self.backend.recent(namespace, user_id, self.max_turns)
+        with self._pending_lock:
+            pending = [{k: t[k] for k in ("user", "agent", "timestamp")} for t in self._pending.get(key, [])]
+        turns = (turns + pending)[-self.max_turns:]
+        self._cache.set(key, turns)
+        return turns
+
+    def recent(self, namespace, user_id, limit=None):
+        turns = self._history(namespace, user_id)
+        return list(turns[-(limit or self.max_turns):])
+
+    def append(self, namespace, user_id, user_text, agent_text, created_at=None):
+        turn = {
+            "namespace": namespace, "user_id": str(user_id), "user": user_text, "agent": agent_text,
+            "timestamp": created_at or datetime.utcnow().isoformat(),
+        }
+        history = self._history(namespace, user_id) + [{k: turn[k] for k in ("user", "agent", "timestamp")}]
+        self._cache.set((namespace, str(user_id)), history[-self.max_turns:])
+        if not self.write_behind:
+            self.backend.append_many([turn])
+            return
+        with self._pending_lock:
+            self._pending.setdefault((namespace, str(user_id)), []).append(turn)
+        self._ensure_writer()
+        self._queue.put((time.monotonic(), turn))
+
+    def summary(self, namespace, user_id):
+        key = (namespace, str(user_id))
+        cached = self._summaries.get(key)
+        if cached is not None:
+            return cached or None
+        summary = self.backend.summary(namespace, user_id)
+        self._summaries.set(key, summary or {})  # {} caches "no summary yet"
+        return summary
+
+    def set_summary(self, namespace, user_id, text, covered_through):
+        """Write the summary through to the backend; summaries are rewritten off the response path."""
+        self.backend.set_summary(namespace, user_id, text, covered_through)
+        self._summaries.set((namespace, str(user_id)), {"text": text, "covered_through": covered_through})
+
+    def clear(self, namespace, user_id):
+        self.flush()
+        self._cache.delete((namespace, str(user_id)))
+        self._summaries.delete((namespace, str(user_id)))
+        self.backend.clear(namespace, user_id)
+
+    # ---- write-behind ----
+
+    def _ensure_writer(self):
+        if self._writer is None or not self._writer.is_alive():
+            with self._writer_lock:
+                if self._writer is None or not self._writer.is_alive():
+                    self._writer = threading.Thread(target=self._drain, name="memory-writer", daemon=True)
+                    self._writer.start()
+
+    def _drain(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < 50:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._write(batch)
+            for _ in batch:
+                self._queue.task_done()
+
+    def _forget_pending(self, batch):
+        with self._pending_lock:
+            for _, turn in batch:
+                key = (turn["namespace"], turn["user_id"])
+                remaining = [t for t in self._pending.get(key, []) if t is not turn]
+                if remaining:
+                    self._pending[key] = remaining
+                else:
+                    self._pending.pop(key, None)
+
+    def _write(self, batch, attempts=3):
+        for attempt in range(attempts):
+            try:
+                self.backend.append_many([turn for _, turn in batch])
+                self._forget_pending(batch)
+                now = time.monotonic()
+                for enqueued_at, _ in batch:
+                    metrics.observe("memory.write_lag", (now - enqueued_at) * 1000)
+                metrics.incr("memory.persisted", len(batch))
+                return
+            except Exception as e:
+                print(f"Memory write failed (attempt {attempt + 1}): {e}")
+                time.sleep(0.2 * 2 ** attempt)
+        self._forget_pending(batch)
+        metrics.incr("memory.dropped", len(batch))
+
+    def flush(self, timeout=5.0):
+        """Block until queued turns are persisted (or timeout); True when drained."""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return not self._queue.unfinished_tasks
+
+    def stats(self):
+        hits = metrics.counter("memory.cache_hit")
+        misses = metrics.counter("memory.cache_miss")
+        lag = metrics.snapshot("memory.write_lag").get("memory.write_lag", {})
+        return {
+            "backend": type(self.backend).__name__,
+            "cache_hit_rate": round(hits / (hits + misses), 3) if hits + misses else 0.0,
+            "pending_writes": self._queue.unfinished_tasks,
+            "persisted": metrics.counter("memory.persisted"),
+            "dropped": metrics.counter("memory.dropped"),
+            "write_lag_p50_ms": lag.get("p50_ms"),
+            "write_lag_p99_ms": lag.get("p99_ms"),
+        }
+
+
+def format_turns(turns, agent_label="Assistant"):
+    """Render turns as a "User: ... / Assistant: ..." transcript for prompts."""
+    return "".join(f"\nUser: {t['user']}\n{agent_label}: {t['agent']}\n" for t in turns)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """The container-wide memory store, created on first use."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                backend = PostgresTurnStore() if MEMORY_BACKEND == "postgres" else SqliteTurnStore()
+                _store = CachedMemory(backend)
+                atexit.register(_store.flush)
+    return _store
+
+
+def flush(timeout=MEMORY_FLUSH_TIMEOUT):
+    """Wait up to timeout for queued turns to be persisted; call after the reply was delivered.
+
+    Returns at once when nothing is queued or appends are already synchronous.
+    """
+    if _store is None or not _store.write_behind:
+        return True
+    drained = _store.flush(timeout)
+    if not drained:
+        metrics.incr("memory.flush_timeout")
+        print(json.dumps({"memory_flush": {"timed_out": True, "pending_writes": _store._queue.unfinished_tasks}}))
+    return drained
+
+
+def log_stats():
+    if _store is not None:
+        metrics.log_stats("memory", _store.stats)
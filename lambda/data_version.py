@@ -0,0 +1,27 @@
+"""Per-user data versions for invalidating cached answers.
+
+Every write to a user's transactions or goals increments the user's version in
+the same database transaction. Readers put the version into their cache keys,
+so the first read after a write misses and recomputes, while reads between
+writes can be served from cache.
+"""
+import db
+
+BUMP_SQL = """
+    INSERT INTO user_data_version (user_id, version) VALUES (%s, 1)
+    ON CONFLICT (user_id) DO UPDATE SET version = user_data_version.version + 1, updated_at = now()
+"""
+
+
+def bump(cursor, user_ids):
+    """Increment the version of each user (sorted, to keep lock order stable)."""
+    for user_id in sorted({str(u) for u in user_ids}):
+        cursor.execute(BUMP_SQL, (user_id,))
+
+
+def current(user_id):
+    """The user's data version; 0 before their first write."""
+    with db.connection() as conn, conn.cursor() as cursor:
+        cursor.execute("SELECT version FROM user_data_version WHERE user_id = %s", (str(user_id),))
+        row = cursor.fetchone()
+    return row[0] if row else 0
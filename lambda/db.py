@@ -0,0 +1,158 @@
+"""Shared PostgreSQL access for all handlers.
+
+Connections are created lazily and kept alive across warm invocations in a small
+per-container pool. Idle connections are health-checked before reuse and replaced
+when the socket has gone stale. Set DB_POOL_MODE=external when connecting through
+RDS Proxy / PgBouncer (DB_PROXY_HOST): connections are then released back to the
+external pooler after every use instead of being held by the container.
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import metrics
+from startup import lazy_import
+
+psycopg2 = lazy_import("psycopg2")
+
+# Connection settings come only from the environment; DB_HOST and DB_PASSWORD (or DB_PASS) are required
+DB_HOST = os.environ.get("DB_HOST")
+DB_PORT = os.environ.get("DB_PORT", "5432")
+DB_NAME = os.environ.get("DB_NAME", "finprod")
+DB_USER = os.environ.get("DB_USER", "postgres")
+DB_PASSWORD = os.environ.get("DB_PASSWORD") or os.environ.get("DB_PASS")
+
+DB_POOL_MODE = os.environ.get("DB_POOL_MODE", "local")  # "local" or "external"
+DB_PROXY_HOST = os.environ.get("DB_PROXY_HOST")
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "2"))  # idle connections kept per container
+DB_HEALTHCHECK_AFTER = float(os.environ.get("DB_HEALTHCHECK_AFTER", "30"))  # seconds idle before SELECT 1
+DB_CONNECT_TIMEOUT = int(os.environ.get("DB_CONNECT_TIMEOUT", "5"))
+
+# Owner of rows written before per-user scoping, and of events without a user
+DEFAULT_USER_ID = "default_user"
+
+_lock = threading.Lock()
+_idle = []  # [(connection, last_used_monotonic)]
+
+
+def _connect():
+    host = DB_PROXY_HOST if DB_POOL_MODE == "external" and DB_PROXY_HOST else DB_HOST
+    missing = [name for name, value in (("DB_HOST", host), ("DB_PASSWORD", DB_PASSWORD)) if not value]
+    if missing:
+        raise RuntimeError(f"Database is not configured: set {' and '.join(missing)}")
+    with metrics.timer("db.connect"):
+        conn = psycopg2.connect(
+            host=host,
+            port=DB_PORT,
+            database=DB_NAME,
+            user=DB_USER,
+            password=DB_PASSWORD,
+            connect_timeout=DB_CONNECT_TIMEOUT,
+            keepalives=1,
+            keepalives_idle=30,
+            keepalives_interval=10,
+            keepalives_count=3,
+        )
+    metrics.incr("db.created")
+    return conn
+
+
+def _is_healthy(conn, idle_for):
+    """Cheap liveness check; only pings the server after a long idle period."""
+    if conn.closed:
+        return False
+    if idle_for < DB_HEALTHCHECK_AFTER:
+        return True
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT 1")
+        conn.rollback()
+        return True
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        return False
+
+
+def _discard(conn):
+    try:
+        conn.close()
+    except Exception:
+        pass
+
+
+def acquire():
+    """Take a healthy connection from the pool, or open a new one."""
+    while True:
+        with _lock:
+            if not _idle:
+                break
+            conn, last_used = _idle.pop()
+        if _is_healthy(conn, time.monotonic() - last_used):
+            metrics.incr("db.reused")
+            return conn
+        metrics.incr("db.stale")
+        _discard(conn)
+    return _connect()
+
+
+def release(conn):
+    """Return a connection to the pool (or close it in external-pooler mode)."""
+    if conn.closed:
+        return
+    if DB_POOL_MODE == "external":
+        _discard(conn)
+        return
+    with _lock:
+        if len(_idle) < DB_POOL_SIZE:
+            _idle.append((conn, time.monotonic()))
+            return
+    _discard(conn)
+
+
+@contextmanager
+def connection():
+    """Yield a pooled connection; commit on success, roll back on error.
+
+    A connection whose socket broke while in use is dropped rather than pooled,
+    so the next caller reconnects instead of failing on the same stale socket.
+    """
+    conn = acquire()
+    try:
+        yield conn
+        conn.commit()
+    except Exception as e:
+        if isinstance(e, (psycopg2.OperationalError, psycopg2.InterfaceError)):
+            _discard(conn)
+        else:
+            try:
+                conn.rollback()
+            except Exception:
+                _discard(conn)
+        raise
+    finally:
+        release(conn)
+        metrics.log_stats("db_pool", pool_stats)
+
+
+def pool_stats():
+    """How often connections were reused versus created in this container."""
+    created = metrics.counter("db.created")
+    reused = metrics.counter("db.reused")
+    total = created + reused
+    return {
+        "mode": DB_POOL_MODE,
+        "created": created,
+        "reused": reused,
+        "stale": metrics.counter("db.stale"),
+        "reuse_ratio": round(reused / total, 3) if total else 0.0,
+        "idle": len(_idle),
+    }
+
+
+def close_all():
+    """Close every idle connection (used by scripts and tests)."""
+    with _lock:
+        conns = [conn for conn, _ in _idle]
+        _idle.clear()
+    for conn in conns:
+        _discard(conn)
@@ -0,0 +1,263 @@
+"""Field definitions shared by the router and the extraction handlers.
+
+Single-message extraction is schema constrained. The model must answer
+through a Bedrock tool whose input schema lists the fields, types and
+category enums. The tool input is then checked by a typed validator
+(`clean_transaction`, `clean_goal`). Output that fails is sent back once with
+the reason for a targeted repair, and anything still invalid is reported
+instead of being stored. Batch extraction (bulk imports) uses the same
+schema, one array item per numbered input line, and repairs only the lines
+that were rejected or left out. Outcomes (`extraction.<kind>.success`,
+`.repaired`, `.failed`) and tokens per extraction (`extraction.<kind>.tokens`)
+are recorded per item.
+"""
+import json
+from datetime import date
+
+import metrics
+import model_registry
+
+TRANSACTION_FIELDS = ["amount", "transaction_type", "transaction_date", "category"]
+TRANSACTION_CATEGORIES = ["salary", "grocery", "entertainment", "utility", "restaurant", "transport", "other"]
+
+GOAL_FIELDS = ["goal_name", "target_amount", "target_date", "category"]
+GOAL_CATEGORIES = ["savings", "investment", "loan_repayment", "education", "travel", "health", "emergency", "other"]
+
+TRANSACTION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "amount": {"type": "number", "description": "Amount without currency symbols"},
+        "transaction_type": {"type": "string", "enum": ["debit", "credit"]},
+        "transaction_date": {"type": "string", "description": "YYYY-MM-DD"},
+        "category": {"type": "string", "enum": TRANSACTION_CATEGORIES},
+    },
+    "required": TRANSACTION_FIELDS,
+}
+
+GOAL_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "goal_name": {"type": "string", "description": "Short title"},
+        "target_amount": {"type": "number", "description": "Amount without currency symbols"},
+        "target_date": {"type": "string", "description": "YYYY-MM-DD"},
+        "category": {"type": "string", "enum": GOAL_CATEGORIES},
+    },
+    "required": GOAL_FIELDS,
+}
+
+
+def parse_model_json(raw_output):
+    """Parse a JSON object from model output, tolerating ```json fences."""
+    cleaned_output = raw_output.strip().strip("```json").strip("```").strip()
+    return json.loads(cleaned_output)
+
+
+def is_complete(data, fields):
+    """True when every field is present and non-empty, i.e. safe to insert as is."""
+    return isinstance(data, dict) and all(data.get(field) not in (None, "") for field in fields)
+
+
+def _amount(value):
+    """Positive amount from a number or a string like "₹1,200"; None when unusable."""
+    try:
+        amount = float(str(value).replace(",", "").replace("₹", "").strip())
+    except (TypeError, ValueError):
+        return None
+    return round(amount, 2) if amount > 0 else None
+
+
+def _iso_date(value):
+    try:
+        return date.fromisoformat(str(value)[:10]).isoformat()
+    except ValueError:
+        return None
+
+
+def clean_transaction(data):
+    """Coerce extracted transaction fields to insertable types.
+
+    Returns (fields, None) on success or (None, reason) when a field is unusable.
+    Unknown categories become "other" rather than failing the row.
+    """
+    if not isinstance(data, dict):
+        return None, "not an object"
+    amount = _amount(data.get("amount"))
+    if amount is None:
+        return None, f"invalid amount: {data.get('amount')!r}"
+    transaction_type = str(data.get("transaction_type") or "").lower().strip()
+    if transaction_type not in ("debit", "credit"):
+        return None, f"invalid transaction_type: {data.get('transaction_type')!r}"
+    transaction_date = _iso_date(data.get("transaction_date"))
+    if transaction_date is None:
+        return None, f"invalid transaction_date: {data.get('transaction_date')!r}"
+    category = str(data.get("category") or "").lower().strip()
+    if category not in TRANSACTION_CATEGORIES:
+        category = "other"
+    return {
+        "amount": amount,
+        "transaction_type": transaction_type,
+        "transaction_date": transaction_date,
+        "category": category,
+    }, None
+
+
+def clean_goal(data):
+    """Coerce extracted goal fields to insertable types; same contract as clean_transaction."""
+    if not isinstance(data, dict):
+        return None, "not an object"
+    goal_name = " ".join(str(data.get("goal_name") or "").split())[:100]
+    if not goal_name:
+        return None, "missing goal_name"
+    target_amount = _amount(data.get("target_amount"))
+    if target_amount is None:
+        return None, f"invalid target_amount: {data.get('target_amount')!r}"
+    target_date = _iso_date(data.get("target_date"))
+    if target_date is None:
+        return None, f"invalid target_date: {data.get('target_date')!r}"
+    category = str(data.get("category") or "").lower().strip()
+    if category not in GOAL_CATEGORIES:
+        category = "other"
+    return {
+        "goal_name": goal_name,
+        "target_amount": target_amount,
+        "target_date": target_date,
+        "category": category,
+    }, None
+
+
+# ---- Schema-constrained extraction ----
+
+def tool_config(name, description, schema):
+    """Bedrock toolConfig that makes the model answer by calling one tool."""
+    return {
+        "tools": [{"toolSpec": {"name": name, "description": description, "inputSchema": {"json": schema}}}],
+        "toolChoice": {"tool": {"name": name}},
+    }
+
+
+def tool_input(response, name):
+    """The named tool's input from a converse response; JSON in a text block is accepted too."""
+    content = response["output"]["message"]["content"]
+    for block in content:
+        if "toolUse" in block and block["toolUse"].get("name") == name:
+            return block["toolUse"]["input"]
+    text = "".join(block.get("text", "") for block in content)
+    try:
+        return parse_model_json(text)
+    except ValueError:
+        return None
+
+
+def _tokens(response):
+    usage = response.get("usage") or {}
+    return (usage.get("inputTokens") or 0) + (usage.get("outputTokens") or 0)
+
+
+def extract_structured(task, kind, prompt, schema, cleaner, description):
+    """Run a model_registry task constrained to `schema` and validate it with `cleaner`.
+
+    One repair call follows a failed validation. Returns (fields, None) or
+    (None, reason); raises BedrockUnavailable when the model cannot be called.
+    """
+    tool = f"record_{kind}"
+    config = {"toolConfig": tool_config(tool, description, schema)}
+    response = model_registry.converse(task, prompt, extra=config)
+    tokens = _tokens(response)
+    fields, error = cleaner(tool_input(response, tool))
+    if error:
+        metrics.incr(f"extraction.{kind}.repairs")
+        repair_prompt = f"""{prompt}
+
+A previous answer was rejected ({error}): {json.dumps(tool_input(response, tool))}
+Call {tool} again with every field corrected."""
+        response = model_registry.converse(task, repair_prompt, extra=config)
+        tokens += _tokens(response)
+        fields, error = cleaner(tool_input(response, tool))
+        if not error:
+            metrics.incr(f"extraction.{kind}.repaired")
+    metrics.incr(f"extraction.{kind}.{'failed' if error else 'success'}")
+    metrics.incr(f"extraction.{kind}.tokens", tokens)
+    return fields, error
+
+
+def batch_schema(schema):
+    """Tool input schema for many records at once: {"items": [schema + "line", ...]}."""
+    item = dict(
+        schema,
+        properties=dict(schema["properties"], line={"type": "integer", "description": "Input line number"}),
+        required=["line"] + schema["required"],
+    )
+    return {"type": "object", "properties": {"items": {"type": "array", "items": item}}, "required": ["items"]}
+
+
+def _batch_items(data):
+    """(line, item) pairs from a batch tool input; items without a usable line number are dropped."""
+    if isinstance(data, dict):
+        data = data.get("items", [data])
+    pairs = []
+    for item in data if isinstance(data, list) else []:
+        try:
+            pairs.append((int(item["line"]), item))
+        except (KeyError, TypeError, ValueError):
+            continue
+    return pairs
+
+
+def _clean_batch(response, tool, lines, cleaner, fields, errors):
+    for line, item in _batch_items(tool_input(response, tool)):
+        if line in lines and line not in fields:
+            cleaned, error = cleaner(item)
+            if error:
+                errors[line] = error
+            else:
+                fields[line] = cleaned
+                errors.pop(line, None)
+
+
+def extract_structured_batch(task, kind, prompt, lines, schema, cleaner, description, **overrides):
+    """Batch form of extract_structured for the numbered input `lines` listed in `prompt`.
+
+    One repair call covers every line that was rejected or left out. Returns
+    ({line: fields}, {line: reason}); raises BedrockUnavailable when the model
+    cannot be called.
+    """
+    tool = f"record_{kind}s"
+    config = {"toolConfig": tool_config(tool, description, batch_schema(schema))}
+    lines = set(lines)
+    fields, errors = {}, {}
+    response = model_registry.converse(task, prompt, extra=config, **overrides)
+    tokens = _tokens(response)
+    _clean_batch(response, tool, lines, cleaner, fields, errors)
+    retry = sorted(lines - set(fields))
+    if retry:
+        metrics.incr(f"extraction.{kind}.repairs")
+        reasons = "\n".join(f"- line {line}: {errors.get(line, 'missing from your answer')}" for line in retry)
+        repair_prompt = f"""{prompt}
+
+A previous answer rejected or left out these lines:
+{reasons}
+Call {tool} again with one corrected item for each of these lines only."""
+        response = model_registry.converse(task, repair_prompt, extra=config, **overrides)
+        tokens += _tokens(response)
+        _clean_batch(response, tool, set(retry), cleaner, fields, errors)
+        metrics.incr(f"extraction.{kind}.repaired", len(set(retry) & set(fields)))
+    for line in lines - set(fields):
+        errors.setdefault(line, "missing from model output")
+    metrics.incr(f"extraction.{kind}.success", len(fields))
+    metrics.incr(f"extraction.{kind}.failed", len(lines) - len(fields))
+    metrics.incr(f"extraction.{kind}.tokens", tokens)
+    return fields, errors
+
+
+def stats(kind):
+    """Success rate, repairs and tokens per extraction for one kind ("transaction" or "goal")."""
+    success = metrics.counter(f"extraction.{kind}.success")
+    failed = metrics.counter(f"extraction.{kind}.failed")
+    total = success + failed
+    return {
+        "extractions": total,
+        "success_rate": round(success / total, 3) if total else None,
+        "repairs": metrics.counter(f"extraction.{kind}.repairs"),
+        "repaired": metrics.counter(f"extraction.{kind}.repaired"),
+        "avg_tokens": round(metrics.counter(f"extraction.{kind}.tokens") / total, 1) if total else None,
+    }
@@ -0,0 +1,89 @@
+"""Local stand-ins for Bedrock and the Telegram Bot API.
+
+    import fakes
+    bedrock, bot = fakes.install(reply="You spent ₹1,200 this week.", token_delay=0.02)
+    ...  # run a handler
+    bot.calls  # [("sendMessage", {...}), ("editMessageText", {...}), ...]
+
+`install` registers the fake Bedrock client with aws_clients and routes
+telegram.call to the fake bot, so handlers run unchanged without AWS or network access.
+"""
+import time
+
+import aws_clients
+import telegram
+
+
+class FakeBedrock:
+    """Answers converse / converse_stream with a fixed reply, at a simulated speed."""
+
+    def __init__(self, reply="OK", first_token_delay=0.3, token_delay=0.02, chunk_words=2):
+        self.reply = reply
+        self.first_token_delay = first_token_delay
+        self.token_delay = token_delay
+        self.chunk_words = chunk_words
+        self.requests = []
+
+    def _usage(self, kwargs):
+        text = kwargs["messages"][-1]["content"][0].get("text", "")
+        return {"inputTokens": len(text) // 4, "outputTokens": len(self.reply) // 4,
+                "totalTokens": (len(text) + len(self.reply)) // 4}
+
+    def _chunks(self):
+        words = self.reply.split(" ")
+        for i in range(0, len(words), self.chunk_words):
+            yield " ".join(words[i:i + self.chunk_words]) + (" " if i + self.chunk_words < len(words) else "")
+
+    def converse(self, **kwargs):
+        self.requests.append(("converse", kwargs))
+        time.sleep(self.first_token_delay + self.token_delay * len(list(self._chunks())))
+        return {
+            "output": {"message": {"role": "assistant", "content": [{"text": self.reply}]}},
+            "stopReason": "end_turn",
+            "usage": self._usage(kwargs),
+            "metrics": {"latencyMs": 0},
+        }
+
+    def converse_stream(self, **kwargs):
+        self.requests.append(("converse_stream", kwargs))
+
+        def events():
+            yield {"messageStart": {"role": "assistant"}}
+            time.sleep(self.first_token_delay)
+            for chunk in self._chunks():
+                yield {"contentBlockDelta": {"delta": {"text": chunk}, "contentBlockIndex": 0}}
+                time.sleep(self.token_delay)
+            yield {"contentBlockStop": {"contentBlockIndex": 0}}
+            yield {"messageStop": {"stopReason": "end_turn"}}
+            yield {"metadata": {"usage": self._usage(kwargs), "metrics": {"latencyMs": 0}}}
+
+        return {"stream": events()}
+
+
+class FakeTelegram:
+    """Records Bot API calls and returns minimal results."""
+
+    def __init__(self):
+        self.calls = []
+        self.messages = {}  # message_id -> current text
+        self._next_id = 1
+
+    def call(self, method, **params):
+        self.calls.append((method, params))
+        if method == "sendMessage":
+            message_id, self._next_id = self._next_id, self._next_id + 1
+            self.messages[message_id] = params.get("text")
+            return {"message_id": message_id, "chat": {"id": params.get("chat_id")}, "text": params.get("text")}
+        if method == "editMessageText":
+            self.messages[params["message_id"]] = params.get("text")
+            return {"message_id": params["message_id"], "text": params.get("text")}
+        return True
+
+
+def install(bedrock=None, bot=None, **bedrock_options):
+    """Use fakes for the shared Bedrock client and telegram.call; returns (bedrock, bot)."""
+    bedrock = bedrock or FakeBedrock(**bedrock_options)
+    bot = bot or FakeTelegram()
+    aws_clients.set_client("bedrock-runtime", bedrock, aws_clients.BEDROCK_REGION)
+    telegram.call = bot.call
+    return bedrock, bot
@@ -1,94 +1,120 @@
+import startup
 import json
-import boto3
-import psycopg2
-from psycopg2 import sql
 import datetime
+import time
 
-current_date = datetime.date.today()
-def lambda_handler(event, context):
-    # Step 1: Extract message
-    message = event.get('message', '')
-    if not message:
-        return {"statusCode": 400, "body": "No message found"}
+import bedrock_gateway
+import bulk_import
+import db
+import extraction
+import metrics
+import transaction_parser
+import transaction_store
 
-    # Step 2: Prepare Bedrock prompt
-    prompt = f"""You are an intelligent financial transaction parser.
-Extract structured details from the transaction message and classify it into a category.
-
-Return a JSON object with the following keys:
-- amount: the transaction amount as a number (without currency symbols)
-- transaction_type: "debit" or "credit"
-- transaction_date: the date of the transaction in YYYY-MM-DD format
-- category: classify the transaction as one of ["salary", "grocery", "entertainment", "utility", "restaurant", "transport", "other"]
 
+def extract_with_bedrock(message):
+    """Ask Bedrock for the transaction fields: (fields, None) or (None, reason); raises if the call fails."""
+    current_date = datetime.date.today()
+    prompt = f"""You are an intelligent financial transaction parser.
+Record the transaction in the message below with the record_transaction tool.
 
 Current date = {current_date}
-Note if transaction date is not mentioned get it as current_date. If mentioned today or yesterday or so get the date accordingly as per the logic today means current date yesteray mean current date -1
+If the transaction date is not mentioned use the current date; today means current date, yesterday means current date - 1.
 Here is the transaction message:
 {message}"""
 
-    # Step 3: Initialize Bedrock client
-    client = boto3.client('bedrock-runtime', region_name='eu-north-1')
+    return extraction.extract_structured(
+        "extract_transaction", "transaction", prompt, extraction.TRANSACTION_SCHEMA,
+        extraction.clean_transaction, "Store one bank transaction.",
+    )
 
-    # Step 4: Prepare messages for Bedrock
-    messages = [
-        {
-            "role": "user",
-            "content": [{"text": prompt}]
+
+def extraction_path_stats():
+    """Messages and latency per extraction path: prefilled by the router, local parser, or Bedrock."""
+    timings = metrics.snapshot("extraction.")
+    return {
+        path: {
+            "messages": metrics.counter(f"extraction.path.{path}"),
+            "p50_ms": timings.get(f"extraction.{path}", {}).get("p50_ms"),
         }
-    ]
+        for path in ("prefilled", "fast", "llm")
+    }
 
-    # Step 5: Call Bedrock
-    try:
-        response = client.converse(
-            modelId="amazon.nova-lite-v1:0",
-            messages=messages,
-            inferenceConfig={
-                "maxTokens": 300,
-                "temperature": 0.7,
-                "topP": 0.9
-            }
+
+def bulk_response(report):
+    """Summarize a bulk import for the chat reply, keeping per-row errors in the body."""
+    if report.get("error"):
+        return {"statusCode": 400, "body": json.dumps({"message": report["error"]})}
+    summary = f"Imported {report['inserted']} of {report['records']} transactions."
+    if report["failed"]:
+        summary += " Could not import: " + "; ".join(
+            f"line {e['line']} ({e['error']})" for e in report["failed"][:10]
         )
-    except Exception as e:
-        return {"statusCode": 500, "body": json.dumps({"error": "Bedrock call failed", "details": str(e)})}
+        if len(report["failed"]) > 10:
+            summary += f" and {len(report['failed']) - 10} more"
+    return {
+        "statusCode": 200,
+        "body": json.dumps({"message": summary, "report": report})
+    }
 
-    # Step 6: Extract model output
-    try:
-        raw_output = response["output"]["message"]["content"][0]["text"]
-        extracted_text = raw_output.strip().strip("```json").strip("```").strip()
-        extracted_data = json.loads(extracted_text)
-    except Exception:
-        extracted_data = {"error": "Model did not return valid JSON", "raw": raw_output}
 
-    # Step 7: Write to PostgreSQL
+def lambda_handler(event, context):
+    startup.report_once()
+    # Step 1: Extract message
+    message = event.get('message', '')
+    user_id = str(event.get('user_id') or db.DEFAULT_USER_ID)
+    csv_text = event.get('csv')
+    if not message and not csv_text:
+        return {"statusCode": 400, "body": "No message found"}
+
+    # Uploaded statements and multi-line pastes go through bulk import
+    if csv_text or "\n" in message.strip():
+        try:
+            report = bulk_import.import_text(csv_text or message, user_id)
+        except Exception as e:
+            return {"statusCode": 500, "body": json.dumps({"error": "Bulk import failed", "details": str(e)})}
+        return bulk_response(report)
+
+    # Step 2: Use fields already extracted by the router, then the local parser, else ask Bedrock
+    started = time.perf_counter()
+    extracted_data, error = extraction.clean_transaction(event.get('extracted'))
+    if extracted_data is not None:
+        path = "prefilled"
+    else:
+        extracted_data = transaction_parser.parse_transaction(message)
+        path = "fast"
+    if extracted_data is None:
+        path = "llm"
+        try:
+            extracted_data, error = extract_with_bedrock(message)
+        except bedrock_gateway.BedrockUnavailable as e:
+            return {"statusCode": 503, "body": json.dumps({
+                "message": "I can't read that transaction right now. Please try again shortly, "
+                           "or write it like 'spent 200 on groceries today'.",
+                "details": str(e),
+            })}
+        except Exception as e:
+            return {"statusCode": 500, "body": json.dumps({"error": "Bedrock call failed", "details": str(e)})}
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    metrics.incr(f"extraction.path.{path}")
+    metrics.observe(f"extraction.{path}", elapsed_ms)
+    metrics.log_stats("extraction_paths", extraction_path_stats)
+    if path == "llm":
+        metrics.log_stats("extraction", lambda: extraction.stats("transaction"))
+    if extracted_data is None:
+        return {"statusCode": 422, "body": json.dumps({
+            "message": "I couldn't read the amount, type or date of that transaction. "
+                       "Could you write it like 'spent 200 on groceries today'?",
+            "details": error,
+        })}
+
+    # Step 3: Write to PostgreSQL
     try:
-        conn = psycopg2.connect(
-            host="finprod.cvcamc60mtim.eu-north-1.rds.amazonaws.com",
-            port="5432",
-            database="finprod",
-            user="postgres",
-            password="Siddhesh"
-        )
-        cursor = conn.cursor()
-
-        # Insert parsed record
-        cursor.execute(
-            sql.SQL("""
-                INSERT INTO transactions (amount, transaction_type, transaction_date, category, raw_message)
-                VALUES (%s, %s, %s, %s, %s)
-            """),
-            (
-                extracted_data.get("amount"),
-                extracted_data.get("transaction_type"),
-                extracted_data.get("transaction_date"),
-                extracted_data.get("category"),
-                message
+        with db.connection() as conn, conn.cursor() as cursor:
+            # Insert parsed record
+            transaction_store.insert_transactions(
+                cursor, [dict(extracted_data, user_id=user_id, raw_message=message)]
             )
-        )
-
-        conn.commit()
-        cursor.close()
-        conn.close()
 
     except Exception as e:
         return {
@@ -100,7 +126,7 @@ Here is the transaction message:
             })
         }
 
-    # Step 8: Return final result
+    # Step 4: Return final result
     return {
         "statusCode": 200,
         "body": json.dumps({
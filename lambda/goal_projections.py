@@ -0,0 +1,247 @@
+"""Goal progress and projections, computed for many goals at once with NumPy.
+
+Transactions are not linked to goals, so a user's monthly net savings
+(earned minus spent, from the daily_spending rollup) count toward the goals
+that are open that month. Goals are open from the month they were created
+through the month they are due. Each month's savings are split between
+open goals in proportion to their target amounts. From that, for every goal:
+
+- saved:               savings counted toward it so far (0 to target)
+- monthly_rate:        its share of the average net savings of the last GOAL_RATE_MONTHS months
+- required_monthly:    what it needs per month to be reached by its target date
+- projected_completion: when it is reached at monthly_rate (None if never)
+- on_track / status:   "reached", "on_track", "behind" or "overdue"
+
+All goals and months are held in (goals x months) arrays, so one pass covers
+every goal of every user loaded. Results are cached per user under the user's
+data version (see data_version.py) and the day. A new transaction or goal
+bumps the version, and only that user is recomputed on the next read. The
+scheduled `lambda_handler` precomputes every user in one batch.
+"""
+import startup
+import json
+import os
+import re
+from datetime import date, timedelta
+
+import data_version
+import db
+import metrics
+from cache import TieredCache, make_store, normalize_text
+from startup import lazy_import
+
+np = lazy_import("numpy")
+
+GOAL_RATE_MONTHS = int(os.environ.get("GOAL_RATE_MONTHS", "3"))
+
+DAYS_PER_MONTH = 30.44
+MAX_PROJECTION_DAYS = 100 * 365
+
+projection_cache = TieredCache(
+    "goal_projections",
+    maxsize=int(os.environ.get("GOAL_PROJECTION_CACHE_SIZE", "1024")),
+    ttl=int(os.environ.get("GOAL_PROJECTION_TTL", "86400")),
+    store=make_store(os.environ.get("GOAL_PROJECTION_STORE"), "goal_projections"),
+)
+
+GOAL_QUESTION = re.compile(
+    r"\bgoals?\b.*\b(how far|progress|on track|behind|when|reach|saved|left|remaining|need)\b"
+    r"|\b(how far|progress|on track|behind|when will i reach|how much more)\b.*\bgoals?\b"
+)
+
+
+def month_index(day):
+    return day.year * 12 + day.month - 1
+
+
+def month_start(index):
+    return date(index // 12, index % 12 + 1, 1)
+
+
+# ---------- Loading ----------
+
+def load(cursor, user_ids=None, today=None):
+    """Goal rows and monthly net savings for the given users (every user when None)."""
+    today = today or date.today()
+    user_filter, params = ("WHERE user_id = ANY(%s)", [list(user_ids)]) if user_ids is not None else ("", [])
+    cursor.execute(f"""
+        SELECT id, user_id, goal_name, target_amount, target_date, category, created_at::date
+        FROM goal {user_filter}
+        ORDER BY user_id, id
+    """, params)
+    goals = cursor.fetchall()
+    if not goals:
+        return goals, []
+
+    first = min(min(month_index(row[6] or today) for row in goals), month_index(today) - GOAL_RATE_MONTHS + 1)
+    scope = "AND user_id = ANY(%s)" if user_ids is not None else ""
+    cursor.execute(f"""
+        SELECT user_id, date_trunc('month', day)::date, SUM(earned) - SUM(spent)
+        FROM daily_spending
+        WHERE day >= %s {scope}
+        GROUP BY 1, 2
+    """, [month_start(first)] + params)
+    return goals, cursor.fetchall()
+
+
+# ---------- Projection ----------
+
+def project(goals, monthly_net, today=None):
+    """{user_id: [projection per goal]} for goal rows and (user_id, month, net) rows, vectorized over goals."""
+    today = today or date.today()
+    if not goals:
+        return {}
+    users = sorted({str(row[1]) for row in goals})
+    user_pos = {user_id: i for i, user_id in enumerate(users)}
+    current = month_index(today)
+    first = min(
+        [month_index(row[6] or today) for row in goals]
+        + [month_index(row[1]) for row in monthly_net]
+        + [current - GOAL_RATE_MONTHS + 1]
+    )
+    months = current - first + 1
+
+    net = np.zeros((len(users), months))
+    for user_id, month, amount in monthly_net:
+        if str(user_id) in user_pos and first <= month_index(month) <= current:
+            net[user_pos[str(user_id)], month_index(month) - first] = float(amount or 0)
+
+    owner = np.array([user_pos[str(row[1])] for row in goals])
+    target = np.array([float(row[3] or 0) for row in goals])
+    created = np.array([month_index(row[6] or today) - first for row in goals])
+    undated = np.array([row[4] is None for row in goals])
+    due = np.array([months + 1200 if row[4] is None else month_index(row[4]) - first for row in goals])
+    days_left = np.array([np.inf if row[4] is None else float((row[4] - today).days) for row in goals])
+
+    # Savings split between the goals open each month, weighted by target
+    month_numbers = np.arange(months)
+    open_goals = (month_numbers >= created[:, None]) & (month_numbers <= due[:, None])
+    weight = open_goals * target[:, None]
+    per_user = np.zeros((len(users), months))
+    np.add.at(per_user, owner, weight)
+    share = np.divide(weight, per_user[owner], out=np.zeros_like(weight), where=per_user[owner] > 0)
+
+    saved = np.clip((share * net[owner]).sum(axis=1), 0, target)
+    remaining = target - saved
+    recent_savings = np.maximum(net[:, -GOAL_RATE_MONTHS:].mean(axis=1), 0)
+    monthly_rate = recent_savings[owner] * share[:, -1]
+
+    months_left = days_left / DAYS_PER_MONTH
+    required_monthly = np.where(undated, np.nan, remaining / np.maximum(months_left, 1))
+    days_to_finish = np.divide(remaining * DAYS_PER_MONTH, monthly_rate,
+                               out=np.full_like(remaining, np.inf), where=monthly_rate > 0)
+    days_to_finish[remaining <= 0] = 0
+    reached = remaining <= 0
+    on_track = reached | (days_to_finish <= days_left)
+    status = np.where(reached, "reached", np.where(days_left < 0, "overdue", np.where(on_track, "on_track", "behind")))
+
+    result = {user_id: [] for user_id in users}
+    for i, row in enumerate(goals):
+        finish = days_to_finish[i]
+        result[str(row[1])].append({
+            "goal_id": row[0],
+            "goal_name": row[2],
+            "category": row[5],
+            "target_amount": round(float(target[i]), 2),
+            "target_date": row[4].isoformat() if row[4] else None,
+            "saved": round(float(saved[i]), 2),
+            "remaining": round(float(remaining[i]), 2),
+            "progress_pct": round(float(saved[i] / target[i] * 100), 1) if target[i] > 0 else 0.0,
+            "monthly_rate": round(float(monthly_rate[i]), 2),
+            "required_monthly": None if undated[i] else round(float(required_monthly[i]), 2),
+            "projected_completion": (today + timedelta(days=int(finish))).isoformat()
+            if finish <= MAX_PROJECTION_DAYS else None,
+            "on_track": bool(on_track[i]),
+            "status": str(status[i]),
+        })
+    metrics.incr("goal_projections.goals_computed", len(goals))
+    return result
+
+
+# ---------- Cached access ----------
+
+def _cache_key(user_id, version, today):
+    return f"{user_id}:{version}:{today.isoformat()}"
+
+
+def for_user(user_id):
+    """Projections for every goal of one user, recomputed only after the user's data changed."""
+    user_id = str(user_id)
+    today = date.today()
+    key = _cache_key(user_id, data_version.current(user_id), today)
+    cached = projection_cache.get(key)
+    if cached is not None:
+        return cached
+    with metrics.timer("goal_projections.user"):
+        with db.connection() as conn, conn.cursor() as cursor:
+            goals, monthly_net = load(cursor, [user_id], today)
+        projections = project(goals, monthly_net, today).get(user_id, [])
+    projection_cache.set(key, projections)
+    return projections
+
+
+def refresh_all():
+    """Compute every user's projections in one batch and cache them; returns the user count."""
+    today = date.today()
+    with db.connection() as conn, conn.cursor() as cursor:
+        goals, monthly_net = load(cursor, None, today)
+        cursor.execute("SELECT user_id, version FROM user_data_version")
+        versions = dict(cursor.fetchall())
+    with metrics.timer("goal_projections.batch"):
+        projections = project(goals, monthly_net, today)
+    for user_id, user_projections in projections.items():
+        projection_cache.set(_cache_key(user_id, versions.get(user_id, 0), today), user_projections)
+    return len(projections)
+
+
+def active(projections, limit=5):
+    """Goals not yet reached or past due, soonest target date first."""
+    open_goals = [p for p in projections if p["status"] in ("on_track", "behind")]
+    return sorted(open_goals, key=lambda p: p["target_date"] or "9999-12-31")[:limit]
+
+
+# ---------- Answers ----------
+
+def is_goal_question(text):
+    return bool(GOAL_QUESTION.search(normalize_text(text)))
+
+
+def match_goals(question, projections):
+    """Goals whose name shares a word with the question; every goal when none does."""
+    words = set(normalize_text(question).split()) - {"goal", "goals", "my", "the", "for", "savings"}
+    named = [p for p in projections if words & set(normalize_text(p["goal_name"]).split())]
+    return named or projections
+
+
+def describe(projection):
+    p = projection
+    text = f"{p['goal_name']}: saved ₹{p['saved']:,.0f} of ₹{p['target_amount']:,.0f} ({p['progress_pct']}%)"
+    if p["status"] == "reached":
+        return text + ", goal reached."
+    if p["target_date"]:
+        text += f", due {p['target_date']}"
+    if p["required_monthly"] is not None and p["status"] != "overdue":
+        text += f". Needs ₹{p['required_monthly']:,.0f}/month"
+    if p["monthly_rate"] > 0:
+        text += f"; at your recent ₹{p['monthly_rate']:,.0f}/month you'd reach it by {p['projected_completion'] or 'much later'}"
+    else:
+        text += "; no net savings recently to put toward it"
+    label = {"on_track": "on track", "behind": "behind schedule", "overdue": "past its target date"}[p["status"]]
+    return f"{text} ({label})."
+
+
+def answer(question, projections):
+    """Reply text for a goal progress question, or None when the user has no goals."""
+    goals = match_goals(question, projections)
+    if not goals:
+        return None
+    return "\n".join(describe(p) for p in goals)
+
+
+def lambda_handler(event, context):
+    """Scheduled batch precompute of every user's projections."""
+    startup.report_once()
+    users = refresh_all()
+    result = {"users": users, "timings": metrics.snapshot("goal_projections")}
+    print(json.dumps({"goal_projections": result}))
+    return {"statusCode": 200, "body": json.dumps(result)}
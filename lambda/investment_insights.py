@@ -0,0 +1,123 @@
+"""Investment answers built on a daily precomputed market brief.
+
+The market framing behind every investment answer only changes once a day, so
+it is generated once per market day as a brief: the scheduled `lambda_handler`
+(e.g. an EventBridge rule at INSIGHTS_ROLLOVER_HOUR) writes it, and the first
+investment message of the day generates it if the job has not run yet. Each
+question is then answered by a short "advise" call that tailors the brief to
+it. Answers are cached by normalized question ("Best SIP?" and "best sip" share
+one), so repeat questions need no model call at all.
+
+Brief and answers expire at the next market-day boundary: INSIGHTS_ROLLOVER_HOUR
+in the exchange's time zone (UTC+INSIGHTS_UTC_OFFSET_MINUTES, IST by default).
+Set INSIGHTS_STORE=postgres to share them across containers.
+"""
+import startup
+import json
+import os
+from datetime import datetime, timedelta, timezone
+
+import bedrock_gateway
+import metrics
+import model_registry
+import prompt_builder
+import streaming
+import telegram
+from cache import TieredCache, make_store, normalize_text
+
+INSIGHTS_UTC_OFFSET_MINUTES = int(os.environ.get("INSIGHTS_UTC_OFFSET_MINUTES", "330"))  # IST
+INSIGHTS_ROLLOVER_HOUR = int(os.environ.get("INSIGHTS_ROLLOVER_HOUR", "9"))  # just before NSE opens at 9:15
+
+UNAVAILABLE = "Investment suggestions are unavailable right now. Please try again in a few minutes."
+
+insights_cache = TieredCache(
+    "investment_insights",
+    maxsize=int(os.environ.get("INSIGHTS_CACHE_SIZE", "1024")),
+    ttl=86400,  # entries are written with the time left in the market day
+    store=make_store(os.environ.get("INSIGHTS_STORE"), "investment_insights"),
+)
+
+
+def _market_clock(now=None):
+    """`now` shifted so that the market-day boundary falls at midnight."""
+    now = now or datetime.now(timezone.utc)
+    return now + timedelta(minutes=INSIGHTS_UTC_OFFSET_MINUTES, hours=-INSIGHTS_ROLLOVER_HOUR)
+
+
+def market_day(now=None):
+    return _market_clock(now).date()
+
+
+def seconds_until_rollover(now=None):
+    clock = _market_clock(now)
+    next_day = datetime.combine(clock.date() + timedelta(days=1), datetime.min.time(), clock.tzinfo)
+    return max(int((next_day - clock).total_seconds()), 1)
+
+
+def daily_brief(refresh=False):
+    """Today's market brief, generated on first use or when `refresh` is set."""
+    day = market_day()
+    key = f"brief:{day}"
+    if not refresh:
+        brief = insights_cache.get(key)
+        if brief:
+            return brief
+
+    prompt = f"""You are an investment analyst writing the market brief for {day} for Indian retail investors.
+In at most 250 words of plain text cover:
+- the current market environment, inflation and interest-rate trends
+- the 5 best investment options across risk levels (e.g. index funds, mutual fund SIPs, debt funds, gold, large-cap stocks),
+  each with its risk level, typical horizon and the main reason it suits current conditions"""
+    response = model_registry.converse("insights_brief", prompt)
+    brief = model_registry.text(response).strip()
+    insights_cache.set(key, brief, ttl=seconds_until_rollover())
+    metrics.incr("insights.brief_generated")
+    return brief
+
+
+def _send(chat_id, text):
+    telegram.call("sendMessage", chat_id=chat_id, text=text[:streaming.TELEGRAM_MAX_CHARS])
+
+
+def answer(user_input, chat_id=None):
+    """Answer an investment question; when `chat_id` is given the reply is sent there and None is returned."""
+    key = f"answer:{market_day()}:{normalize_text(user_input)}"
+    cached = insights_cache.get(key)
+    if cached:
+        metrics.incr("insights.answer_cached")
+        if chat_id is None:
+            return cached
+        _send(chat_id, cached)
+        return None
+
+    try:
+        brief = daily_brief()
+    except bedrock_gateway.BedrockUnavailable as e:
+        print(f"Market brief unavailable: {e}")
+        if chat_id is None:
+            return UNAVAILABLE
+        _send(chat_id, UNAVAILABLE)
+        return None
+
+    prompt = f"""You are a financial advisor for an Indian investor. Answer the question using today's market brief.
+If it is a yes/no question, start with "Yes" or "No" and give the reason. At most 120 words.
+
+Market brief: {brief}
+
+Question: "{prompt_builder.truncate(user_input, 200)}"
+"""
+    metrics.incr("insights.answer_personalized")
+    text = streaming.converse_text("advise", prompt, chat_id=chat_id, fallback=lambda: UNAVAILABLE)
+    if text and text != UNAVAILABLE:
+        insights_cache.set(key, text, ttl=seconds_until_rollover())
+    metrics.log_stats("investment_insights", insights_cache.stats)
+    return None if chat_id is not None else text
+
+
+def lambda_handler(event, context):
+    """Scheduled precompute of the day's brief."""
+    startup.report_once()
+    brief = daily_brief(refresh=True)
+    result = {"market_day": str(market_day()), "chars": len(brief), "expires_in_s": seconds_until_rollover()}
+    print(json.dumps({"investment_insights": result}))
+    return {"statusCode": 200, "body": json.dumps(result)}
@@ -1,10 +1,39 @@
+import startup
 import json
-import boto3
-import psycopg2
+import os
 import re
+import time
 from decimal import Decimal
 from datetime import date, datetime
-import os
+
+import bedrock_gateway
+import conversation_memory
+import data_version
+import db
+import goal_projections
+import metrics
+import model_registry
+import prompt_builder
+import sql_guard
+import streaming
+from cache import TieredCache, make_store, normalize_text
+from sql_templates import SQLTemplateCache, is_contextual
+
+# Question shape -> parameterized SQL learned from earlier generations
+sql_templates = SQLTemplateCache(TieredCache(
+    "sql_template",
+    maxsize=int(os.environ.get('SQL_TEMPLATE_CACHE_SIZE', '512')),
+    ttl=int(os.environ.get('SQL_TEMPLATE_TTL', '604800')),
+    store=make_store(os.environ.get('SQL_TEMPLATE_STORE'), "sql_template"),
+))
+
+# Final answers (rows + text) per user, question and data version; writes bump the version
+result_cache = TieredCache(
+    "query_result",
+    maxsize=int(os.environ.get('QUERY_RESULT_CACHE_SIZE', '1024')),
+    ttl=int(os.environ.get('QUERY_RESULT_TTL', '3600')),
+    store=make_store(os.environ.get('QUERY_RESULT_STORE'), "query_result"),
+)
 
 # ---------- Helper Functions ----------
 
@@ -22,37 +51,52 @@ def serialize_special(obj):
         return obj
 
 
-# ---------- Memory Layer (stored in /tmp) ----------
-
-MEMORY_FILE = "/tmp/memory.json"
-
-def load_memory():
-    """Load memory from /tmp (if exists)."""
-    if os.path.exists(MEMORY_FILE):
-        try:
-            with open(MEMORY_FILE, "r") as f:
-                return json.load(f)
-        except Exception:
-            return {}
-    return {}
+# ---------- Memory Layer (per-user turn store) ----------
 
-def save_memory(memory):
-    """Save memory to /tmp."""
-    with open(MEMORY_FILE, "w") as f:
-        json.dump(memory, f)
+MEMORY_NAMESPACE = "query_agent"
 
 def get_user_context(user_id):
-    """Get context for specific user."""
-    memory = load_memory()
-    return memory.get(user_id, "")
+    """Rolling summary plus the most recent turns, within the context token budget."""
+    return prompt_builder.conversation_context(MEMORY_NAMESPACE, user_id)
 
 def update_user_context(user_id, user_query, response):
-    """Append new conversation to user’s context."""
-    memory = load_memory()
-    context = memory.get(user_id, "")
-    context += f"\nUser: {user_query}\nAssistant: {response}\n"
-    memory[user_id] = context
-    save_memory(memory)
+    """Append new conversation turn to user’s context; older turns are folded into the summary in the background."""
+    conversation_memory.get_store().append(MEMORY_NAMESPACE, user_id, user_query, response)
+    prompt_builder.schedule_summary(MEMORY_NAMESPACE, user_id)
+
+
+def result_cache_key(user_id, user_query):
+    """Cache key for a self-contained question, or None when the answer must not be cached.
+
+    The day is part of the key because "this month"-style questions change
+    meaning at midnight; follow-ups depend on conversation context.
+    """
+    if is_contextual(user_query):
+        return None
+    try:
+        version = data_version.current(user_id)
+    except Exception as e:
+        print(f"Data version lookup failed, bypassing result cache: {e}")
+        return None
+    return f"{user_id}:{version}:{date.today().isoformat()}:{normalize_text(user_query)}"
+
+
+# ---------- Goal Progress ----------
+
+def answer_goal_question(user_id, user_query):
+    """Answer from goal_projections for goal progress questions; None falls through to SQL generation."""
+    if not goal_projections.is_goal_question(user_query):
+        return None
+    try:
+        projections = goal_projections.for_user(user_id)
+    except Exception as e:
+        print(f"Goal projections unavailable, generating SQL instead: {e}")
+        return None
+    message = goal_projections.answer(user_query, projections)
+    if message is None:
+        return None
+    metrics.incr("query_agent.goal_answers")
+    return {"message": message, "data": goal_projections.match_goals(user_query, projections), "source": "goal_projections"}
 
 
 # ---------- Bedrock SQL Generator ----------
@@ -64,7 +108,7 @@ You will receive user's conversation context and question.
 Generate a valid PostgreSQL query based on the following tables:
 
 Table: transactions
-- id (serial primary key)
+- id (serial, unique)
 - amount (numeric)
 - transaction_type (text)  # 'credit' or 'debit'
 - transaction_date (date)
@@ -84,93 +128,175 @@ Rules:
 1. Always use `age(date1, date2)` for date differences.
 2. To calculate remaining months: `EXTRACT(MONTH FROM age(target_date, CURRENT_DATE))`.
 3. Return only a valid SQL query — no markdown or explanations.
+4. The tables already contain only the current user's rows; do not filter by user and do not prefix table names with a schema.
+5. Filter dates with plain ranges on the column, e.g. `transaction_date >= DATE '2025-10-01' AND transaction_date < DATE '2025-11-01'` or `transaction_date >= date_trunc('month', CURRENT_DATE)`. Never wrap transaction_date in a function (EXTRACT, date_trunc, to_char) inside WHERE, so only the matching monthly partitions are scanned.
 
 User Context: {memory_context}
-User Question: '{user_query}'
+User Question: '{prompt_builder.truncate(user_query, 200)}'
 """
 
-    client = boto3.client("bedrock-runtime", region_name="eu-north-1")
+    response = model_registry.converse("nl2sql", prompt, validate=is_runnable_sql)
+    return strip_sql_fences(model_registry.text(response))
+
+
+def strip_sql_fences(raw_text):
+    return re.sub(r"```sql|```", "", raw_text.strip()).strip()
 
-    response = client.converse(
-        modelId="amazon.nova-lite-v1:0",
-        messages=[{"role": "user", "content": [{"text": prompt}]}],
-        inferenceConfig={"maxTokens": 400, "temperature": 0.3, "topP": 0.9}
-    )
 
-    raw_text = response["output"]["message"]["content"][0]["text"].strip()
-    sql_query = re.sub(r"```sql|```", "", raw_text).strip()
-    return sql_query
+def is_runnable_sql(raw_text):
+    """Validation for generated SQL: a single read-only statement over the user's tables."""
+    sql = strip_sql_fences(raw_text)
+    sql_guard.ensure_read_only(sql)
+    sql_guard.ensure_relations(sql, SCOPED_TABLES)
+    return True
+
+
+# ---------- User Scoping ----------
+
+SCOPED_TABLES = ["transactions", "goal", "daily_spending"]
+_LEADING_WITH = re.compile(r"^\s*WITH(\s+RECURSIVE)?\s", re.IGNORECASE)
+
+
+def scope_sql_to_user(sql_query, user_id):
+    """Force a generated query into one user's rows.
+
+    Each user-owned table is shadowed by a same-named CTE filtered on user_id.
+    The CTEs are NOT MATERIALIZED, so the planner inlines them and the
+    (user_id, ...) indexes are used. The query may read only these CTEs and
+    its own; any other relation (partitions, schema-qualified names, other
+    tables, catalogs) is rejected. Returns (sql, params) for cursor.execute.
+    """
+    sql_guard.ensure_relations(sql_query, SCOPED_TABLES)
+    ctes = ",\n".join(
+        f"{table} AS NOT MATERIALIZED (SELECT * FROM public.{table} WHERE user_id = %(user_id)s)"
+        for table in SCOPED_TABLES
+    )
+    # Literal % in the generated SQL must be escaped once parameters are bound
+    body = sql_query.strip().rstrip(";").replace("%", "%%")
+    match = _LEADING_WITH.match(body)
+    if match:
+        keyword = "WITH RECURSIVE" if match.group(1) else "WITH"
+        scoped = f"{keyword} {ctes},\n{body[match.end():]}"
+    else:
+        scoped = f"WITH {ctes}\n{body}"
+    return scoped, {"user_id": user_id}
 
 
 # ---------- Bedrock Text Generator ----------
 
-def generate_textual_response(user_query, data, memory_context):
-    """Convert SQL result to natural answer using Bedrock."""
-    client = boto3.client("bedrock-runtime", region_name="eu-north-1")
-    prompt = f"""
+def generate_textual_response(user_query, data, memory_context, chat_id=None):
+    """Convert SQL result to natural answer using Bedrock (streamed to the chat when chat_id is given)."""
+    template = """
 You are a friendly financial assistant with short-term memory.
 Use the previous conversation and new data to answer naturally.
 
 User Context: {memory_context}
 User Question: "{user_query}"
-Database Results: {json.dumps(data)}
+Database Results: {data}
 """
-    response = client.converse(
-        modelId="amazon.nova-lite-v1:0",
-        messages=[{"role": "user", "content": [{"text": prompt}]}],
-        inferenceConfig={"maxTokens": 250, "temperature": 0.5}
+    user_query = prompt_builder.truncate(user_query, 200)
+    # Whatever the template, context and question leave over goes to the result set
+    fixed = template.format(memory_context=memory_context, user_query=user_query, data="")
+    data_budget = prompt_builder.PROMPT_TOKEN_BUDGET - prompt_builder.estimate_tokens(fixed)
+    prompt = template.format(
+        memory_context=memory_context,
+        user_query=user_query,
+        data=prompt_builder.compact_rows(data, data_budget),
+    )
+    return streaming.converse_text(
+        "answer", prompt, chat_id=chat_id,
+        fallback=lambda: "Here is what I found: " + prompt_builder.compact_rows(data, 300),
     )
-    return response["output"]["message"]["content"][0]["text"].strip()
 
 
 # ---------- Lambda Handler ----------
 
 def lambda_handler(event, context):
+    startup.report_once()
     user_query = event.get("message", "")
-    user_id = event.get("user_id", "default_user")
+    user_id = str(event.get("user_id") or db.DEFAULT_USER_ID)
 
     if not user_query:
         return {"statusCode": 400, "body": "No query found"}
 
     try:
-        # 1️⃣ Load memory
-        memory_context = get_user_context(user_id)
-
-        # 2️⃣ Generate SQL
-        sql_query = generate_sql(user_query, memory_context)
-
-        # 3️⃣ Execute SQL
-        conn = psycopg2.connect(
-            host="finprod.cvcamc60mtim.eu-north-1.rds.amazonaws.com",
-            port="5432",
-            database="finprod",
-            user="postgres",
-            password="Siddhesh"
-        )
-        cursor = conn.cursor()
-        cursor.execute(sql_query)
-        columns = [desc[0] for desc in cursor.description]
-        results = cursor.fetchall()
-        conn.close()
-
-        data = serialize_special([dict(zip(columns, row)) for row in results])
+        # 0️⃣ Answer from cache while the user's data is unchanged
+        cache_key = result_cache_key(user_id, user_query)
+        cached = result_cache.get(cache_key) if cache_key else None
+        if cached is not None:
+            # Only record the turn; a hit must not wait on memory or Bedrock beyond that
+            conversation_memory.get_store().append(MEMORY_NAMESPACE, user_id, user_query, cached["message"])
+            metrics.log_stats("query_result_cache", result_cache.stats)
+            return {"statusCode": 200, "body": json.dumps(dict(cached, cached=True))}
+
+        # Goal progress questions are answered from precomputed projections, without Bedrock
+        goal_reply = answer_goal_question(user_id, user_query)
+        if goal_reply is not None:
+            update_user_context(user_id, user_query, goal_reply["message"])
+            return {"statusCode": 200, "body": json.dumps(goal_reply)}
+
+        # 1️⃣ Load memory (prefetched by the router while it classified the message)
+        prefetched = event.get("prefetched") or {}
+        if "query_context" in prefetched:
+            memory_context = prefetched["query_context"]
+        else:
+            memory_context = get_user_context(user_id)
+
+        # 2️⃣ Generate SQL, or bind a template learned from an earlier generation
+        sql_query = sql_templates.lookup(user_query)
+        generation_ms = None
+        if sql_query is None:
+            started = time.perf_counter()
+            sql_query = generate_sql(user_query, memory_context)
+            generation_ms = (time.perf_counter() - started) * 1000
+
+        # 3️⃣ Execute SQL within the user's rows only, under the read-only/cost/time guards;
+        #    large results come back summarized
+        sql_guard.ensure_read_only(sql_query)
+        scoped_sql, params = scope_sql_to_user(sql_query, user_id)
+        with db.connection() as conn:
+            data = sql_guard.execute(conn, scoped_sql, params, convert=serialize_special, user_id=user_id)
+        if generation_ms is not None:
+            sql_templates.learn(user_query, sql_query, generation_ms)
 
         # 4️⃣ Generate human response
-        textual_response = generate_textual_response(user_query, data, memory_context)
+        stream_chat_id = event.get("stream_chat_id")
+        textual_response = generate_textual_response(user_query, data, memory_context, stream_chat_id)
 
         # 5️⃣ Update in-memory context
         update_user_context(user_id, user_query, textual_response)
+        metrics.log_stats("sql_templates", sql_templates.stats)
 
-        # 6️⃣ Return
+        # 6️⃣ Cache and return
+        answer = {
+            "message": textual_response,
+            "generated_sql": sql_query,
+            "data": data
+        }
+        if cache_key:
+            result_cache.set(cache_key, answer)
+            metrics.log_stats("query_result_cache", result_cache.stats)
         return {
             "statusCode": 200,
+            "body": json.dumps(dict(answer, streamed=bool(stream_chat_id)))
+        }
+
+    except bedrock_gateway.BedrockUnavailable as e:
+        return {
+            "statusCode": 503,
             "body": json.dumps({
-                "message": textual_response,
-                "generated_sql": sql_query,
-                "data": data
+                "message": "I can't answer that right now. Please try again in a few minutes.",
+                "error": str(e)
+            })
+        }
+    except sql_guard.QueryRejected as e:
+        return {
+            "statusCode": 400,
+            "body": json.dumps({
+                "error": f"Query not run: {e}",
+                "sql": sql_query if 'sql_query' in locals() else None
             })
         }
-
     except Exception as e:
         return {
             "statusCode": 500,
@@ -179,3 +305,6 @@ def lambda_handler(event, context):
                 "sql": sql_query if 'sql_query' in locals() else None
             })
         }
+    finally:
+        # Turns are written behind; the router flushes them after the reply is sent
+        conversation_memory.log_stats()
@@ -0,0 +1,261 @@
+"""Local intent classifiers that answer before Bedrock when they are confident.
+
+Two stages are tried in order: weighted keyword/regex rules, then an optional
+naive Bayes model trained offline on logged Bedrock labels (see
+scripts/train_intent_model.py). Each stage has its own confidence threshold;
+anything below it falls through to Bedrock.
+
+The router logs every message as an `intent_log` line with the stage that
+answered it and the local prediction (even when below threshold). Locally
+answered messages carry a Bedrock label only when they were picked for a
+shadow call (INTENT_SHADOW_RATE); `read_intent_log` reads those lines back for
+scripts/evaluate_intent_classifier.py and scripts/train_intent_model.py.
+"""
+import json
+import math
+import os
+import re
+import threading
+
+from cache import normalize_text
+
+INTENTS = ["transaction", "goal", "query", "budget_guardian"]
+STAGES = ["rules", "naive_bayes"]
+
+LOCAL_INTENT_ENABLED = os.environ.get("LOCAL_INTENT_ENABLED", "1") == "1"
+RULES_THRESHOLD = float(os.environ.get("LOCAL_INTENT_THRESHOLD", "0.8"))
+MODEL_THRESHOLD = float(os.environ.get("LOCAL_INTENT_MODEL_THRESHOLD", "0.95"))
+MODEL_PATH = os.environ.get(
+    "LOCAL_INTENT_MODEL", os.path.join(os.path.dirname(os.path.abspath(__file__)), "intent_model.json")
+)
+
+_AMOUNT = r"(?:₹|rs\.?|inr|\$)\s?\d|\b\d[\d,]*(?:\.\d+)?\s?(?:k|lakh|lakhs|lac|rs|rupees|inr)\b|\b\d{2,}[\d,]*\b"
+_SPEND_WORDS = r"\b(?:spent|spend|spending)\b"
+_WINDOW_WORDS = r"\b(?:today|daily|this week|tonight)\b"
+
+# (pattern, {intent: weight}); negative weights push competing intents down
+RULES = [
+    (r"\b(?:spent|paid|bought|purchased|debited|credited|received|transferred|withdrew|withdrawn|got paid)\b",
+     {"transaction": 2.0}),
+    (_AMOUNT, {"transaction": 2.0}),
+    (r"\b(?:on|for)\s+(?:groceries|grocery|rent|food|dinner|lunch|breakfast|uber|ola|taxi|cab|fuel|petrol|"
+     r"electricity|bill|movie|movies|shopping|coffee)\b", {"transaction": 1.5}),
+    (r"\b(?:salary|bill|emi)\b", {"transaction": 1.0}),
+    (r"\b(?:save|saving|savings)\b.*\b(?:for|by|till|until|in)\b", {"goal": 3.0, "transaction": -2.0}),
+    (r"\b(?:want to|plan to|planning to|need to)\s+(?:save|buy|plan|build)\b", {"goal": 2.0, "transaction": -2.0}),
+    (r"\b(?:goal|target)\b", {"goal": 2.0}),
+    (r"^(?:how|what|when|which|where|show|list|tell|give|did|do|does|am|is|are|can|total)\b",
+     {"query": 2.0, "transaction": -2.0, "goal": -2.0}),
+    (r"\?\s*$", {"query": 1.5, "transaction": -1.0, "goal": -1.0}),
+    # A question anywhere ("I bought a car for 5 lakh, how much did I spend on cars") is not a plain record
+    (r"\bhow (?:much|many|often)\b|\?", {"transaction": -2.0, "query": 1.0}),
+    (r"\b(?:show|list|view)\b.*\bgoals?\b", {"query": 2.0, "goal": -2.0}),
+    (r"\b(?:how far|remaining|left|progress|months? left|on track)\b", {"query": 1.5}),
+    (r"\b(?:over budget|budget|limit|overspend|overspending|alert)\b", {"budget_guardian": 3.0, "query": -2.0}),
+    (_SPEND_WORDS + r".*" + _WINDOW_WORDS + "|" + _WINDOW_WORDS + r".*" + _SPEND_WORDS,
+     {"budget_guardian": 3.0, "query": -2.0, "transaction": -2.0}),
+]
+
+
+class RuleClassifier:
+    """Weighted regex rules; confidence is the winning share of the total score."""
+
+    name = "rules"
+
+    def __init__(self, rules=RULES, threshold=RULES_THRESHOLD):
+        self.rules = [(re.compile(pattern), weights) for pattern, weights in rules]
+        self.threshold = threshold
+
+    def predict(self, text):
+        cleaned = (text or "").lower().strip()
+        scores = dict.fromkeys(INTENTS, 0.0)
+        for pattern, weights in self.rules:
+            if pattern.search(cleaned):
+                for intent, weight in weights.items():
+                    scores[intent] += weight
+        scores = {intent: max(score, 0.0) for intent, score in scores.items()}
+        intent = max(scores, key=scores.get)
+        if scores[intent] == 0:
+            return None, 0.0
+        # +1 keeps a single weak rule from reaching full confidence
+        return intent, scores[intent] / (sum(scores.values()) + 1.0)
+
+
+def tokenize(text):
+    """Unigrams and bigrams of the normalized text, with numbers folded to <num>."""
+    words = ["<num>" if word.replace(".", "").isdigit() else word for word in normalize_text(text).split()]
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+class NaiveBayesClassifier:
+    """Multinomial naive Bayes with Laplace smoothing, serializable to JSON."""
+
+    name = "naive_bayes"
+
+    def __init__(self, class_counts=None, token_counts=None, threshold=MODEL_THRESHOLD):
+        self.class_counts = class_counts or {}
+        self.token_counts = token_counts or {}
+        self.threshold = threshold
+        self._refresh()
+
+    def _refresh(self):
+        self.vocab = set()
+        for counts in self.token_counts.values():
+            self.vocab.update(counts)
+        self.class_totals = {c: sum(counts.values()) for c, counts in self.token_counts.items()}
+
+    @classmethod
+    def train(cls, examples, threshold=MODEL_THRESHOLD, weights=None):
+        """Build a model from (message, intent) pairs, each counted `weights[i]` times (default 1)."""
+        class_counts, token_counts = {}, {}
+        for i, (message, intent) in enumerate(examples):
+            if intent not in INTENTS:
+                continue
+            weight = weights[i] if weights else 1
+            class_counts[intent] = class_counts.get(intent, 0) + weight
+            counts = token_counts.setdefault(intent, {})
+            for token in tokenize(message):
+                counts[token] = counts.get(token, 0) + weight
+        return cls(class_counts, token_counts, threshold)
+
+    def predict(self, text):
+        if not self.class_counts:
+            return None, 0.0
+        tokens = [t for t in tokenize(text) if t in self.vocab]
+        if not tokens:
+            return None, 0.0
+        total_docs = sum(self.class_counts.values())
+        vocab_size = len(self.vocab)
+        log_probs = {}
+        for intent, doc_count in self.class_counts.items():
+            counts = self.token_counts.get(intent, {})
+            denominator = self.class_totals.get(intent, 0) + vocab_size
+            log_prob = math.log(doc_count / total_docs)
+            for token in tokens:
+                log_prob += math.log((counts.get(token, 0) + 1) / denominator)
+            log_probs[intent] = log_prob
+        best = max(log_probs, key=log_probs.get)
+        # Softmax over log-probabilities gives the posterior of the winner
+        norm = sum(math.exp(lp - log_probs[best]) for lp in log_probs.values())
+        return best, 1.0 / norm
+
+    def to_dict(self):
+        return {"class_counts": self.class_counts, "token_counts": self.token_counts}
+
+    @classmethod
+    def load(cls, path, threshold=MODEL_THRESHOLD):
+        with open(path, "r") as f:
+            data = json.load(f)
+        return cls(data.get("class_counts"), data.get("token_counts"), threshold)
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f)
+
+
+class LocalIntentClassifier:
+    """Runs each stage in order and returns the first confident answer."""
+
+    def __init__(self, stages):
+        self.stages = stages
+
+    def explain(self, text):
+        """(intent, confidence, stage_name, accepted) for the first confident stage.
+
+        When no stage is confident, the most confident prediction is returned
+        with accepted False (intent None when no stage predicted anything).
+        """
+        best = (None, 0.0, None, False)
+        for stage in self.stages:
+            intent, confidence = stage.predict(text)
+            if intent and confidence >= stage.threshold:
+                return intent, confidence, stage.name, True
+            if intent and confidence > best[1]:
+                best = (intent, confidence, stage.name, False)
+        return best
+
+    def classify(self, text):
+        """Return (intent, confidence, stage_name), or None to defer to Bedrock."""
+        intent, confidence, stage, accepted = self.explain(text)
+        return (intent, confidence, stage) if accepted else None
+
+
+_default = None
+_default_lock = threading.Lock()
+
+
+def default_classifier():
+    """Rules plus the bundled naive Bayes model when one has been trained."""
+    global _default
+    if _default is None:
+        with _default_lock:
+            if _default is None:
+                stages = [RuleClassifier()]
+                if os.path.exists(MODEL_PATH):
+                    try:
+                        stages.append(NaiveBayesClassifier.load(MODEL_PATH))
+                    except Exception as e:
+                        print(f"Could not load intent model {MODEL_PATH}: {e}")
+                _default = LocalIntentClassifier(stages)
+    return _default
+
+
+def classify(text):
+    if not LOCAL_INTENT_ENABLED:
+        return None
+    return default_classifier().classify(text)
+
+
+def explain(text):
+    """LocalIntentClassifier.explain with the default stages; never accepted when disabled."""
+    intent, confidence, stage, accepted = default_classifier().explain(text)
+    return intent, confidence, stage, accepted and LOCAL_INTENT_ENABLED
+
+
+def read_intent_log(path):
+    """Records from JSONL: plain {"message", "intent"} rows or CloudWatch exports
+    of the `intent_log` lines printed by the router."""
+    records = []
+    with open(path, "r") as f:
+        for line in f:
+            line = line.strip()
+            start = line.find("{")
+            if start < 0:
+                continue
+            try:
+                record = json.loads(line[start:])
+            except ValueError:
+                continue
+            record = record.get("intent_log", record)
+            if isinstance(record, dict) and record.get("message"):
+                records.append(record)
+    return records
+
+
+def label_weight(record):
+    """How many stream messages a labelled record stands for.
+
+    Shadow labels cover a random INTENT_SHADOW_RATE sample of the locally
+    answered messages, so each one counts 1 / rate times.
+    """
+    rate = record.get("shadow_rate") or 0
+    return 1.0 / rate if record.get("label_source") == "shadow" and rate > 0 else 1.0
+
+
+def labelled_records(records):
+    return [r for r in records if r.get("intent") in INTENTS]
+
+
+def read_labelled_messages(path):
+    """(message, intent) pairs for the records that carry a Bedrock label."""
+    return [(r["message"], r["intent"]) for r in labelled_records(read_intent_log(path))]
+
+
+def best_guess(text, default="query"):
+    """Most likely intent from any stage, ignoring thresholds (used when Bedrock is unavailable)."""
+    best, best_confidence = default, 0.0
+    for stage in default_classifier().stages:
+        intent, confidence = stage.predict(text)
+        if intent and confidence > best_confidence:
+            best, best_confidence = intent, confidence
+    return best
@@ -0,0 +1,102 @@
+"""In-process counters and timings, kept per Lambda container and logged as JSON lines.
+
+Modules describe their state with a `stats()` function and hand it to
+`log_stats`, which prints it only every LOG_STATS_EVERY-th time per name and
+container (never by default), so stats are not computed and logged on every
+request.
+"""
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+SAMPLE_SIZE = 512  # timings kept per metric for percentiles
+LOG_STATS_EVERY = int(os.environ.get("LOG_STATS_EVERY", "0"))  # 0: never; N: first and every Nth call
+
+_lock = threading.Lock()
+_counters = {}
+_timings = {}
+_stats_calls = {}
+
+
+def incr(name, amount=1):
+    """Increase a counter."""
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+
+def observe(name, value_ms):
+    """Record one timing sample in milliseconds."""
+    with _lock:
+        samples = _timings.get(name)
+        if samples is None:
+            samples = _timings[name] = deque(maxlen=SAMPLE_SIZE)
+        samples.append(float(value_ms))
+
+
+@contextmanager
+def timer(name):
+    """Time the enclosed block and record it under `name`."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, (time.perf_counter() - started) * 1000)
+
+
+def _percentile(ordered, pct):
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def snapshot(prefix=""):
+    """Return counters and timing summaries whose name starts with `prefix`."""
+    with _lock:
+        counters = {k: v for k, v in _counters.items() if k.startswith(prefix)}
+        timings = {k: sorted(v) for k, v in _timings.items() if k.startswith(prefix) and v}
+
+    summary = dict(counters)
+    for name, ordered in timings.items():
+        summary[name] = {
+            "count": len(ordered),
+            "avg_ms": round(sum(ordered) / len(ordered), 2),
+            "p50_ms": round(_percentile(ordered, 50), 2),
+            "p99_ms": round(_percentile(ordered, 99), 2),
+            "max_ms": round(ordered[-1], 2),
+        }
+    return summary
+
+
+def counter(name):
+    """Current value of a counter (0 if never increased)."""
+    with _lock:
+        return _counters.get(name, 0)
+
+
+def emit(prefix=""):
+    """Print a snapshot as one JSON line so it can be filtered in CloudWatch."""
+    print(json.dumps({"metrics": prefix or "all", "values": snapshot(prefix)}))
+
+
+def log_stats(name, stats):
+    """Print {name: stats()} as one JSON line on the first and every LOG_STATS_EVERY-th call.
+
+    `stats` is only called when the line is printed. Returns True when it was.
+    """
+    if LOG_STATS_EVERY <= 0:
+        return False
+    with _lock:
+        calls = _stats_calls[name] = _stats_calls.get(name, 0) + 1
+    if (calls - 1) % LOG_STATS_EVERY:
+        return False
+    print(json.dumps({name: stats()}))
+    return True
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _timings.clear()
+        _stats_calls.clear()
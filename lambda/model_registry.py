@@ -0,0 +1,143 @@
+"""Model and inference settings per task, with escalation on invalid output.
+
+Each call site names its task instead of hardcoding a model. Where each default
+in TASKS comes from is noted next to it: most are the settings the call site
+hardcoded before the registry existed, and a few were retuned since. Point a
+task at a smaller or faster model with MODEL_<TASK> (e.g. MODEL_CLASSIFY=amazon.nova-micro-v1:0)
+and at its escalation model with MODEL_<TASK>_ESCALATE ("" disables it).
+
+`converse(task, prompt, validate=...)` calls the task's model through
+bedrock_gateway. When the output fails `validate`, it retries once on the
+escalation model. Latency, input/output tokens, invalid outputs and
+escalations are recorded per task as `model.<task>.*`; compare them before
+moving a task to a cheaper tier.
+"""
+import os
+import time
+
+import bedrock_gateway
+import metrics
+import prompt_builder
+
+LITE = "amazon.nova-lite-v1:0"
+PRO = "amazon.nova-pro-v1:0"
+
+# Escalation to PRO was added with the registry, for tasks whose output is validated
+TASKS = {
+    # Call-site settings from before the registry:
+    "classify":            {"model": LITE, "escalate_to": PRO, "maxTokens": 50, "temperature": 0.3},
+    "classify_extract":    {"model": LITE, "escalate_to": PRO, "maxTokens": 200, "temperature": 0.3},
+    "nl2sql":              {"model": LITE, "escalate_to": PRO, "maxTokens": 400, "temperature": 0.3, "topP": 0.9},
+    "answer":              {"model": LITE, "escalate_to": None, "maxTokens": 250, "temperature": 0.5},
+    "guardian":            {"model": LITE, "escalate_to": None, "maxTokens": 300, "temperature": 0.4},
+    "summarize":           {"model": LITE, "escalate_to": None, "maxTokens": 150, "temperature": 0.2},
+    # Previously 80 tokens per record + 100; bulk_import still passes that per call, this is only a ceiling
+    "extract_batch":       {"model": LITE, "escalate_to": PRO, "maxTokens": 2000, "temperature": 0.2},
+    # Retuned for tool-use extraction (extraction.py); previously 300 tokens, temperature 0.7, topP 0.9,
+    # escalating to PRO. A schema-constrained tool call is short, and invalid fields get a repair call instead
+    "extract_transaction": {"model": LITE, "escalate_to": None, "maxTokens": 120, "temperature": 0.1},
+    "extract_goal":        {"model": LITE, "escalate_to": None, "maxTokens": 120, "temperature": 0.1},
+    # Retuned for answers built on the daily brief (investment_insights.py); previously 300 tokens
+    "advise":              {"model": LITE, "escalate_to": None, "maxTokens": 200, "temperature": 0.5},
+    # New with investment_insights.py
+    "insights_brief":      {"model": LITE, "escalate_to": None, "maxTokens": 450, "temperature": 0.3},
+}
+
+_INFERENCE_KEYS = ("maxTokens", "temperature", "topP", "stopSequences")
+
+
+def config(task, **overrides):
+    """(model_id, escalation model or None, inferenceConfig) for a task."""
+    settings = dict(TASKS[task], **overrides)
+    env_name = f"MODEL_{task.upper()}"
+    model_id = os.environ.get(env_name) or settings["model"]
+    escalate_to = os.environ.get(f"{env_name}_ESCALATE", settings.get("escalate_to")) or None
+    inference = {key: settings[key] for key in _INFERENCE_KEYS if key in settings}
+    return model_id, escalate_to, inference
+
+
+def text(response):
+    return response["output"]["message"]["content"][0]["text"]
+
+
+def record(task, model_id, prompt, response, elapsed_ms):
+    """Per-task latency and token usage, plus the per-call prompt log line."""
+    metrics.incr(f"model.{task}.calls")
+    metrics.observe(f"model.{task}.latency", elapsed_ms)
+    usage = response.get("usage") or {}
+    metrics.incr(f"model.{task}.input_tokens", usage.get("inputTokens") or 0)
+    metrics.incr(f"model.{task}.output_tokens", usage.get("outputTokens") or 0)
+    prompt_builder.log_prompt(task, prompt, response, model_id)
+
+
+def _invoke(task, model_id, prompt, inference, fallback, extra):
+    started = time.perf_counter()
+    response = bedrock_gateway.converse(
+        modelId=model_id,
+        messages=[{"role": "user", "content": [{"text": prompt}]}],
+        inferenceConfig=inference,
+        fallback=fallback,
+        **extra
+    )
+    if response.get("fallback"):
+        # No model answered; counting it as a call would skew the model's latency and tokens
+        metrics.incr(f"model.{task}.fallbacks")
+        prompt_builder.log_prompt(task, prompt, response, model_id)
+        return response
+    record(task, model_id, prompt, response, (time.perf_counter() - started) * 1000)
+    return response
+
+
+def _is_valid(validate, response):
+    try:
+        return bool(validate(text(response)))
+    except Exception:
+        return False
+
+
+def converse(task, prompt, validate=None, fallback=None, extra=None, **overrides):
+    """Run a single-turn prompt for `task`; escalates once when `validate(text)` fails.
+
+    `extra` holds additional converse arguments (e.g. toolConfig); `overrides`
+    replace registry settings for this call (e.g. maxTokens).
+    """
+    model_id, escalate_to, inference = config(task, **overrides)
+    response = _invoke(task, model_id, prompt, inference, fallback, extra or {})
+    if validate is None or response.get("fallback") or _is_valid(validate, response):
+        return response
+    metrics.incr(f"model.{task}.invalid")
+    if not escalate_to or escalate_to == model_id:
+        return response
+    metrics.incr(f"model.{task}.escalations")
+    return _invoke(task, escalate_to, prompt, inference, fallback, extra or {})
+
+
+def stats():
+    """Per-task call counts, fallbacks, escalations, latency percentiles and average tokens.
+
+    Fallback answers (Bedrock unavailable) are counted apart from calls and do
+    not enter latency or token figures.
+    """
+    result = {}
+    for task in TASKS:
+        calls = metrics.counter(f"model.{task}.calls")
+        fallbacks = metrics.counter(f"model.{task}.fallbacks")
+        if not calls and not fallbacks:
+            continue
+        latency = metrics.snapshot(f"model.{task}.latency").get(f"model.{task}.latency", {})
+        result[task] = {
+            "model": config(task)[0],
+            "calls": calls,
+            "fallbacks": fallbacks,
+            "invalid": metrics.counter(f"model.{task}.invalid"),
+            "escalations": metrics.counter(f"model.{task}.escalations"),
+            "p50_ms": latency.get("p50_ms"),
+            "p99_ms": latency.get("p99_ms"),
+            "avg_input_tokens": round(metrics.counter(f"model.{task}.input_tokens") / calls, 1) if calls else None,
+            "avg_output_tokens": round(metrics.counter(f"model.{task}.output_tokens") / calls, 1) if calls else None,
+        }
+    return result
+
+
+def log_stats():
+    metrics.log_stats("models", stats)
@@ -0,0 +1,100 @@
+"""Scheduled maintenance of the monthly transactions partitions.
+
+Run daily (e.g. from an EventBridge schedule). Creates partitions for the next
+PARTITION_MONTHS_AHEAD months, moves rows that landed in the default partition
+into their own month, and, when TRANSACTION_RETENTION_MONTHS is set, detaches
+partitions older than the retention window into the `archive` schema. Detached
+data stays queryable there, and the daily_spending rollup keeps its totals.
+"""
+import startup
+import json
+import os
+import re
+from datetime import date
+
+import db
+
+PARTITION_MONTHS_AHEAD = int(os.environ.get("PARTITION_MONTHS_AHEAD", "3"))
+# Rows dated further back stay in the default partition rather than creating a partition each
+PARTITION_MAX_HISTORY_MONTHS = int(os.environ.get("PARTITION_MAX_HISTORY_MONTHS", "120"))
+TRANSACTION_RETENTION_MONTHS = int(os.environ.get("TRANSACTION_RETENTION_MONTHS", "0"))  # 0 keeps everything
+
+_PARTITION_NAME = re.compile(r"^transactions_p(\d{4})(\d{2})$")
+
+
+def add_months(day, months):
+    month_index = day.year * 12 + day.month - 1 + months
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def month_range(day):
+    """[first day of the month, first day of the next month) — a pruning-friendly range."""
+    start = day.replace(day=1)
+    return start, add_months(start, 1)
+
+
+def list_partitions(cursor):
+    cursor.execute("""
+        SELECT child.relname
+        FROM pg_inherits
+        JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        WHERE parent.relname = 'transactions'
+    """)
+    return sorted(row[0] for row in cursor.fetchall())
+
+
+def ensure_partitions(cursor, today=None, months_ahead=PARTITION_MONTHS_AHEAD):
+    """Create upcoming months and any month that currently has rows in the default partition.
+
+    Months outside [PARTITION_MAX_HISTORY_MONTHS back, months_ahead forward] are
+    left in the default partition, so a few mistyped dates cannot create
+    hundreds of partitions.
+    """
+    today = today or date.today()
+    this_month = today.replace(day=1)
+    months = {add_months(this_month, i) for i in range(months_ahead + 1)}
+    cursor.execute("""
+        SELECT DISTINCT date_trunc('month', transaction_date)::date
+        FROM transactions_default
+        WHERE transaction_date >= %s AND transaction_date < %s
+    """, (add_months(this_month, -PARTITION_MAX_HISTORY_MONTHS), add_months(this_month, months_ahead + 1)))
+    months.update(row[0] for row in cursor.fetchall())
+    created = []
+    existing = set(list_partitions(cursor))
+    for month in sorted(months):
+        cursor.execute("SELECT create_transaction_partition(%s)", (month,))
+        name = cursor.fetchone()[0]
+        if name not in existing:
+            created.append(name)
+    return created
+
+
+def detach_expired(cursor, today=None, retention_months=TRANSACTION_RETENTION_MONTHS):
+    """Detach partitions that ended before the retention window and move them to `archive`."""
+    if retention_months <= 0:
+        return []
+    today = today or date.today()
+    cutoff = add_months(today.replace(day=1), -retention_months)
+    detached = []
+    for name in list_partitions(cursor):
+        match = _PARTITION_NAME.match(name)
+        if not match:
+            continue
+        month_start = date(int(match.group(1)), int(match.group(2)), 1)
+        if add_months(month_start, 1) > cutoff:
+            continue
+        cursor.execute(f'ALTER TABLE transactions DETACH PARTITION "{name}"')
+        cursor.execute(f'ALTER TABLE "{name}" SET SCHEMA archive')
+        detached.append(name)
+    return detached
+
+
+def lambda_handler(event, context):
+    startup.report_once()
+    with db.connection() as conn, conn.cursor() as cursor:
+        created = ensure_partitions(cursor)
+        detached = detach_expired(cursor)
+    result = {"created": created, "detached": detached}
+    print(json.dumps({"partition_maintenance": result}))
+    return {"statusCode": 200, "body": json.dumps(result)}
@@ -0,0 +1,115 @@
+"""Concurrent prefetch of per-user context while the router waits on classification.
+
+When a message needs a Bedrock classification, the router starts these loads
+on a shared thread pool. None of them depend on the intent:
+
+- guardian_memory: Budget Guardian's recent turns
+- query_context:   the query agent's budgeted conversation context
+- spending:        the spending summary for the window the message mentions
+- goals:           the user's active goals
+
+Once the intent is known, `collect` waits for the loads that intent's handler
+uses and passes them on in the child payload under "prefetched". Loads the
+handler will not use are cancelled; ones already running finish in the
+background and are discarded. Per-stage timings are logged under "pipeline".
+"""
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+from startup import lazy_import
+
+budget_guardian = lazy_import("budget_guardian")
+lambda_query_agent = lazy_import("lambda_query_agent")
+
+PREFETCH_ENABLED = os.environ.get("PREFETCH_ENABLED", "0") == "1"
+PREFETCH_WORKERS = int(os.environ.get("PREFETCH_WORKERS", "4"))
+PREFETCH_TIMEOUT = float(os.environ.get("PREFETCH_TIMEOUT", "2.0"))  # seconds to wait after classification
+
+# Which prefetched values each intent's handler consumes
+PREFETCH_BY_INTENT = {
+    "budget_guardian": ("guardian_memory", "spending", "goals"),
+    "query": ("query_context",),
+}
+
+_executor = None
+
+
+def _pool():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix="prefetch")
+    return _executor
+
+
+def _spending(user_id, message):
+    window = budget_guardian.detect_window(message)
+    return budget_guardian.summarize_spending(budget_guardian.get_spending_rollups(user_id, window))
+
+
+LOADERS = {
+    "guardian_memory": lambda user_id, message: budget_guardian.load_memory(user_id),
+    "query_context": lambda user_id, message: lambda_query_agent.get_user_context(user_id),
+    "spending": _spending,
+    "goals": lambda user_id, message: budget_guardian.get_active_goals(user_id),
+}
+
+
+class Prefetch:
+    """The in-flight loads for one message, with per-load timings relative to its start."""
+
+    def __init__(self, user_id, message, names=None):
+        self.started = time.perf_counter()
+        self.timings = {}
+        self.futures = {
+            name: _pool().submit(self._timed, name, LOADERS[name], user_id, message)
+            for name in (names or LOADERS)
+        }
+
+    def _timed(self, name, loader, user_id, message):
+        began = time.perf_counter()
+        try:
+            return loader(user_id, message)
+        finally:
+            ended = time.perf_counter()
+            metrics.observe(f"prefetch.{name}", (ended - began) * 1000)
+            self.timings[name] = {
+                "start_ms": round((began - self.started) * 1000, 1),
+                "end_ms": round((ended - self.started) * 1000, 1),
+            }
+
+    def collect(self, intent, timeout=PREFETCH_TIMEOUT):
+        """Results the intent's handler uses; cancels the rest. Failed or late loads are left out."""
+        wanted = PREFETCH_BY_INTENT.get(intent, ())
+        deadline = time.perf_counter() + timeout
+        results = {}
+        for name, future in self.futures.items():
+            if name not in wanted:
+                if future.cancel():
+                    metrics.incr("prefetch.cancelled")
+                else:
+                    metrics.incr("prefetch.wasted")
+                continue
+            try:
+                results[name] = future.result(timeout=max(deadline - time.perf_counter(), 0))
+                metrics.incr("prefetch.used")
+            except Exception as e:
+                future.cancel()
+                metrics.incr("prefetch.failed")
+                print(f"Prefetch {name} unavailable: {e}")
+        return results
+
+
+def start(user_id, message):
+    """Begin every load for this message."""
+    return Prefetch(str(user_id), message)
+
+
+def log_pipeline(stages, prefetch=None):
+    """One JSON line with the request's stage timings and, if any, the prefetch timeline."""
+    record = {name: round(ms, 1) for name, ms in stages.items()}
+    if prefetch is not None:
+        record["prefetch"] = prefetch.timings
+    print(json.dumps({"pipeline": record}))
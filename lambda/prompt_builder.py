@@ -0,0 +1,204 @@
+"""Token-budgeted prompt assembly shared by the agents.
+
+Each Bedrock call gets an input-token budget (PROMPT_TOKEN_BUDGET). Conversation
+history contributes only the newest turns that fit, preceded by a rolling
+summary of older turns; the summary is refreshed by the model once
+PROMPT_SUMMARY_EVERY older turns have accumulated, on a background thread so
+the Bedrock call never delays a reply, and is kept in the memory store's
+summary table (one row per namespace and user). Result sets that do not fit are replaced by
+per-column aggregates plus a sample of rows. Every prompt's size, the model's
+reported token usage and its latency are logged per call (see model_registry).
+"""
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import conversation_memory
+import metrics
+from sql_guard import StreamingAggregator
+from startup import lazy_import
+
+model_registry = lazy_import("model_registry")  # imports this module; resolved at first call
+
+PROMPT_TOKEN_BUDGET = int(os.environ.get("PROMPT_TOKEN_BUDGET", "1500"))
+PROMPT_CONTEXT_TOKENS = int(os.environ.get("PROMPT_CONTEXT_TOKENS", "400"))
+PROMPT_RECENT_TURNS = int(os.environ.get("PROMPT_RECENT_TURNS", "4"))
+PROMPT_SUMMARY_EVERY = int(os.environ.get("PROMPT_SUMMARY_EVERY", "6"))
+
+CHARS_PER_TOKEN = 4  # rough average for English text and JSON under the Nova tokenizer
+
+
+def estimate_tokens(text):
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def truncate(text, max_tokens):
+    """Cut text to roughly max_tokens, marking the cut."""
+    text = text or ""
+    limit = max(max_tokens, 0) * CHARS_PER_TOKEN
+    if len(text) <= limit:
+        return text
+    return text[:max(limit - 3, 0)].rstrip() + "..."
+
+
+# ---------- Conversation context ----------
+
+_summary_executor = None
+_summaries_running = set()  # (namespace, user_id) with a refresh queued or running
+_summaries_lock = threading.Lock()
+
+
+def load_summary(namespace, user_id):
+    """(summary text, timestamp of the last turn it covers), or ("", "")."""
+    summary = conversation_memory.get_store().summary(namespace, user_id)
+    if not summary:
+        return "", ""
+    return summary["text"], summary["covered_through"]
+
+
+def turn_time(timestamp):
+    """A turn or coverage timestamp as an aware UTC datetime; "" sorts before every turn.
+
+    SQLite stores naive UTC ISO strings, Postgres returns them with an offset
+    and without zero microseconds, so the strings cannot be compared directly.
+    """
+    if not timestamp:
+        return datetime.min.replace(tzinfo=timezone.utc)
+    parsed = datetime.fromisoformat(timestamp)
+    if parsed.tzinfo is None:
+        return parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc)
+
+
+def fit_turns(turns, max_tokens, agent_label="Assistant"):
+    """The newest turns (oldest first) whose transcript fits in max_tokens."""
+    kept, used = [], 0
+    for turn in reversed(turns):
+        cost = estimate_tokens(conversation_memory.format_turns([turn], agent_label))
+        if used + cost > max_tokens:
+            break
+        kept.append(turn)
+        used += cost
+    return list(reversed(kept))
+
+
+def conversation_context(namespace, user_id, max_tokens=PROMPT_CONTEXT_TOKENS,
+                         recent_turns=PROMPT_RECENT_TURNS, agent_label="Assistant"):
+    """Rolling summary of older turns plus the most recent turns, within max_tokens."""
+    summary, _ = load_summary(namespace, user_id)
+    turns = conversation_memory.get_store().recent(namespace, user_id, recent_turns)
+    parts = []
+    if summary:
+        summary = truncate(summary, max_tokens // 2)
+        parts.append(f"Summary of earlier conversation: {summary}\n")
+    remaining = max_tokens - estimate_tokens("".join(parts))
+    parts.append(conversation_memory.format_turns(fit_turns(turns, remaining, agent_label), agent_label))
+    return "".join(parts)
+
+
+def refresh_summary(namespace, user_id, recent_turns=PROMPT_RECENT_TURNS, every=PROMPT_SUMMARY_EVERY):
+    """Fold older turns into the summary once `every` of them are not yet covered.
+
+    Returns True when the summary was rewritten.
+    """
+    store = conversation_memory.get_store()
+    summary, covered_through = load_summary(namespace, user_id)
+    history = store.recent(namespace, user_id)
+    older = history[:-recent_turns] if recent_turns else history
+    covered = turn_time(covered_through)
+    pending = [t for t in older if turn_time(t["timestamp"]) > covered]
+    if len(pending) < every:
+        return False
+
+    prompt = f"""Update the running summary of a conversation between a user and a personal finance assistant.
+Keep amounts, dates, categories, goals and stated preferences. At most 80 words, plain text.
+
+Current summary: {summary or "(none)"}
+New turns:{conversation_memory.format_turns(pending)}"""
+    prompt = truncate(prompt, PROMPT_TOKEN_BUDGET)
+    try:
+        response = model_registry.converse("summarize", prompt)
+    except Exception as e:
+        print(f"Summary refresh failed: {e}")
+        return False
+    text = model_registry.text(response).strip()
+    store.set_summary(namespace, user_id, text, pending[-1]["timestamp"])
+    return True
+
+
+def _refresh_in_background(key):
+    try:
+        with metrics.timer("prompt.summary_refresh"):
+            refresh_summary(*key)
+    except Exception as e:
+        print(f"Summary refresh failed: {e}")
+    finally:
+        with _summaries_lock:
+            _summaries_running.discard(key)
+
+
+def schedule_summary(namespace, user_id):
+    """Run refresh_summary on a background thread; the caller does not wait for it.
+
+    At most one refresh per (namespace, user) is queued at a time. A refresh
+    still running when the container is frozen resumes when it thaws; one that
+    is lost is redone on the user's next turn, since the pending turns are
+    counted again from the stored summary.
+    """
+    global _summary_executor
+    key = (namespace, str(user_id))
+    with _summaries_lock:
+        if key in _summaries_running:
+            return False
+        _summaries_running.add(key)
+        if _summary_executor is None:
+            _summary_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="summary")
+    _summary_executor.submit(_refresh_in_background, key)
+    return True
+
+
+# ---------- Result sets ----------
+
+def compact_rows(rows, max_tokens):
+    """JSON for a result set that fits in max_tokens.
+
+    Small results are passed through unchanged. Larger ones, and summaries
+    already produced by sql_guard, become the row count, per-column
+    aggregates and as many leading rows as still fit.
+    """
+    full = json.dumps(rows)
+    if estimate_tokens(full) <= max_tokens:
+        return full
+    if isinstance(rows, dict):
+        compact = dict(rows)
+    else:
+        aggregator = StreamingAggregator(sample_rows=len(rows))
+        for row in rows:
+            aggregator.add(row)
+        compact = aggregator.summary()
+    sample, compact["sample_rows"] = compact.get("sample_rows", []), []
+    for row in sample:
+        compact["sample_rows"].append(row)
+        if estimate_tokens(json.dumps(compact)) > max_tokens:
+            compact["sample_rows"].pop()
+            break
+    metrics.incr("prompt.rows_compacted")
+    return json.dumps(compact)
+
+
+# ---------- Logging ----------
+
+def log_prompt(name, prompt, response=None, model_id=None):
+    """Log the prompt's estimated size and, given the converse response, actual usage and latency."""
+    record = {"name": name, "chars": len(prompt), "est_input_tokens": estimate_tokens(prompt)}
+    if model_id:
+        record["model"] = model_id
+    if response is not None:
+        usage = response.get("usage", {})
+        record["input_tokens"] = usage.get("inputTokens")
+        record["output_tokens"] = usage.get("outputTokens")
+        record["latency_ms"] = response.get("metrics", {}).get("latencyMs")
+        record["fallback"] = bool(response.get("fallback"))
+    print(json.dumps({"prompt": record}))
@@ -0,0 +1,248 @@
+"""Guarded execution of model-generated SQL.
+
+Before a generated query runs it must be a single read-only SELECT/WITH
+statement, and the planner's estimated cost (EXPLAIN) must stay under
+SQL_MAX_COST. It then runs in a READ ONLY transaction with a per-statement
+timeout and an injected LIMIT. Rows are read in batches from a server-side
+cursor into a streaming aggregator. Small results come back as rows; larger
+ones become a row count, per-column statistics and a sample of leading rows,
+so neither Lambda memory nor the answer prompt grows with the table.
+
+`ensure_relations` checks a query against an allowlist of tables. The query
+itself runs as SQL_QUERY_ROLE, which can read nothing else, so the database
+enforces the same boundary if a check is ever fooled.
+"""
+import json
+import os
+import re
+
+import metrics
+
+SQL_MAX_COST = float(os.environ.get("SQL_MAX_COST", "200000"))
+SQL_TIMEOUT_MS = int(os.environ.get("SQL_TIMEOUT_MS", "5000"))
+SQL_MAX_ROWS = int(os.environ.get("SQL_MAX_ROWS", "10000"))  # injected LIMIT
+SQL_SAMPLE_ROWS = int(os.environ.get("SQL_SAMPLE_ROWS", "50"))  # rows returned verbatim
+SQL_FETCH_SIZE = int(os.environ.get("SQL_FETCH_SIZE", "500"))
+
+SQL_QUERY_ROLE = os.environ.get("SQL_QUERY_ROLE", "query_reader")  # "" runs as the connecting user
+
+# Strings and comments in one pass, so "--" inside a string is not taken for a comment
+_STRINGS_AND_COMMENTS = re.compile(r"'(?:[^']|'')*'|--[^\n]*|/\*.*?\*/", re.DOTALL)
+# Escape strings, Unicode strings and dollar quoting could hide code from the checks below
+_OPAQUE_QUOTING = re.compile(r"\b[EU]&?'|\$\w*\$", re.IGNORECASE)
+_FORBIDDEN = re.compile(
+    r"\b(insert|update|delete|merge|upsert|drop|alter|create|truncate|grant|revoke|copy|call|do|"
+    r"lock|vacuum|analyze|reindex|cluster|refresh|set|reset|listen|notify|prepare|execute|"
+    r"pg_sleep|pg_terminate_backend|pg_cancel_backend|pg_read_file|pg_read_binary_file|pg_ls_dir|"
+    r"pg_stat_file|lo_import|lo_export|lo_get|dblink|current_setting|set_config|\w*_to_xml\w*)\b",
+    re.IGNORECASE,
+)
+
+_TOKENS = re.compile(r'"(?:[^"]|"")*"|[A-Za-z_][\w$]*|\d+(?:\.\d+)?|\S')
+_QUERY_START = {"select", "with", "values"}
+_CLAUSE_END = {"where", "group", "having", "order", "limit", "offset", "union", "intersect", "except",
+               "window", "fetch", "for", "returning"}
+# Set-returning functions allowed in FROM (date series for gap filling, array unnesting)
+TABLE_FUNCTIONS = {"generate_series", "unnest"}
+_CTE_NAME = re.compile(
+    r'("(?:[^"]|"")*"|[A-Za-z_]\w*)\s*(?:\([^()]*\)\s*)?AS\s+(?:NOT\s+)?(?:MATERIALIZED\s+)?\(\s*(?:SELECT|WITH|VALUES)\b',
+    re.IGNORECASE,
+)
+
+
+class QueryRejected(ValueError):
+    """A generated query failed a guard check and was not run."""
+
+
+def _code(sql):
+    """The SQL with string literals emptied and comments removed."""
+    return _STRINGS_AND_COMMENTS.sub(lambda m: "''" if m.group(0).startswith("'") else " ", sql)
+
+
+def ensure_read_only(sql):
+    """Reject anything but a single SELECT or WITH statement without side effects."""
+    if _OPAQUE_QUOTING.search(_code(sql)):
+        raise QueryRejected("Escape strings and dollar quoting are not allowed")
+    code = _code(sql).strip().rstrip(";").strip()
+    if ";" in code:
+        raise QueryRejected("Only a single statement is allowed")
+    if not re.match(r"^(select|with)\b", code, re.IGNORECASE):
+        raise QueryRejected("Only SELECT queries are allowed")
+    match = _FORBIDDEN.search(code)
+    if match:
+        raise QueryRejected(f"Statement uses a disallowed keyword: {match.group(1).upper()}")
+
+
+def _identifier(token):
+    if token.startswith('"'):
+        return token[1:-1].replace('""', '"')
+    return token.lower()
+
+
+def referenced_relations(sql):
+    """Names of the tables, views and table functions a query reads (qualified names joined with ".").
+
+    Tracks which parentheses hold a query, so FROM inside EXTRACT(... FROM ...)
+    or SUBSTRING(... FROM ...) is not taken for a table reference.
+    """
+    tokens = _TOKENS.findall(_code(sql))
+    lowered = [t.lower() for t in tokens]
+    relations = []
+    contexts = [True]  # per parenthesis depth: does it hold a query?
+    from_list = [False]  # per depth: inside a FROM list, where a comma starts another relation
+    expect = False
+    i = 0
+    while i < len(tokens):
+        word = lowered[i]
+        if word == "(":
+            is_query = i + 1 < len(tokens) and lowered[i + 1] in _QUERY_START
+            if expect and not is_query:
+                raise QueryRejected("Unsupported FROM item")
+            expect = False
+            contexts.append(is_query)
+            from_list.append(False)
+        elif word == ")":
+            if len(contexts) > 1:
+                contexts.pop()
+                from_list.pop()
+        elif not contexts[-1]:
+            pass
+        elif expect:
+            if word in ("only", "lateral"):
+                i += 1
+                continue
+            parts = [_identifier(tokens[i])]
+            while i + 2 < len(tokens) and tokens[i + 1] == ".":
+                parts.append(_identifier(tokens[i + 2]))
+                i += 2
+            name = ".".join(parts)
+            if not (i + 1 < len(tokens) and tokens[i + 1] == "(" and name in TABLE_FUNCTIONS):
+                relations.append(name)
+            expect = False
+        elif word in ("from", "join") and not (word == "from" and i and lowered[i - 1] == "distinct"):
+            expect = True
+            from_list[-1] = True
+        elif word == "," and from_list[-1]:
+            expect = True
+        elif word in _CLAUSE_END or word == "select":
+            from_list[-1] = False
+        i += 1
+    return relations
+
+
+def cte_names(sql):
+    return {_identifier(name) for name in _CTE_NAME.findall(_code(sql))}
+
+
+def ensure_relations(sql, allowed):
+    """Reject a query that reads any relation other than `allowed` or its own CTEs."""
+    permitted = set(allowed) | cte_names(sql)
+    for name in referenced_relations(sql):
+        if name not in permitted:
+            metrics.incr("sql_guard.rejected_relation")
+            raise QueryRejected(f"Query reads a table it may not use: {name}")
+
+
+def with_limit(sql, limit):
+    """Wrap the query so it returns at most `limit` rows."""
+    return f"SELECT * FROM (\n{sql.strip().rstrip(';')}\n) AS guarded_result LIMIT {int(limit)}"
+
+
+def plan_cost(cursor, sql, params=None):
+    cursor.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+    plan = cursor.fetchone()[0]
+    if isinstance(plan, str):  # json not decoded by the driver
+        plan = json.loads(plan)
+    return float(plan[0]["Plan"]["Total Cost"])
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+class StreamingAggregator:
+    """Row count, per-column count/sum/min/max and the first rows of a result, in one pass."""
+
+    def __init__(self, sample_rows=SQL_SAMPLE_ROWS):
+        self.sample_size = sample_rows
+        self.row_count = 0
+        self.sample = []
+        self.columns = {}
+
+    def add(self, row):
+        self.row_count += 1
+        if len(self.sample) < self.sample_size:
+            self.sample.append(row)
+        for key, value in row.items():
+            if value is None:
+                continue
+            stats = self.columns.setdefault(key, {"count": 0})
+            stats["count"] += 1
+            if _is_number(value):
+                stats["sum"] = round(stats.get("sum", 0) + value, 2)
+            try:
+                if "min" not in stats or value < stats["min"]:
+                    stats["min"] = value
+                if "max" not in stats or value > stats["max"]:
+                    stats["max"] = value
+            except TypeError:
+                pass  # mixed types in one column; keep the first comparable bounds
+
+    def summary(self, truncated=False):
+        return {
+            "row_count": self.row_count,
+            "truncated": truncated,
+            "columns": self.columns,
+            "sample_rows": self.sample,
+        }
+
+    def result(self, truncated=False):
+        """The rows themselves when they all fit in the sample, else the summary."""
+        if self.row_count <= self.sample_size and not truncated:
+            return self.sample
+        return self.summary(truncated)
+
+
+def execute(conn, sql, params=None, convert=None, max_cost=SQL_MAX_COST, timeout_ms=SQL_TIMEOUT_MS,
+            max_rows=SQL_MAX_ROWS, sample_rows=SQL_SAMPLE_ROWS, role=SQL_QUERY_ROLE, user_id=None):
+    """Run a generated query under the guards; returns rows (list of dicts) or a summary dict.
+
+    `conn` must be at the start of its transaction (as from db.connection()).
+    `convert` is applied to each row dict before aggregation, e.g. to turn
+    Decimal and dates into JSON types. Raises QueryRejected when a check fails.
+
+    The query runs as `role` (see migrations/007_query_reader_role.sql). That
+    role may only SELECT the user-owned tables, and row-level security limits
+    it to the rows of `user_id`.
+    """
+    ensure_read_only(sql)
+    limited = with_limit(sql, max_rows + 1)  # one extra row tells us the limit was hit
+    with conn.cursor() as cursor:
+        cursor.execute("SET TRANSACTION READ ONLY")
+        cursor.execute("SELECT set_config('statement_timeout', %s, true)", (str(timeout_ms),))
+        if role:
+            cursor.execute("SELECT set_config('app.user_id', %s, true)", (str(user_id or ""),))
+            cursor.execute("SELECT set_config('role', %s, true)", (role,))
+        cost = plan_cost(cursor, limited, params)
+    if cost > max_cost:
+        metrics.incr("sql_guard.rejected_cost")
+        raise QueryRejected(f"Query is too expensive to run (estimated cost {cost:.0f} > {max_cost:.0f})")
+
+    aggregator = StreamingAggregator(sample_rows)
+    truncated = False
+    with metrics.timer("sql_guard.execute"), conn.cursor(name="guarded_query") as cursor:
+        cursor.itersize = SQL_FETCH_SIZE
+        cursor.execute(limited, params)
+        columns = None
+        for row in cursor:
+            if columns is None:
+                columns = [desc[0] for desc in cursor.description]
+            if aggregator.row_count >= max_rows:
+                truncated = True
+                break
+            record = dict(zip(columns, row))
+            aggregator.add(convert(record) if convert else record)
+    metrics.incr("sql_guard.rows", aggregator.row_count)
+    if truncated or aggregator.row_count > sample_rows:
+        metrics.incr("sql_guard.summarized")
+    return aggregator.result(truncated)
@@ -0,0 +1,195 @@
+"""Parameterized NL-to-SQL templates learned from successful generations.
+
+Questions are reduced to a shape by replacing slot values (numbers, ISO dates,
+"<month> <year>" and category names) with placeholders: "spent on grocery in
+october 2025" and "spent on transport in may 2024" share the shape
+"spent on slotcat in slotmonth". When a generated query runs successfully, each
+slot value is located in its SQL and replaced by a marker, and the result is
+stored as the template for that shape. A later question with the same shape
+binds its own values into the template and skips the model call.
+
+Templates are only learned when every date literal in the SQL came from a slot
+(so "this month"-style questions keep using CURRENT_DATE) and never for
+follow-up questions that lean on conversation context ("and last month?").
+"""
+import re
+from datetime import date
+
+import metrics
+from cache import normalize_text
+from extraction import GOAL_CATEGORIES, TRANSACTION_CATEGORIES
+
+MONTHS = ["january", "february", "march", "april", "may", "june", "july", "august", "september",
+          "october", "november", "december"]
+CATEGORIES = sorted(set(TRANSACTION_CATEGORIES + GOAL_CATEGORIES) - {"other"})
+
+_ISO_DATE = re.compile(r"\b(\d{4})-(\d{2})-(\d{2})\b")
+_MONTH_YEAR = re.compile(
+    r"\b(" + "|".join(m[:3] + r"(?:" + m[3:] + r")?" for m in MONTHS) + r")\.?,?\s+(\d{4})\b"
+)
+_NUMBER = re.compile(r"(?<![\w.])(\d+(?:,\d{2,3})*(?:\.\d+)?)(?![\w.])")
+_CATEGORY = re.compile(r"\b(" + "|".join(CATEGORIES) + r")\b")
+_MARKER = re.compile(r"\{slot(\d+)\.(\w+)\}")
+_SQL_DATE = re.compile(r"'\d{4}-\d{2}-\d{2}'|\b(?:19|20)\d{2}\b")
+# Follow-ups whose meaning depends on the previous turn
+_CONTEXTUAL = re.compile(
+    r"^(and|also|what about|how about)\b|\b(it|its|that one|those|them|these|same|previous|again)\b"
+)
+
+
+def _month_start(year, month):
+    return date(year + (month - 1) // 12, (month - 1) % 12 + 1, 1)
+
+
+def _month_renderings(match):
+    """The [start, end) range a month-year mention becomes in SQL."""
+    month = next(i for i, name in enumerate(MONTHS, 1) if name.startswith(match.group(1)[:3]))
+    year = int(match.group(2))
+    return {"start": _month_start(year, month).isoformat(), "end": _month_start(year, month + 1).isoformat()}
+
+
+def extract_slots(question):
+    """(shape, slots) for a question; each slot is (kind, {rendering: sql literal})."""
+    text = (question or "").lower()
+    found = []  # (position, kind, renderings)
+
+    def take(pattern, kind, render):
+        nonlocal text
+        def replace(match):
+            found.append((match.start(), kind, render(match)))
+            return f" slot{kind} "
+        text = pattern.sub(replace, text)
+
+    take(_ISO_DATE, "date", lambda m: {"value": m.group(0)})
+    take(_MONTH_YEAR, "month", _month_renderings)
+    take(_NUMBER, "num", lambda m: {"value": _plain_number(m.group(1))})
+    text = normalize_text(text)
+    take(_CATEGORY, "cat", lambda m: {"value": m.group(1)})
+    shape = normalize_text(text)
+    return shape, _order_slots(shape, found)
+
+
+def _plain_number(raw):
+    value = raw.replace(",", "")
+    if "." in value:
+        value = value.rstrip("0").rstrip(".")
+    return value
+
+
+def _order_slots(shape, found):
+    """Slots in the order their placeholders appear in the shape.
+
+    Each kind is substituted in its own pass, so positions are only comparable
+    within a kind.
+    """
+    by_kind = {}
+    for _, kind, renderings in sorted(found, key=lambda f: f[0]):
+        by_kind.setdefault(kind, []).append((kind, renderings))
+    ordered = []
+    for token in shape.split():
+        if token.startswith("slot") and by_kind.get(token[4:]):
+            ordered.append(by_kind[token[4:]].pop(0))
+    return ordered
+
+
+def is_contextual(question):
+    return bool(_CONTEXTUAL.search(normalize_text(question)))
+
+
+def _literal_pattern(kind, literal):
+    if kind == "cat":
+        return re.compile(r"(?<=['%])" + re.escape(literal) + r"(?=['%])", re.IGNORECASE)
+    if kind == "num":
+        return re.compile(r"(?<![\w.-])" + re.escape(literal) + r"(?![\w.-])")
+    return re.compile(r"(?<=')" + re.escape(literal) + r"(?=')")
+
+
+def make_template(sql, slots):
+    """Replace slot literals in sql with markers.
+
+    Returns (template, fixed) where fixed maps slot index -> renderings for slots
+    the SQL does not use (they must match exactly on reuse), or None when the
+    SQL cannot be safely parameterized.
+    """
+    literals = [literal for _, renderings in slots for literal in renderings.values()]
+    if len(literals) != len(set(literals)):
+        return None  # two slots share a literal; we could not tell them apart
+    template, fixed = sql, {}
+    for index, (kind, renderings) in enumerate(slots):
+        used = False
+        for name, literal in renderings.items():
+            template, count = _literal_pattern(kind, literal).subn(f"{{slot{index}.{name}}}", template)
+            used = used or count > 0
+        if not used:
+            fixed[str(index)] = renderings
+    if _SQL_DATE.search(_MARKER.sub("", template)):
+        return None  # a hard-coded date or year that no slot explains
+    return template, fixed
+
+
+def bind(template, slots):
+    """Fill a template's markers with this question's slot literals."""
+    def replace(match):
+        return slots[int(match.group(1))][1][match.group(2)]
+    return _MARKER.sub(replace, template)
+
+
+class SQLTemplateCache:
+    """Shape -> template entries in a TieredCache (LRU eviction, optional shared store).
+
+    Reports `sql_template.hit` / `.miss` counters and `sql_template.saved_ms`,
+    the generation latency recorded when each reused template was learned.
+    """
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    def lookup(self, question):
+        """Bound SQL for the question, or None when no template applies."""
+        if is_contextual(question):
+            return None
+        shape, slots = extract_slots(question)
+        entry = self.cache.get(shape)
+        if entry is None or len(entry["kinds"]) != len(slots):
+            metrics.incr("sql_template.miss")
+            return None
+        if [kind for kind, _ in slots] != entry["kinds"] or any(
+            slots[int(index)][1] != renderings for index, renderings in entry["fixed"].items()
+        ):
+            metrics.incr("sql_template.miss")
+            return None
+        metrics.incr("sql_template.hit")
+        metrics.incr("sql_template.saved_ms", int(entry.get("generation_ms", 0)))
+        return bind(entry["sql"], slots)
+
+    def learn(self, question, sql, generation_ms=0):
+        """Store the template behind a successful generation; True when stored."""
+        if is_contextual(question):
+            return False
+        shape, slots = extract_slots(question)
+        if len(shape.split()) < 2:
+            return False
+        made = make_template(sql, slots)
+        if made is None:
+            return False
+        template, fixed = made
+        self.cache.set(shape, {
+            "sql": template,
+            "kinds": [kind for kind, _ in slots],
+            "fixed": fixed,
+            "generation_ms": round(generation_ms),
+        })
+        metrics.incr("sql_template.learned")
+        return True
+
+    def stats(self):
+        hits = metrics.counter("sql_template.hit")
+        misses = metrics.counter("sql_template.miss")
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / (hits + misses), 3) if hits + misses else 0.0,
+            "learned": metrics.counter("sql_template.learned"),
+            "saved_ms": metrics.counter("sql_template.saved_ms"),
+            "size": len(self.cache.local),
+        }
@@ -0,0 +1,115 @@
+"""Cold-start helpers: lazy imports and optional import-time profiling.
+
+Import this module first in every handler. With STARTUP_PROFILE=1 every module
+imported afterwards is timed, and the first invocation logs one JSON line with
+the container init duration and the slowest imports.
+"""
+import importlib
+import json
+import os
+import sys
+import threading
+import time
+import types
+
+import metrics
+
+INIT_STARTED = time.perf_counter()
+STARTUP_PROFILE = os.environ.get("STARTUP_PROFILE") == "1"
+PROFILE_TOP_N = int(os.environ.get("STARTUP_PROFILE_TOP_N", "25"))
+
+_import_times = {}  # module name -> cumulative import time in ms
+_reported = False
+
+
+# ---- Lazy imports ----
+
+class _LazyModule(types.ModuleType):
+    """Placeholder that imports the real module on first attribute access."""
+
+    def __init__(self, name):
+        super().__init__(name)
+        self.__dict__["_module"] = None
+        self.__dict__["_load_lock"] = threading.Lock()
+
+    def _load(self):
+        module = self.__dict__["_module"]
+        if module is None:
+            with self.__dict__["_load_lock"]:
+                module = self.__dict__["_module"]
+                if module is None:
+                    started = time.perf_counter()
+                    module = importlib.import_module(self.__name__)
+                    elapsed = (time.perf_counter() - started) * 1000
+                    metrics.observe(f"import.{self.__name__}", elapsed)
+                    _import_times.setdefault(self.__name__, round(elapsed, 2))
+                    self.__dict__["_module"] = module
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+
+def lazy_import(name):
+    """Return a module proxy; the import cost is paid only when it is first used."""
+    if name in sys.modules:
+        return sys.modules[name]
+    return _LazyModule(name)
+
+
+# ---- Import profiling ----
+
+class _TimedLoader:
+    def __init__(self, loader):
+        self._loader = loader
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        started = time.perf_counter()
+        try:
+            self._loader.exec_module(module)
+        finally:
+            _import_times[module.__name__] = round((time.perf_counter() - started) * 1000, 2)
+
+    def __getattr__(self, attr):
+        return getattr(self._loader, attr)
+
+
+class _TimingFinder:
+    """Meta path hook that wraps every loader to measure module execution time."""
+
+    def find_spec(self, name, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(name, path, target)
+            if spec is not None:
+                if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+                    spec.loader = _TimedLoader(spec.loader)
+                return spec
+        return None
+
+
+if STARTUP_PROFILE:
+    sys.meta_path.insert(0, _TimingFinder())
+
+
+def import_times():
+    """Cumulative import time per module (includes the modules it imported)."""
+    return dict(_import_times)
+
+
+def report_once():
+    """Log init duration and slowest imports on the first invocation of a container."""
+    global _reported
+    if _reported:
+        return
+    _reported = True
+    init_ms = round((time.perf_counter() - INIT_STARTED) * 1000, 2)
+    metrics.observe("startup.init", init_ms)
+    if not STARTUP_PROFILE:
+        return
+    slowest = sorted(_import_times.items(), key=lambda item: item[1], reverse=True)[:PROFILE_TOP_N]
+    print(json.dumps({"startup": {"init_ms": init_ms, "imports_ms": dict(slowest)}}))
@@ -0,0 +1,126 @@
+"""Streamed model replies shown progressively in Telegram.
+
+`converse_text` calls Bedrock `converse_stream` when a chat id is given. The
+first text chunk is sent to the chat with sendMessage, and the message is
+then edited in place with editMessageText at most every STREAM_EDIT_INTERVAL
+seconds while tokens arrive, plus once at the end. Without a chat id it falls
+back to a blocking `converse`. The full text is returned either way.
+
+If the stream breaks off after text was shown, the partial message is edited
+into the fallback text (or STREAM_ERROR_TEXT when there is no fallback), and
+that text is returned. The chat then holds one complete message, and the
+caller still reports the reply as streamed, so the router sends nothing more.
+
+Per reply it records `stream.first_token` (request to first chunk),
+`stream.first_visible` (request to the first Telegram message) and
+`stream.total`.
+"""
+import os
+import time
+
+import bedrock_gateway
+import metrics
+import model_registry
+import telegram
+
+STREAM_REPLIES = os.environ.get("STREAM_REPLIES", "0") == "1"
+STREAM_EDIT_INTERVAL = float(os.environ.get("STREAM_EDIT_INTERVAL", "1.0"))  # Telegram allows ~1 edit/s per chat
+TELEGRAM_MAX_CHARS = 4096
+STREAM_ERROR_TEXT = "Sorry, I couldn't finish that reply. Please try again in a moment."
+
+
+class TelegramStreamWriter:
+    """Accumulates streamed text into one Telegram message, throttling edits."""
+
+    def __init__(self, chat_id, interval=STREAM_EDIT_INTERVAL, started=None):
+        self.chat_id = chat_id
+        self.interval = interval
+        self.started = started or time.perf_counter()
+        self.text = ""
+        self.sent_text = ""
+        self.message_id = None
+        self.last_edit = 0.0
+        self.edits = 0
+
+    def write(self, delta):
+        self.text += delta
+        if not self.text.strip():
+            return
+        now = time.perf_counter()
+        if self.message_id is None:
+            result = telegram.call("sendMessage", chat_id=self.chat_id, text=self._visible())
+            self.message_id = result["message_id"]
+            self.sent_text, self.last_edit = self._visible(), now
+            metrics.observe("stream.first_visible", (now - self.started) * 1000)
+        elif now - self.last_edit >= self.interval:
+            self._edit(now)
+
+    def replace(self, text):
+        """Show `text` instead of whatever was streamed so far."""
+        self.text = text
+        if self.message_id is None:
+            self.write("")
+        else:
+            self._edit(time.perf_counter())
+
+    def close(self):
+        """Push whatever arrived since the last edit."""
+        if self.message_id is not None and self._visible() != self.sent_text:
+            self._edit(time.perf_counter())
+
+    def _visible(self):
+        return self.text.strip()[:TELEGRAM_MAX_CHARS]
+
+    def _edit(self, now):
+        visible = self._visible()
+        if visible == self.sent_text:
+            return
+        telegram.call("editMessageText", chat_id=self.chat_id, message_id=self.message_id, text=visible)
+        self.sent_text, self.last_edit = visible, now
+        self.edits += 1
+
+
+def converse_text(task, prompt, chat_id=None, fallback=None):
+    """Reply text for a single-turn prompt of a model_registry task, streamed to `chat_id` when given.
+
+    `fallback()` supplies the text when Bedrock is unavailable (see bedrock_gateway).
+    """
+    if chat_id is None:
+        return model_registry.text(model_registry.converse(task, prompt, fallback=fallback)).strip()
+
+    model_id, _, inference = model_registry.config(task)
+    started = time.perf_counter()
+    writer = TelegramStreamWriter(chat_id, started=started)
+    try:
+        response = bedrock_gateway.converse_stream(
+            modelId=model_id, messages=[{"role": "user", "content": [{"text": prompt}]}], inferenceConfig=inference
+        )
+    except bedrock_gateway.BedrockUnavailable:
+        if fallback is None:
+            raise
+        metrics.incr("bedrock.fallbacks")
+        metrics.incr(f"model.{task}.fallbacks")
+        writer.write(fallback())
+        writer.close()
+        return writer.text.strip()
+    usage = {}
+    try:
+        for event in response["stream"]:
+            if "contentBlockDelta" in event:
+                delta = event["contentBlockDelta"]["delta"].get("text", "")
+                if delta and not writer.text:
+                    metrics.observe("stream.first_token", (time.perf_counter() - started) * 1000)
+                writer.write(delta)
+            elif "metadata" in event:
+                usage = event["metadata"]  # carries usage and metrics like a converse response
+    except Exception as e:
+        print(f"Stream interrupted after {len(writer.text)} chars: {e}")
+        metrics.incr("stream.interrupted")
+        writer.replace(fallback() if fallback is not None else STREAM_ERROR_TEXT)
+        return writer.text.strip()
+    writer.close()
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    metrics.observe("stream.total", elapsed_ms)
+    metrics.incr("stream.edits", writer.edits)
+    model_registry.record(task, model_id, prompt, usage, elapsed_ms)
+    return writer.text.strip()
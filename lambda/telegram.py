@@ -0,0 +1,32 @@
+"""Minimal Telegram Bot API client (standard library only)."""
+import json
+import os
+import urllib.request
+
+TELEGRAM_BOT_TOKEN = os.environ.get("TELEGRAM_BOT_TOKEN", "")
+API_BASE = "https://api.telegram.org"
+TIMEOUT = float(os.environ.get("TELEGRAM_TIMEOUT", "10"))
+
+
+def call(method, **params):
+    """POST a Bot API method and return its `result`."""
+    request = urllib.request.Request(
+        f"{API_BASE}/bot{TELEGRAM_BOT_TOKEN}/{method}",
+        data=json.dumps(params).encode(),
+        headers={"Content-Type": "application/json"},
+    )
+    with urllib.request.urlopen(request, timeout=TIMEOUT) as response:
+        payload = json.loads(response.read().decode())
+    if not payload.get("ok"):
+        raise RuntimeError(f"Telegram {method} failed: {payload.get('description')}")
+    return payload.get("result")
+
+
+def download_file(file_id, max_bytes=5 * 1024 * 1024):
+    """Download an uploaded document (e.g. a CSV statement) as text."""
+    file_info = call("getFile", file_id=file_id)
+    if file_info.get("file_size", 0) > max_bytes:
+        raise ValueError("File is too large to import")
+    url = f"{API_BASE}/file/bot{TELEGRAM_BOT_TOKEN}/{file_info['file_path']}"
+    with urllib.request.urlopen(url, timeout=TIMEOUT) as response:
+        return response.read(max_bytes + 1).decode("utf-8-sig", errors="replace")
@@ -0,0 +1,128 @@
+"""Deterministic parser for common, simply structured transaction messages.
+
+Handles amounts with currency symbols and k/lakh suffixes, debit/credit verbs,
+relative dates (today, yesterday, last Friday, 3 days ago) and a category
+keyword map. Returns None whenever any field is missing or ambiguous so the
+message falls through to the LLM.
+"""
+import re
+from datetime import date, timedelta
+
+DEBIT_WORDS = ["spent", "spend", "paid", "pay", "bought", "buy", "purchased", "debited", "withdrew",
+               "withdrawn", "sent", "transferred", "gave", "lost"]
+CREDIT_WORDS = ["received", "receive", "credited", "got", "earned", "earn", "refund", "refunded",
+                "cashback", "salary", "income", "deposited"]
+
+CATEGORY_KEYWORDS = {
+    "salary": ["salary", "payroll", "paycheck", "stipend", "wages"],
+    "grocery": ["grocery", "groceries", "vegetables", "veggies", "fruits", "milk", "supermarket", "bigbasket",
+                "blinkit", "zepto", "dmart", "kirana"],
+    "entertainment": ["movie", "movies", "netflix", "spotify", "prime", "hotstar", "concert", "game", "games",
+                      "cinema", "pvr"],
+    "utility": ["electricity", "water bill", "gas bill", "internet", "wifi", "broadband", "recharge", "mobile bill",
+                "phone bill", "dth", "bill"],
+    "restaurant": ["restaurant", "dinner", "lunch", "breakfast", "cafe", "coffee", "swiggy", "zomato", "pizza",
+                   "burger", "food"],
+    "transport": ["uber", "ola", "rapido", "taxi", "cab", "auto", "metro", "bus", "train", "fuel", "petrol",
+                  "diesel", "parking", "toll", "flight"],
+}
+
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+
+_MULTIPLIERS = {"k": 1_000, "thousand": 1_000, "lakh": 100_000, "lakhs": 100_000, "lac": 100_000,
+                "lacs": 100_000, "l": 100_000, "cr": 10_000_000, "crore": 10_000_000, "crores": 10_000_000}
+
+_NUMBER = r"\d+(?:,\d{2,3})*(?:\.\d+)?"
+_CURRENCY_AMOUNT = re.compile(r"(?:₹|rs\.?|inr|\$)\s*(" + _NUMBER + r")\s*(k|thousand|lakhs?|lacs?|l|cr|crores?)?\b")
+_SUFFIX_AMOUNT = re.compile(r"\b(" + _NUMBER + r")\s*(k|thousand|lakhs?|lacs?|l|cr|crores?|rs|rupees|inr|/-)(?=\W|$)")
+_BARE_NUMBER = re.compile(r"(?<![\w/:-])(" + _NUMBER + r")(?![\w/:-])")
+# Anything that looks like an explicit calendar date is left to the LLM
+_EXPLICIT_DATE = re.compile(
+    r"\b\d{1,4}[/-]\d{1,2}(?:[/-]\d{1,4})?\b|\b\d{1,2}(?:st|nd|rd|th)\b|"
+    r"\b(?:jan|feb|mar|apr|may|jun|jul|aug|sep|sept|oct|nov|dec)[a-z]*\b"
+)
+
+
+def _to_number(text, suffix=None):
+    value = float(text.replace(",", ""))
+    if suffix in _MULTIPLIERS:
+        value *= _MULTIPLIERS[suffix]
+    return value
+
+
+def parse_amount(text):
+    """Return the single amount mentioned in `text`, or None if missing/ambiguous."""
+    amounts = [_to_number(m.group(1), m.group(2)) for m in _CURRENCY_AMOUNT.finditer(text)]
+    if not amounts:
+        amounts = [_to_number(m.group(1), m.group(2)) for m in _SUFFIX_AMOUNT.finditer(text)]
+    if not amounts:
+        amounts = [_to_number(m.group(1)) for m in _BARE_NUMBER.finditer(text)]
+    amounts = set(a for a in amounts if a > 0)
+    if len(amounts) != 1:
+        return None
+    amount = amounts.pop()
+    return int(amount) if amount == int(amount) else round(amount, 2)
+
+
+def _has_word(text, words):
+    return any(re.search(r"\b" + re.escape(word) + r"\b", text) for word in words)
+
+
+def parse_type(text):
+    debit = _has_word(text, DEBIT_WORDS)
+    credit = _has_word(text, CREDIT_WORDS)
+    if debit == credit:
+        return None
+    return "debit" if debit else "credit"
+
+
+def parse_date(text, today):
+    """Resolve relative dates; no date mentioned means today, explicit dates give None."""
+    match = re.search(r"\b(\d+)\s+days?\s+ago\b", text)
+    if match:
+        return today - timedelta(days=int(match.group(1)))
+    if "day before yesterday" in text:
+        return today - timedelta(days=2)
+    if re.search(r"\byesterday\b", text):
+        return today - timedelta(days=1)
+    match = re.search(r"\b(?:last|on|this past)\s+(" + "|".join(WEEKDAYS) + r")\b", text)
+    if match:
+        days_back = (today.weekday() - WEEKDAYS.index(match.group(1))) % 7 or 7
+        return today - timedelta(days=days_back)
+    if _EXPLICIT_DATE.search(text) or _has_word(text, WEEKDAYS):
+        return None
+    return today
+
+
+def parse_category(text, transaction_type):
+    matches = [category for category, words in CATEGORY_KEYWORDS.items() if _has_word(text, words)]
+    if "salary" in matches:
+        return "salary" if transaction_type == "credit" else None
+    if len(matches) != 1:
+        return None
+    return matches[0]
+
+
+def parse_transaction(message, today=None):
+    """Return the transaction fields when every one of them is unambiguous, else None."""
+    today = today or date.today()
+    text = (message or "").lower().strip()
+    if not text or "\n" in text:
+        return None
+
+    transaction_date = parse_date(text, today)
+    # Remove relative-date numbers ("3 days ago") before looking for the amount
+    amount = parse_amount(re.sub(r"\b\d+\s+days?\s+ago\b", " ", text))
+    transaction_type = parse_type(text)
+    if transaction_type is None and _has_word(text, CATEGORY_KEYWORDS["salary"]):
+        transaction_type = "credit"
+    category = parse_category(text, transaction_type)
+
+    if None in (amount, transaction_type, transaction_date, category):
+        return None
+    return {
+        "amount": amount,
+        "transaction_type": transaction_type,
+        "transaction_date": transaction_date.isoformat(),
+        "category": category,
+    }
@@ -0,0 +1,83 @@
+"""Writes to the transactions table, shared by single and bulk ingestion.
+
+Every insert also updates the daily_spending rollup and bumps the user's data
+version in the same database transaction, so budget summaries never need to
+scan raw transactions and cached query answers are invalidated.
+"""
+from decimal import Decimal
+
+import data_version
+from startup import lazy_import
+
+psycopg2_extras = lazy_import("psycopg2.extras")
+
+INSERT_SQL = """
+    INSERT INTO transactions (user_id, amount, transaction_type, transaction_date, category, raw_message)
+    VALUES %s
+"""
+
+ROLLUP_SQL = """
+    INSERT INTO daily_spending (user_id, day, category, spent, earned, txn_count)
+    VALUES %s
+    ON CONFLICT (user_id, day, category) DO UPDATE SET
+        spent = daily_spending.spent + EXCLUDED.spent,
+        earned = daily_spending.earned + EXCLUDED.earned,
+        txn_count = daily_spending.txn_count + EXCLUDED.txn_count
+"""
+
+
+def _values(row):
+    return (
+        row["user_id"],
+        row.get("amount"),
+        row.get("transaction_type"),
+        row.get("transaction_date"),
+        row.get("category"),
+        row.get("raw_message"),
+    )
+
+
+def rollup_deltas(rows):
+    """Aggregate rows into (user_id, day, category, spent, earned, count), sorted to keep lock order stable."""
+    deltas = {}
+    for row in rows:
+        if not row.get("transaction_date"):
+            continue  # undated rows cannot be attributed to a day
+        key = (row["user_id"], str(row.get("transaction_date")), row.get("category") or "other")
+        spent, earned, count = deltas.get(key, (Decimal(0), Decimal(0), 0))
+        amount = Decimal(str(row.get("amount") or 0))
+        if row.get("transaction_type") == "debit":
+            spent += amount
+        elif row.get("transaction_type") == "credit":
+            earned += amount
+        deltas[key] = (spent, earned, count + 1)
+    return [key + value for key, value in sorted(deltas.items())]
+
+
+def insert_transactions(cursor, rows, page_size=500):
+    """Insert rows (dicts of user_id, transaction fields and raw_message) with multi-row INSERTs."""
+    if not rows:
+        return 0
+    psycopg2_extras.execute_values(cursor, INSERT_SQL, [_values(row) for row in rows], page_size=page_size)
+    deltas = rollup_deltas(rows)
+    if deltas:
+        psycopg2_extras.execute_values(cursor, ROLLUP_SQL, deltas, page_size=page_size)
+    data_version.bump(cursor, (row["user_id"] for row in rows))
+    return len(rows)
+
+
+def insert_transactions_isolated(cursor, rows):
+    """Insert rows one at a time under savepoints so a bad row cannot abort the rest.
+
+    Returns a list of (index, error message) for the rows that failed.
+    """
+    errors = []
+    for index, row in enumerate(rows):
+        cursor.execute("SAVEPOINT bulk_row")
+        try:
+            insert_transactions(cursor, [row])
+            cursor.execute("RELEASE SAVEPOINT bulk_row")
+        except Exception as e:
+            cursor.execute("ROLLBACK TO SAVEPOINT bulk_row")
+            errors.append((index, str(e).strip()))
+    return errors
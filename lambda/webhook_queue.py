@@ -0,0 +1,115 @@
+"""Background processing of webhook updates after an immediate acknowledgement.
+
+The router puts each accepted update on a queue as a job
+{"update": ..., "received_at": epoch seconds} and returns to Telegram at once.
+Two queues are available:
+
+- "lambda": an `Event` (asynchronous) invoke of the worker function, by default
+  the router itself; Lambda's own async queue buffers and retries the job.
+- "local": an in-process queue drained by a daemon thread. This is a stand-in
+  for local runs and tests; on Lambda a frozen container pauses it.
+
+Metrics: `webhook.enqueued`, `.processed` and `.failed` counters,
+`webhook.end_to_end` (receipt to reply sent) and the local queue depth.
+"""
+import json
+import os
+import queue
+import threading
+import time
+
+import aws_clients
+import metrics
+
+WEBHOOK_WORKER_LAMBDA = os.environ.get("WEBHOOK_WORKER_LAMBDA") or os.environ.get("AWS_LAMBDA_FUNCTION_NAME")
+
+
+def run_job(handler, job):
+    """Process one job and record its outcome and end-to-end latency."""
+    try:
+        handler(job)
+        metrics.incr("webhook.processed")
+    except Exception as e:
+        metrics.incr("webhook.failed")
+        print(f"Background update failed: {e}")
+    finally:
+        metrics.observe("webhook.end_to_end", (time.time() - job["received_at"]) * 1000)
+
+
+class LocalQueue:
+    """In-process queue with one daemon worker thread."""
+
+    def __init__(self, handler):
+        self.handler = handler
+        self._queue = queue.Queue()
+        self._worker = None
+        self._lock = threading.Lock()
+
+    def put(self, job):
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._drain, name="webhook-worker", daemon=True)
+                self._worker.start()
+        self._queue.put(job)
+        metrics.incr("webhook.enqueued")
+
+    def _drain(self):
+        while True:
+            job = self._queue.get()
+            try:
+                run_job(self.handler, job)
+            finally:
+                self._queue.task_done()
+
+    def depth(self):
+        return self._queue.unfinished_tasks
+
+    def flush(self, timeout=30.0):
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return not self._queue.unfinished_tasks
+
+
+class LambdaEventQueue:
+    """Hands each job to the worker function with an asynchronous `Event` invoke."""
+
+    def __init__(self, function_name=WEBHOOK_WORKER_LAMBDA, event_key="async_update"):
+        self.function_name = function_name
+        self.event_key = event_key
+
+    def put(self, job):
+        if not self.function_name:
+            raise RuntimeError("WEBHOOK_WORKER_LAMBDA is not configured")
+        aws_clients.lambda_client().invoke(
+            FunctionName=self.function_name,
+            InvocationType="Event",
+            Payload=json.dumps({self.event_key: job}),
+        )
+        metrics.incr("webhook.enqueued")
+
+    def depth(self):
+        return None  # held by Lambda's async queue; see the AsyncEventAge metric
+
+    def flush(self, timeout=0):
+        return True
+
+
+def make_queue(kind, handler):
+    """Build the queue selected by WEBHOOK_QUEUE ("lambda" or "local")."""
+    if kind == "local":
+        return LocalQueue(handler)
+    return LambdaEventQueue()
+
+
+def stats(job_queue):
+    e2e = metrics.snapshot("webhook.end_to_end").get("webhook.end_to_end", {})
+    return {
+        "queue": type(job_queue).__name__,
+        "queue_depth": job_queue.depth(),
+        "enqueued": metrics.counter("webhook.enqueued"),
+        "processed": metrics.counter("webhook.processed"),
+        "failed": metrics.counter("webhook.failed"),
+        "end_to_end_p50_ms": e2e.get("p50_ms"),
+        "end_to_end_p99_ms": e2e.get("p99_ms"),
+    }
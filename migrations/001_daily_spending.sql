@@ -0,0 +1,11 @@
+-- Per-day, per-category spending rollup maintained by every transaction insert
+-- (see lambda/transaction_store.py). Populate existing data with
+-- scripts/backfill_rollups.py.
+CREATE TABLE IF NOT EXISTS daily_spending (
+    day         DATE           NOT NULL,
+    category    TEXT           NOT NULL,
+    spent       NUMERIC(14, 2) NOT NULL DEFAULT 0,
+    earned      NUMERIC(14, 2) NOT NULL DEFAULT 0,
+    txn_count   INTEGER        NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, category)
+);
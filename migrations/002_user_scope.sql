@@ -0,0 +1,12 @@
+-- Carry a user dimension (the Telegram chat id) on every table. Rows written
+-- before this migration belong to 'default_user', the query agent's old default.
+ALTER TABLE transactions ADD COLUMN IF NOT EXISTS user_id TEXT NOT NULL DEFAULT 'default_user';
+ALTER TABLE goal ADD COLUMN IF NOT EXISTS user_id TEXT NOT NULL DEFAULT 'default_user';
+ALTER TABLE daily_spending ADD COLUMN IF NOT EXISTS user_id TEXT NOT NULL DEFAULT 'default_user';
+
+-- Per-user range reads stay index-driven regardless of the total user count
+CREATE INDEX IF NOT EXISTS transactions_user_date_idx ON transactions (user_id, transaction_date);
+CREATE INDEX IF NOT EXISTS goal_user_date_idx ON goal (user_id, target_date);
+
+ALTER TABLE daily_spending DROP CONSTRAINT IF EXISTS daily_spending_pkey;
+ALTER TABLE daily_spending ADD PRIMARY KEY (user_id, day, category);
@@ -0,0 +1,65 @@
+-- Monthly range partitioning of transactions on transaction_date.
+--
+-- Partitions are named transactions_pYYYYMM. Rows whose month has no partition
+-- yet (or is older than the ten years of history partitioned here) land in
+-- transactions_default until create_transaction_partition() moves them into
+-- their month. transaction_date is the partition key, so it becomes NOT NULL
+-- and the primary key is (id, transaction_date). Future months are
+-- created ahead of time by lambda/partition_maintenance.py, which also detaches
+-- partitions past the retention window.
+
+CREATE OR REPLACE FUNCTION create_transaction_partition(month DATE) RETURNS TEXT AS $$
+DECLARE
+    month_start DATE := date_trunc('month', month)::date;
+    month_end   DATE := (date_trunc('month', month) + INTERVAL '1 month')::date;
+    part_name   TEXT := 'transactions_p' || to_char(month_start, 'YYYYMM');
+BEGIN
+    IF to_regclass(part_name) IS NOT NULL THEN
+        RETURN part_name;
+    END IF;
+    EXECUTE format('CREATE TABLE %I (LIKE transactions INCLUDING DEFAULTS)', part_name);
+    -- Rows that arrived before the partition existed sit in the default partition
+    EXECUTE format(
+        'WITH moved AS (DELETE FROM transactions_default WHERE transaction_date >= %L AND transaction_date < %L RETURNING *)
+         INSERT INTO %I SELECT * FROM moved',
+        month_start, month_end, part_name);
+    EXECUTE format('ALTER TABLE transactions ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                   part_name, month_start, month_end);
+    RETURN part_name;
+END;
+$$ LANGUAGE plpgsql;
+
+UPDATE transactions SET transaction_date = COALESCE(created_at::date, CURRENT_DATE) WHERE transaction_date IS NULL;
+
+ALTER TABLE transactions RENAME TO transactions_unpartitioned;
+ALTER INDEX IF EXISTS transactions_user_date_idx RENAME TO transactions_unpartitioned_user_date_idx;
+
+CREATE TABLE transactions (LIKE transactions_unpartitioned INCLUDING DEFAULTS)
+    PARTITION BY RANGE (transaction_date);
+ALTER TABLE transactions ALTER COLUMN transaction_date SET NOT NULL;
+-- A unique key on a partitioned table must include the partition key; ids stay unique through the sequence
+ALTER TABLE transactions ADD PRIMARY KEY (id, transaction_date);
+CREATE TABLE transactions_default PARTITION OF transactions DEFAULT;
+
+-- Indexes on the parent are created on every partition, current and future
+CREATE INDEX transactions_user_date_idx ON transactions (user_id, transaction_date);
+
+-- One partition per month of the last ten years of history, plus the next three
+-- months; a stray old date cannot create hundreds of partitions
+SELECT create_transaction_partition(month::date)
+FROM generate_series(
+    GREATEST(
+        date_trunc('month', COALESCE((SELECT min(transaction_date) FROM transactions_unpartitioned), CURRENT_DATE)),
+        date_trunc('month', CURRENT_DATE) - INTERVAL '10 years'
+    ),
+    date_trunc('month', CURRENT_DATE) + INTERVAL '3 months',
+    INTERVAL '1 month'
+) AS month;
+
+INSERT INTO transactions SELECT * FROM transactions_unpartitioned;
+
+-- Keep the id sequence alive when the old table is dropped
+ALTER SEQUENCE IF EXISTS transactions_id_seq OWNED BY NONE;
+DROP TABLE transactions_unpartitioned;
+
+CREATE SCHEMA IF NOT EXISTS archive;
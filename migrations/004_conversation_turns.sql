@@ -0,0 +1,11 @@
+-- Durable per-user conversation memory shared by every container
+-- (MEMORY_BACKEND=postgres, see lambda/conversation_memory.py).
+CREATE TABLE IF NOT EXISTS conversation_turns (
+    id          BIGSERIAL   PRIMARY KEY,
+    namespace   TEXT        NOT NULL,
+    user_id     TEXT        NOT NULL,
+    user_text   TEXT        NOT NULL,
+    agent_text  TEXT        NOT NULL,
+    created_at  TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS conversation_turns_user_idx ON conversation_turns (namespace, user_id, id DESC);
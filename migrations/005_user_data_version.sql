@@ -0,0 +1,8 @@
+-- Per-user data version, incremented with every write to a user's
+-- transactions or goals (see lambda/data_version.py). Query-agent answers are
+-- cached under the version they were computed from.
+CREATE TABLE IF NOT EXISTS user_data_version (
+    user_id     TEXT        PRIMARY KEY,
+    version     BIGINT      NOT NULL DEFAULT 0,
+    updated_at  TIMESTAMPTZ NOT NULL DEFAULT now()
+);
@@ -0,0 +1,4 @@
+-- Goal creation time, the start of the savings window goal projections
+-- count toward a goal (see lambda/goal_projections.py). Goals created before
+-- this migration start counting from the moment it runs.
+ALTER TABLE goal ADD COLUMN IF NOT EXISTS created_at TIMESTAMPTZ NOT NULL DEFAULT now();
@@ -0,0 +1,42 @@
+-- Role for running model-generated SQL (see lambda/sql_guard.py, SQL_QUERY_ROLE).
+--
+-- query_reader can SELECT the three user-owned tables and nothing else. It has
+-- no grants on the monthly transaction partitions, the cache, memory or
+-- catalog-backed tables the application creates. Row-level security limits it
+-- to the rows of the user in the transaction-local setting app.user_id. Every
+-- other role keeps full access through the app_rows policy; table owners bypass
+-- row-level security anyway.
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_roles WHERE rolname = 'query_reader') THEN
+        CREATE ROLE query_reader NOLOGIN;
+    END IF;
+END
+$$;
+
+-- The application's login role switches to query_reader with SET LOCAL ROLE
+GRANT query_reader TO CURRENT_USER;
+
+REVOKE ALL ON ALL TABLES IN SCHEMA public FROM query_reader;
+GRANT SELECT ON transactions, goal, daily_spending TO query_reader;
+
+ALTER TABLE transactions ENABLE ROW LEVEL SECURITY;
+ALTER TABLE goal ENABLE ROW LEVEL SECURITY;
+ALTER TABLE daily_spending ENABLE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS app_rows ON transactions;
+DROP POLICY IF EXISTS app_rows ON goal;
+DROP POLICY IF EXISTS app_rows ON daily_spending;
+CREATE POLICY app_rows ON transactions USING (current_user <> 'query_reader') WITH CHECK (true);
+CREATE POLICY app_rows ON goal USING (current_user <> 'query_reader') WITH CHECK (true);
+CREATE POLICY app_rows ON daily_spending USING (current_user <> 'query_reader') WITH CHECK (true);
+
+DROP POLICY IF EXISTS query_reader_rows ON transactions;
+DROP POLICY IF EXISTS query_reader_rows ON goal;
+DROP POLICY IF EXISTS query_reader_rows ON daily_spending;
+CREATE POLICY query_reader_rows ON transactions FOR SELECT TO query_reader
+    USING (user_id = current_setting('app.user_id', true));
+CREATE POLICY query_reader_rows ON goal FOR SELECT TO query_reader
+    USING (user_id = current_setting('app.user_id', true));
+CREATE POLICY query_reader_rows ON daily_spending FOR SELECT TO query_reader
+    USING (user_id = current_setting('app.user_id', true));
@@ -0,0 +1,20 @@
+-- Bring databases partitioned by an earlier version of 003 in line with it:
+-- transaction_date NOT NULL and PRIMARY KEY (id, transaction_date) in place of
+-- the non-unique transactions_id_idx. A no-op where 003 already did this.
+UPDATE transactions SET transaction_date = COALESCE(created_at::date, CURRENT_DATE) WHERE transaction_date IS NULL;
+ALTER TABLE transactions ALTER COLUMN transaction_date SET NOT NULL;
+
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conrelid = 'transactions'::regclass AND contype = 'p') THEN
+        ALTER TABLE transactions ADD PRIMARY KEY (id, transaction_date);
+    END IF;
+END
+$$;
+
+DROP INDEX IF EXISTS transactions_id_idx;
+
+-- Partitions are reachable only through the row-level-secured parent
+REVOKE ALL ON ALL TABLES IN SCHEMA public FROM query_reader;
+REVOKE ALL ON ALL TABLES IN SCHEMA archive FROM query_reader;
+GRANT SELECT ON transactions, goal, daily_spending TO query_reader;
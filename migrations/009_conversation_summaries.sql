@@ -0,0 +1,22 @@
+-- Rolling conversation summaries (see lambda/prompt_builder.py), one row per
+-- namespace and user. They used to be stored as turns in conversation_turns
+-- under "<namespace>.summary", with the covered-through timestamp in user_text;
+-- the newest of those is moved here and the rest are removed.
+CREATE TABLE IF NOT EXISTS conversation_summaries (
+    namespace       TEXT        NOT NULL,
+    user_id         TEXT        NOT NULL,
+    summary         TEXT        NOT NULL,
+    covered_through TEXT        NOT NULL,
+    updated_at      TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (namespace, user_id)
+);
+
+INSERT INTO conversation_summaries (namespace, user_id, summary, covered_through, updated_at)
+SELECT DISTINCT ON (namespace, user_id)
+       left(namespace, -length('.summary')), user_id, agent_text, user_text, created_at
+FROM conversation_turns
+WHERE namespace LIKE '%.summary'
+ORDER BY namespace, user_id, id DESC
+ON CONFLICT (namespace, user_id) DO NOTHING;
+
+DELETE FROM conversation_turns WHERE namespace LIKE '%.summary';
@@ -0,0 +1,10 @@
+-- Shared key/value store behind TieredCache when a cache's *_STORE setting is
+-- "postgres" (see lambda/cache.py). Entries are namespaced per cache and expire
+-- at expires_at; reads ignore expired rows.
+CREATE TABLE IF NOT EXISTS kv_cache (
+    namespace  TEXT        NOT NULL,
+    key        TEXT        NOT NULL,
+    value      JSONB       NOT NULL,
+    expires_at TIMESTAMPTZ NOT NULL,
+    PRIMARY KEY (namespace, key)
+);
@@ -0,0 +1,47 @@
+"""Rebuild the daily_spending rollup from the transactions table.
+
+Rebuilds everything by default, or only the days from --since onwards. Runs in a
+single transaction, so readers see either the old or the new rollup.
+
+Usage:
+    python scripts/backfill_rollups.py [--since 2025-01-01]
+"""
+import argparse
+import os
+import sys
+from datetime import date
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lambda"))
+
+import db  # noqa: E402
+
+BACKFILL_SQL = """
+    INSERT INTO daily_spending (user_id, day, category, spent, earned, txn_count)
+    SELECT user_id,
+           transaction_date,
+           COALESCE(category, 'other'),
+           COALESCE(SUM(amount) FILTER (WHERE transaction_type = 'debit'), 0),
+           COALESCE(SUM(amount) FILTER (WHERE transaction_type = 'credit'), 0),
+           COUNT(*)
+    FROM transactions
+    WHERE transaction_date >= %s
+    GROUP BY 1, 2, 3
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--since", type=date.fromisoformat, default=date.min,
+                        help="only rebuild days on or after this date (YYYY-MM-DD)")
+    args = parser.parse_args()
+
+    with db.connection() as conn, conn.cursor() as cursor:
+        # Block concurrent rollup updates so no insert lands between delete and rebuild
+        cursor.execute("LOCK TABLE daily_spending IN EXCLUSIVE MODE")
+        cursor.execute("DELETE FROM daily_spending WHERE day >= %s", (args.since,))
+        cursor.execute(BACKFILL_SQL, (args.since,))
+        print(f"Rebuilt {cursor.rowcount} rollup rows since {args.since}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""Benchmark recent-window reads on partitioned vs. plain transactions tables.
+
+Builds scratch tables in a `bench` schema and grows their history step by step
+(same users, more months of data). After each step it times a 7-day window read
+for one user. The partitioned table should stay flat as total rows grow,
+because the planner prunes to the current month. Drops the schema at the end.
+
+Usage:
+    python scripts/bench_partitions.py [--steps 6] [--rows-per-month 200000] [--users 1000]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lambda"))
+
+import db  # noqa: E402
+from partition_maintenance import add_months, month_range  # noqa: E402
+
+COLUMNS = """
+    id BIGSERIAL,
+    user_id TEXT NOT NULL,
+    amount NUMERIC,
+    transaction_type TEXT,
+    transaction_date DATE,
+    category TEXT,
+    raw_message TEXT
+"""
+
+WINDOW_QUERY = """
+    SELECT category, SUM(amount)
+    FROM bench.{table}
+    WHERE user_id = %s AND transaction_date >= %s AND transaction_date < %s
+    GROUP BY category
+"""
+
+
+def setup(cursor):
+    cursor.execute("DROP SCHEMA IF EXISTS bench CASCADE")
+    cursor.execute("CREATE SCHEMA bench")
+    cursor.execute(f"CREATE TABLE bench.plain ({COLUMNS})")
+    cursor.execute("CREATE INDEX ON bench.plain (user_id, transaction_date)")
+    cursor.execute(f"CREATE TABLE bench.partitioned ({COLUMNS}) PARTITION BY RANGE (transaction_date)")
+    cursor.execute("CREATE INDEX ON bench.partitioned (user_id, transaction_date)")
+
+
+def add_month(cursor, month_start, rows, users):
+    start, end = month_range(month_start)
+    cursor.execute(
+        f"CREATE TABLE bench.p{start:%Y%m} PARTITION OF bench.partitioned FOR VALUES FROM (%s) TO (%s)",
+        (start, end),
+    )
+    for table in ("plain", "partitioned"):
+        cursor.execute(f"""
+            INSERT INTO bench.{table} (user_id, amount, transaction_type, transaction_date, category, raw_message)
+            SELECT 'u' || (g %% %s), (random() * 2000)::numeric(10, 2),
+                   CASE WHEN g %% 10 = 0 THEN 'credit' ELSE 'debit' END,
+                   %s::date + (g %% (%s::date - %s::date)),
+                   (ARRAY['grocery', 'utility', 'restaurant', 'transport', 'other'])[1 + g %% 5],
+                   'bench'
+            FROM generate_series(1, %s) AS g
+        """, (users, start, end, start, rows))
+    cursor.execute("ANALYZE bench.plain")
+    cursor.execute("ANALYZE bench.partitioned")
+
+
+def time_window(cursor, table, today, repeats=20):
+    timings = []
+    for i in range(repeats):
+        started = time.perf_counter()
+        cursor.execute(WINDOW_QUERY.format(table=table), (f"u{i}", today - timedelta(days=7), today + timedelta(days=1)))
+        cursor.fetchall()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--steps", type=int, default=6, help="number of history sizes to measure")
+    parser.add_argument("--months-per-step", type=int, default=4)
+    parser.add_argument("--rows-per-month", type=int, default=200_000)
+    parser.add_argument("--users", type=int, default=1000)
+    args = parser.parse_args()
+
+    today = date.today()
+    newest = today.replace(day=1)
+    months_loaded = 0
+    with db.connection() as conn, conn.cursor() as cursor:
+        setup(cursor)
+    print(f"{'months':>6} {'rows':>12} {'plain ms':>10} {'partitioned ms':>15}")
+    try:
+        for _ in range(args.steps):
+            with db.connection() as conn, conn.cursor() as cursor:
+                # The current month first, then progressively older history
+                for _ in range(args.months_per_step):
+                    add_month(cursor, add_months(newest, -months_loaded), args.rows_per_month, args.users)
+                    months_loaded += 1
+            with db.connection() as conn, conn.cursor() as cursor:
+                plain = time_window(cursor, "plain", today)
+                partitioned = time_window(cursor, "partitioned", today)
+            print(f"{months_loaded:>6} {months_loaded * args.rows_per_month:>12,} {plain:>10.2f} {partitioned:>15.2f}")
+    finally:
+        with db.connection() as conn, conn.cursor() as cursor:
+            cursor.execute("DROP SCHEMA IF EXISTS bench CASCADE")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Compare child-handler latency for remote (Lambda invoke) vs in-process routing.
+
+Sends the same messages through classification_function.route_to_child in both
+modes and reports p50/p99/mean per intent. Remote mode needs the child Lambda
+names in the usual env vars (QUERY_LAMBDA, BUDGET_LAMBDA, ...). The first call
+per mode is reported separately, since it includes cold imports or a child
+cold start.
+
+Transaction and goal messages insert rows, so only read-only intents run by
+default, as --user-id (default "bench_routing").
+
+Usage:
+    python scripts/bench_routing.py [--repeat 20] [--intents query,budget_guardian]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lambda"))
+
+import classification_function  # noqa: E402
+
+MESSAGES = {
+    "query": "how much did I spend this month",
+    "budget_guardian": "am I over budget this week",
+    "transaction": "spent 120 on coffee today",
+    "goal": "I want to save 50000 for a trip by December 2026",
+}
+
+
+def run(mode, intent, message, user_id, repeat):
+    payload = {"message": message, "user_id": user_id}
+    timings = []
+    for _ in range(repeat + 1):
+        started = time.perf_counter()
+        classification_function.route_to_child(intent, payload, mode=mode)
+        timings.append((time.perf_counter() - started) * 1000)
+    first, rest = timings[0], sorted(timings[1:])
+    return {
+        "first_ms": round(first, 1),
+        "p50_ms": round(rest[len(rest) // 2], 1),
+        "p99_ms": round(rest[min(len(rest) - 1, int(len(rest) * 0.99))], 1),
+        "mean_ms": round(statistics.mean(rest), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--intents", default="query,budget_guardian")
+    parser.add_argument("--user-id", default="bench_routing")
+    args = parser.parse_args()
+
+    results = {}
+    for intent in args.intents.split(","):
+        for mode in ("remote", "inprocess"):
+            results[f"{intent}.{mode}"] = run(mode, intent, MESSAGES[intent], args.user_id, args.repeat)
+            print(json.dumps({f"{intent}.{mode}": results[f"{intent}.{mode}"]}))
+    for intent in args.intents.split(","):
+        remote, local = results[f"{intent}.remote"], results[f"{intent}.inprocess"]
+        print(f"{intent:16s} p50 {remote['p50_ms']:8.1f} -> {local['p50_ms']:8.1f} ms   "
+              f"p99 {remote['p99_ms']:8.1f} -> {local['p99_ms']:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""Evaluate the local intent classifier against Bedrock labels.
+
+Reads the router's `intent_log` lines, one per message, and reports two things:
+
+- production: the share of all traffic answered by each stage (greeting,
+  investment, cache, rules, naive Bayes, Bedrock) and, for the local stages,
+  how often their answer agreed with the Bedrock label of the shadow-called
+  sample (INTENT_SHADOW_RATE);
+- replay: the local classifier re-run on every labelled message at the given
+  thresholds, with naive Bayes trained on a split and scored on the held-out
+  rest. Shadow-labelled messages are weighted by 1 / sampling rate, so
+  coverage and accuracy stand for the whole stream and not only the messages
+  that reached Bedrock.
+
+Usage:
+    python scripts/evaluate_intent_classifier.py intent_log.jsonl [--holdout 0.3] [--threshold 0.8]
+"""
+import argparse
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lambda"))
+
+from classification_function import apply_budget_fallback  # noqa: E402
+from local_intent import (  # noqa: E402
+    MODEL_THRESHOLD,
+    RULES_THRESHOLD,
+    STAGES,
+    LocalIntentClassifier,
+    NaiveBayesClassifier,
+    RuleClassifier,
+    label_weight,
+    labelled_records,
+    read_intent_log,
+)
+
+
+def report_production(records):
+    logged = [r for r in records if r.get("stage")]
+    if not logged:
+        print("No intent_log stage records; production figures need the router's intent_log lines")
+        return
+    total = len(logged)
+    print(f"Production: {total} messages")
+    for stage in sorted({r["stage"] for r in logged}):
+        in_stage = [r for r in logged if r["stage"] == stage]
+        line = f"  {stage:12s} handled {len(in_stage) / total:6.1%}"
+        shadowed = [r for r in in_stage if r.get("label_source") == "shadow"]
+        if shadowed:
+            agree = sum(r["answer"] == r["intent"] for r in shadowed)
+            line += f"  accuracy {agree / len(shadowed):6.1%} on {len(shadowed)} shadow labels"
+        print(line)
+    local = [r for r in logged if r["stage"] in STAGES]
+    shadowed = [r for r in local if r.get("label_source") == "shadow"]
+    line = f"  {'local total':12s} handled {len(local) / total:6.1%}"
+    if shadowed:
+        line += f"  accuracy {sum(r['answer'] == r['intent'] for r in shadowed) / len(shadowed):6.1%}"
+    else:
+        line += "  accuracy n/a (no shadow labels; set INTENT_SHADOW_RATE)"
+    print(line)
+
+
+def report_replay(records, args):
+    labelled = labelled_records(records)
+    if not labelled:
+        sys.exit("No labelled messages found")
+    random.Random(args.seed).shuffle(labelled)
+    split = int(len(labelled) * (1 - args.holdout))
+    train, test = labelled[:split], labelled[split:] or labelled
+
+    classifier = LocalIntentClassifier([
+        RuleClassifier(threshold=args.threshold),
+        NaiveBayesClassifier.train([(r["message"], r["intent"]) for r in train], threshold=args.model_threshold,
+                                   weights=[label_weight(r) for r in train]),
+    ])
+
+    per_stage = {}
+    total = handled = correct = 0.0
+    for record in test:
+        weight = label_weight(record)
+        total += weight
+        result = classifier.classify(record["message"])
+        if not result:
+            continue
+        intent, _, stage = result
+        intent = apply_budget_fallback(intent, record["message"].lower().strip())
+        hit = weight if intent == record["intent"] else 0.0
+        handled += weight
+        correct += hit
+        stage_stats = per_stage.setdefault(stage, [0.0, 0.0])
+        stage_stats[0] += weight
+        stage_stats[1] += hit
+
+    print(f"Replay: {len(test)} held-out labelled messages, weighted to {total:.0f} "
+          f"(trained model on {len(train)})")
+    for stage, (count, hits) in per_stage.items():
+        print(f"  {stage:12s} handled {count / total:6.1%}  accuracy {hits / count:6.1%}")
+    print(f"  {'local total':12s} handled {handled / total:6.1%}  "
+          f"accuracy {(correct / handled if handled else 0):6.1%}")
+    print(f"  {'bedrock':12s} handled {(total - handled) / total:6.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("data", help="exported intent_log lines, or JSONL of {message, intent} rows")
+    parser.add_argument("--holdout", type=float, default=0.3, help="share of rows held out for scoring")
+    parser.add_argument("--threshold", type=float, default=RULES_THRESHOLD, help="rules confidence threshold")
+    parser.add_argument("--model-threshold", type=float, default=MODEL_THRESHOLD, help="naive Bayes threshold")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    records = read_intent_log(args.data)
+    report_production(records)
+    report_replay(records, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""Apply pending SQL migrations from migrations/ in filename order.
+
+Applied files are recorded in schema_migrations so the command is safe to re-run.
+
+Usage:
+    python scripts/migrate.py [--dry-run]
+"""
+import argparse
+import glob
+import os
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "lambda"))
+
+import db  # noqa: E402
+
+MIGRATIONS_DIR = os.path.join(ROOT, "migrations")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--dry-run", action="store_true", help="list pending migrations without applying them")
+    args = parser.parse_args()
+
+    with db.connection() as conn, conn.cursor() as cursor:
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                name TEXT PRIMARY KEY,
+                applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+            )
+        """)
+        cursor.execute("SELECT name FROM schema_migrations")
+        applied = {row[0] for row in cursor.fetchall()}
+
+    pending = [path for path in sorted(glob.glob(os.path.join(MIGRATIONS_DIR, "*.sql")))
+               if os.path.basename(path) not in applied]
+    if not pending:
+        print("Database is up to date")
+        return
+
+    for path in pending:
+        name = os.path.basename(path)
+        if args.dry_run:
+            print(f"pending: {name}")
+            continue
+        with open(path, "r") as f:
+            statements = f.read()
+        # Each migration runs in its own transaction
+        with db.connection() as conn, conn.cursor() as cursor:
+            cursor.execute(statements)
+            cursor.execute("INSERT INTO schema_migrations (name) VALUES (%s)", (name,))
+        print(f"applied: {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+"""Train the local naive Bayes intent model from logged Bedrock labels.
+
+Uses every labelled intent_log line: messages Bedrock classified, cached
+labels and the shadow-labelled sample of locally answered messages (weighted
+by 1 / sampling rate, so the easy messages the rules answer are represented).
+
+Usage:
+    python scripts/train_intent_model.py labelled.jsonl [--out lambda/intent_model.json]
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lambda"))
+
+from local_intent import MODEL_PATH, NaiveBayesClassifier, label_weight, labelled_records, read_intent_log  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("data", help="JSONL of {message, intent} rows or exported intent_log lines")
+    parser.add_argument("--out", default=MODEL_PATH, help="where to write the model JSON")
+    args = parser.parse_args()
+
+    records = labelled_records(read_intent_log(args.data))
+    if not records:
+        sys.exit("No labelled messages found")
+    examples = [(r["message"], r["intent"]) for r in records]
+    model = NaiveBayesClassifier.train(examples, weights=[label_weight(r) for r in records])
+    model.save(args.out)
+    print(f"Trained on {len(examples)} messages {model.class_counts} -> {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Handlers are deployed as flat Lambda packages; import them the way scripts/ does
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lambda"))
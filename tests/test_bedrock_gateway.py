@@ -0,0 +1,157 @@
+import threading
+import time
+
+import pytest
+
+import aws_clients
+import bedrock_gateway
+from bedrock_gateway import BedrockUnavailable, CircuitBreaker, TokenBucket
+
+
+class ThrottlingException(Exception):
+    pass
+
+
+class ValidationException(Exception):
+    pass
+
+
+class ScriptedBedrock:
+    """Raises or returns the scripted outcomes in order, one per call."""
+
+    def __init__(self, *outcomes, gate=None):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+        self.gate = gate
+
+    def converse(self, **request):
+        self.calls += 1
+        if self.gate is not None:
+            self.gate.wait(5)
+        outcome = self.outcomes.pop(0) if self.outcomes else {"output": "ok"}
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+@pytest.fixture
+def bedrock(monkeypatch):
+    monkeypatch.setattr(bedrock_gateway, "_backoff", lambda attempt: 0)
+
+    def install(client, breaker=None):
+        monkeypatch.setitem(aws_clients._clients, ("bedrock-runtime", aws_clients.BEDROCK_REGION), client)
+        model_id = f"test-model-{id(client)}"
+        if breaker is not None:
+            monkeypatch.setitem(bedrock_gateway._breakers, model_id, breaker)
+        return model_id
+
+    return install
+
+
+def test_bucket_spends_burst_then_refuses_beyond_max_wait():
+    bucket = TokenBucket(rate=1, burst=2)
+    assert bucket.acquire(max_wait=0) < 0.01
+    bucket.acquire(max_wait=0)
+    with pytest.raises(BedrockUnavailable):
+        bucket.acquire(max_wait=0.1)
+
+
+def test_bucket_halves_rate_on_throttle_and_recovers():
+    bucket = TokenBucket(rate=8, burst=1)
+    bucket.on_throttle()
+    bucket.on_throttle()
+    assert bucket.rate == 2
+    for _ in range(3):
+        bucket.on_success()
+    assert bucket.rate == pytest.approx(3.2)
+    for _ in range(100):
+        bucket.on_throttle()
+    assert bucket.rate == 0.5
+
+
+def test_breaker_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(failures=2, cooldown=60)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+
+
+def test_half_open_breaker_lets_exactly_one_trial_through():
+    breaker = CircuitBreaker(failures=1, cooldown=0.01)
+    breaker.record_failure()
+    time.sleep(0.02)
+    assert breaker.state == "half_open"
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.allow() and breaker.allow()
+
+
+def test_failed_trial_reopens_the_circuit():
+    breaker = CircuitBreaker(failures=3, cooldown=0.01)
+    for _ in range(3):
+        breaker.record_failure()
+    time.sleep(0.02)
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+
+
+def test_abandoned_trial_frees_the_slot_only_for_its_owner():
+    breaker = CircuitBreaker(failures=1, cooldown=0.01)
+    breaker.record_failure()
+    time.sleep(0.02)
+    assert breaker.allow()
+    other = threading.Thread(target=breaker.abandon_trial)
+    other.start()
+    other.join()
+    assert not breaker.allow()
+    breaker.abandon_trial()
+    assert breaker.allow()
+
+
+def test_transient_errors_are_retried(bedrock):
+    client = ScriptedBedrock(ThrottlingException(), {"output": "done"})
+    model_id = bedrock(client)
+    assert bedrock_gateway.converse(modelId=model_id, messages=[]) == {"output": "done"}
+    assert client.calls == 2
+
+
+def test_bad_requests_are_not_retried_and_do_not_trip_the_breaker(bedrock):
+    breaker = CircuitBreaker(failures=1, cooldown=60)
+    model_id = bedrock(ScriptedBedrock(ValidationException()), breaker)
+    with pytest.raises(ValidationException):
+        bedrock_gateway.converse(modelId=model_id, messages=[])
+    assert breaker.state == "closed"
+
+
+def test_open_circuit_uses_the_fallback(bedrock, monkeypatch):
+    monkeypatch.setattr(bedrock_gateway, "BEDROCK_MAX_ATTEMPTS", 2)
+    client = ScriptedBedrock(ThrottlingException(), ThrottlingException())
+    model_id = bedrock(client, CircuitBreaker(failures=1, cooldown=60))
+    with pytest.raises(BedrockUnavailable):
+        bedrock_gateway.converse(modelId=model_id, messages=[])
+    response = bedrock_gateway.converse(modelId=model_id, messages=[{"n": 2}], fallback=lambda: "local")
+    assert response["fallback"] and response["output"]["message"]["content"][0]["text"] == "local"
+    assert client.calls == 2
+
+
+def test_callers_short_circuit_while_the_trial_is_in_flight(bedrock):
+    gate = threading.Event()
+    client = ScriptedBedrock(gate=gate)
+    breaker = CircuitBreaker(failures=1, cooldown=0.01)
+    breaker.record_failure()
+    time.sleep(0.02)
+    model_id = bedrock(client, breaker)
+
+    trial = threading.Thread(target=bedrock_gateway.converse, kwargs={"modelId": model_id, "messages": [1]})
+    trial.start()
+    while client.calls == 0:
+        time.sleep(0.001)
+    with pytest.raises(BedrockUnavailable):
+        bedrock_gateway.converse(modelId=model_id, messages=[2])
+    gate.set()
+    trial.join()
+    assert breaker.state == "closed"
+    assert client.calls == 1
@@ -0,0 +1,100 @@
+from datetime import date
+
+import bulk_import
+
+TODAY = date(2024, 6, 12)
+
+STATEMENT = """Txn Date,Narration,Amount,Type
+05/03/2024,UPI Swiggy,"1,250.00",DR
+06/03/2024,SALARY MARCH,50000,CR
+2024-13-45,Uber ride,300,DR
+,Uber ride,300,DR
+"""
+
+
+def test_detects_csv_statements():
+    assert bulk_import.looks_like_csv("Date,Narration,Withdrawal Amt,Deposit Amt\n01/01/2024,x,1,")
+    assert not bulk_import.looks_like_csv("spent 200 on food\npaid 100 for uber")
+
+
+def test_split_lines_keeps_line_numbers():
+    records = bulk_import.split_lines("spent 200 on food\n\n  got salary 5000 ")
+    assert records == [{"line": 1, "raw": "spent 200 on food"}, {"line": 3, "raw": "got salary 5000"}]
+
+
+def test_split_csv_reads_statement_columns():
+    records = bulk_import.split_csv(STATEMENT)
+    assert records[0]["line"] == 2
+    assert records[0]["fields"] == {"amount": 1250.0, "transaction_type": "debit",
+                                    "transaction_date": "2024-03-05", "category": "restaurant"}
+    assert records[1]["fields"]["category"] == "salary"
+
+
+def test_split_csv_numbers_rows_by_their_first_line():
+    records = bulk_import.split_csv(
+        'Txn Date,Narration,Amount,Type\n'
+        '05/03/2024,"UPI Swiggy\norder 123",250,DR\n'
+        '\n'
+        '06/03/2024,SALARY MARCH,50000,CR\n'
+    )
+    assert [r["line"] for r in records] == [2, 5]
+    assert records[0]["raw"] == "05/03/2024, UPI Swiggy\norder 123, 250, DR"
+
+
+def test_rows_without_a_usable_date_are_rejected_not_dated_today():
+    rows, errors = bulk_import.extract_records(bulk_import.split_csv(STATEMENT), TODAY)
+    assert [row["line"] for row in rows] == [2, 3]
+    assert errors == [
+        {"line": 4, "input": "2024-13-45, Uber ride, 300, DR", "error": "unrecognized date '2024-13-45'"},
+        {"line": 5, "input": "Uber ride, 300, DR", "error": "missing date"},
+    ]
+
+
+def test_unparsed_lines_are_batched_to_the_model(monkeypatch):
+    batches = []
+
+    def extract(records, today):
+        batches.append([r["line"] for r in records])
+        return {2: {"amount": 900.0, "transaction_type": "debit", "transaction_date": "2024-06-01",
+                    "category": "other"}}, {3: "invalid amount: None"}
+
+    monkeypatch.setattr(bulk_import, "extract_batch_with_bedrock", extract)
+    rows, errors = bulk_import.extract_records(
+        bulk_import.split_lines("spent 200 on groceries today\nAMAZON ORDER 1 JUN 900\nmystery line"), TODAY
+    )
+    assert batches == [[2, 3]]
+    assert [(row["line"], row["amount"], row["category"]) for row in rows] == [(1, 200, "grocery"), (2, 900.0, "other")]
+    assert errors == [{"line": 3, "input": "mystery line", "error": "invalid amount: None"}]
+
+
+def test_import_text_reports_each_row(monkeypatch):
+    stored = []
+    monkeypatch.setattr(bulk_import, "store_rows", lambda rows: (stored.extend(rows) or len(rows), []))
+    report = bulk_import.import_text(STATEMENT, "42", TODAY)
+    assert report["records"] == 4
+    assert report["inserted"] == 2
+    assert [e["line"] for e in report["failed"]] == [4, 5]
+    assert report["paths"] == {"csv": 2, "fast": 0, "llm": 0}
+    assert {row["user_id"] for row in stored} == {"42"}
+
+
+def test_import_text_caps_the_record_count(monkeypatch):
+    monkeypatch.setattr(bulk_import, "MAX_RECORDS", 1)
+    report = bulk_import.import_text("spent 1 on food\nspent 2 on food", "42", TODAY)
+    assert report["inserted"] == 0 and "Too many records" in report["error"]
+
+
+def test_paths_count_only_inserted_rows(monkeypatch):
+    monkeypatch.setattr(bulk_import, "extract_batch_with_bedrock", lambda records, today: (
+        {2: {"amount": 900.0, "transaction_type": "debit", "transaction_date": "2024-06-01", "category": "other"}},
+        {3: "invalid amount: None"},
+    ))
+    monkeypatch.setattr(bulk_import, "store_rows", lambda rows: (len(rows) - 1, [
+        {"line": 1, "input": rows[0]["raw_message"], "error": "check constraint"},
+    ]))
+    report = bulk_import.import_text(
+        "spent 200 on groceries today\nAMAZON ORDER 1 JUN 900\nmystery line", "42", TODAY
+    )
+    assert report["inserted"] == 1
+    assert [e["line"] for e in report["failed"]] == [1, 3]
+    assert report["paths"] == {"csv": 0, "fast": 0, "llm": 1}
@@ -0,0 +1,115 @@
+import contextlib
+import time
+
+import cache
+import classification_function
+from cache import LRUCache, PostgresStore, TieredCache, normalize_text
+
+
+class DictStore:
+    def __init__(self, fail=False):
+        self.data = {}
+        self.fail = fail
+
+    def get(self, key):
+        if self.fail:
+            raise RuntimeError("store down")
+        return self.data.get(key)
+
+    def set(self, key, value, ttl):
+        if self.fail:
+            raise RuntimeError("store down")
+        self.data[key] = value
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+
+def test_normalize_text():
+    assert normalize_text("  How much did I SPEND?! ") == "how much did i spend"
+
+
+def test_lru_evicts_least_recently_used_and_expired_entries():
+    lru = LRUCache(maxsize=2, ttl=60)
+    lru.set("a", 1)
+    lru.set("b", 2)
+    lru.get("a")
+    lru.set("c", 3)
+    assert (lru.get("a"), lru.get("b"), lru.get("c")) == (1, None, 3)
+    lru.set("short", 4, ttl=0.01)
+    time.sleep(0.02)
+    assert lru.get("short") is None
+
+
+def test_tiered_cache_promotes_store_hits_to_the_local_tier():
+    store = DictStore()
+    store.data["k"] = "query"
+    tiered = TieredCache("test_tiered", maxsize=10, store=store)
+    assert tiered.get("k") == "query"
+    store.data.clear()
+    assert tiered.get("k") == "query"
+    assert tiered.get("missing") is None
+    stats = tiered.stats()
+    assert (stats["hits"], stats["store_hits"], stats["misses"]) == (1, 1, 1)
+
+
+def test_tiered_cache_writes_through_and_survives_store_errors():
+    store = DictStore()
+    tiered = TieredCache("test_tiered_write", maxsize=10, store=store)
+    tiered.set("k", {"v": 1})
+    assert store.data == {"k": {"v": 1}}
+    tiered.delete("k")
+    assert store.data == {} and tiered.get("k") is None
+
+    broken = TieredCache("test_tiered_broken", maxsize=10, store=DictStore(fail=True))
+    broken.set("k", 1)
+    assert broken.get("k") == 1
+    assert broken.get("other") is None
+
+
+class RecordingCursor:
+    def __init__(self, rows):
+        self.rows = rows
+        self.statements = []
+
+    def execute(self, sql, params=None):
+        self.statements.append((" ".join(sql.split()), params))
+
+    def fetchone(self):
+        return self.rows.pop(0) if self.rows else None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+def test_postgres_store_reads_and_writes_without_ddl(monkeypatch):
+    cursor = RecordingCursor([({"intent": "query"},)])
+
+    class Connection:
+        def cursor(self):
+            return cursor
+
+    monkeypatch.setattr(cache.db, "connection", contextlib.contextmanager(lambda: (yield Connection())))
+    store = PostgresStore("intent")
+    assert store.get("hello") == {"intent": "query"}
+    store.set("hello", "query", 60)
+    store.delete("hello")
+    assert [sql.split()[0] for sql, _ in cursor.statements] == ["SELECT", "INSERT", "DELETE"]
+    assert cursor.statements[0][1] == ("intent", "hello")
+    assert cursor.statements[1][1] == ("intent", "hello", '"query"', 60)
+    assert not any("CREATE" in sql for sql, _ in cursor.statements)
+
+
+def test_local_classifier_answers_before_the_shared_intent_store(monkeypatch):
+    store = DictStore(fail=True)
+    monkeypatch.setattr(classification_function.intent_cache, "store", store)
+    lookups = []
+    monkeypatch.setattr(store, "get", lambda key: lookups.append(key))
+    intent, decision = classification_function.classify_without_bedrock("paid 640 for petrol")
+    assert (intent, decision["stage"]) == ("transaction", "rules")
+    assert lookups == []
+    assert classification_function.classify_without_bedrock("what about my net worth")[0] is None
+    assert lookups == ["what about my net worth"]
@@ -0,0 +1,119 @@
+import sys
+import threading
+
+import classification_function
+import conversation_memory
+from conversation_memory import CachedMemory, SqliteTurnStore
+
+
+class GatedStore:
+    """Wraps a turn store; append_many waits until the test opens the gate."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.max_turns = backend.max_turns
+        self.gate = threading.Event()
+
+    def append_many(self, turns):
+        self.gate.wait(5)
+        self.backend.append_many(turns)
+
+    def __getattr__(self, name):
+        return getattr(self.backend, name)
+
+
+def test_sqlite_store_keeps_newest_turns_per_user(tmp_path):
+    store = SqliteTurnStore(str(tmp_path / "memory.db"), max_turns=3)
+    for i in range(5):
+        store.append("agent", 1, f"q{i}", f"a{i}")
+    store.append("agent", 2, "other", "user")
+    store.append("other_agent", 1, "other", "namespace")
+
+    assert [t["user"] for t in store.recent("agent", 1)] == ["q2", "q3", "q4"]
+    assert [t["user"] for t in store.recent("agent", 1, limit=2)] == ["q3", "q4"]
+    assert [t["user"] for t in store.recent("agent", 2)] == ["other"]
+
+
+def test_sqlite_store_summaries(tmp_path):
+    store = SqliteTurnStore(str(tmp_path / "memory.db"))
+    assert store.summary("agent", 1) is None
+    store.set_summary("agent", 1, "old", "2024-06-01T10:00:00")
+    store.set_summary("agent", 1, "new", "2024-06-02T10:00:00")
+    assert store.summary("agent", 1) == {"text": "new", "covered_through": "2024-06-02T10:00:00"}
+
+    store.append("agent", 1, "q", "a")
+    store.clear("agent", 1)
+    assert store.summary("agent", 1) is None
+    assert store.recent("agent", 1) == []
+
+
+def test_write_behind_turns_are_readable_before_they_persist(tmp_path):
+    backend = GatedStore(SqliteTurnStore(str(tmp_path / "memory.db")))
+    memory = CachedMemory(backend, write_behind=True)
+
+    memory.append("agent", 1, "q", "a")
+    assert [t["user"] for t in memory.recent("agent", 1)] == ["q"]
+    assert backend.backend.recent("agent", 1) == []
+    assert memory.flush(timeout=0.05) is False
+
+    # A cache miss still sees turns that are queued but not yet written
+    memory._cache.clear()
+    assert [t["user"] for t in memory.recent("agent", 1)] == ["q"]
+
+    backend.gate.set()
+    assert memory.flush(timeout=2) is True
+    assert [t["user"] for t in backend.backend.recent("agent", 1)] == ["q"]
+    assert memory._pending == {}
+
+
+def test_synchronous_appends_are_written_immediately(tmp_path):
+    backend = SqliteTurnStore(str(tmp_path / "memory.db"))
+    memory = CachedMemory(backend, write_behind=False)
+    memory.append("agent", 1, "q", "a")
+    assert [t["user"] for t in backend.recent("agent", 1)] == ["q"]
+
+
+def test_cached_summary_is_written_through(tmp_path):
+    backend = SqliteTurnStore(str(tmp_path / "memory.db"))
+    memory = CachedMemory(backend, write_behind=False)
+    assert memory.summary("agent", 1) is None
+    memory.set_summary("agent", 1, "text", "2024-06-01T10:00:00")
+    assert memory.summary("agent", 1)["text"] == "text"
+    assert backend.summary("agent", 1)["text"] == "text"
+
+
+def test_module_flush_skips_synchronous_stores(monkeypatch, tmp_path):
+    monkeypatch.setattr(conversation_memory, "_store", None)
+    assert conversation_memory.flush() is True
+
+    backend = GatedStore(SqliteTurnStore(str(tmp_path / "memory.db")))
+    monkeypatch.setattr(conversation_memory, "_store", CachedMemory(backend, write_behind=False))
+    backend.gate.set()
+    conversation_memory._store.append("agent", 1, "q", "a")
+    assert conversation_memory.flush(timeout=0) is True
+
+    store = CachedMemory(GatedStore(SqliteTurnStore(str(tmp_path / "queued.db"))), write_behind=True)
+    monkeypatch.setattr(conversation_memory, "_store", store)
+    store.append("agent", 1, "q", "a")
+    assert conversation_memory.flush(timeout=0.01) is False
+    store.backend.gate.set()
+    assert conversation_memory.flush(timeout=2) is True
+
+
+def test_async_worker_flushes_after_sending_the_reply(monkeypatch):
+    events = []
+    monkeypatch.setattr(classification_function, "process_update", lambda update: (42, "hello"))
+    monkeypatch.setattr(
+        classification_function.telegram, "call", lambda method, **kwargs: events.append(method)
+    )
+    monkeypatch.setattr(conversation_memory, "flush", lambda *args: events.append("flush"))
+    monkeypatch.setitem(sys.modules, "conversation_memory", conversation_memory)
+
+    classification_function.reply_in_background({"update": {}})
+    assert events == ["sendMessage", "flush"]
+
+
+def test_after_reply_skips_memory_when_no_handler_ran_here(monkeypatch):
+    monkeypatch.delitem(sys.modules, "conversation_memory")
+    classification_function.after_reply()
+    assert "conversation_memory" not in sys.modules
@@ -0,0 +1,87 @@
+import pytest
+
+import extraction
+import metrics
+import model_registry
+from extraction import clean_goal, clean_transaction, is_complete, parse_model_json
+
+
+def test_clean_transaction_coerces_fields():
+    fields, error = clean_transaction({"amount": "₹1,200.50", "transaction_type": " Debit ",
+                                       "transaction_date": "2024-06-01T10:00:00", "category": "Shopping"})
+    assert error is None
+    assert fields == {"amount": 1200.5, "transaction_type": "debit", "transaction_date": "2024-06-01",
+                      "category": "other"}
+
+
+@pytest.mark.parametrize("data, error", [
+    (None, "not an object"),
+    ({"amount": -5, "transaction_type": "debit", "transaction_date": "2024-06-01"}, "invalid amount: -5"),
+    ({"amount": 5, "transaction_type": "refund", "transaction_date": "2024-06-01"}, "invalid transaction_type"),
+    ({"amount": 5, "transaction_type": "credit", "transaction_date": "yesterday"}, "invalid transaction_date"),
+])
+def test_clean_transaction_rejects_unusable_fields(data, error):
+    fields, reason = clean_transaction(data)
+    assert fields is None and reason.startswith(error)
+
+
+def test_clean_goal():
+    fields, error = clean_goal({"goal_name": "  New   bike ", "target_amount": 50000,
+                                "target_date": "2025-03-01", "category": "travel"})
+    assert error is None
+    assert fields == {"goal_name": "New bike", "target_amount": 50000.0, "target_date": "2025-03-01",
+                      "category": "travel"}
+    assert clean_goal({"goal_name": "", "target_amount": 1, "target_date": "2025-03-01"}) == (None, "missing goal_name")
+
+
+def test_model_json_and_completeness():
+    data = parse_model_json('```json\n{"amount": 10, "category": ""}\n```')
+    assert data == {"amount": 10, "category": ""}
+    assert not is_complete(data, ["amount", "category"])
+    assert is_complete(data, ["amount"])
+
+
+def tool_reply(tool, items):
+    return {
+        "output": {"message": {"role": "assistant", "content": [
+            {"toolUse": {"toolUseId": "1", "name": tool, "input": {"items": items}}},
+        ]}},
+        "usage": {"inputTokens": 50, "outputTokens": 20},
+    }
+
+
+def test_batch_extraction_repairs_only_rejected_and_missing_lines(monkeypatch):
+    metrics.reset()
+    good = {"amount": 900, "transaction_type": "debit", "transaction_date": "2024-06-01", "category": "grocery"}
+    replies = [
+        tool_reply("record_transactions", [
+            dict(good, line=1),
+            dict(good, line=2, amount="n/a"),
+            dict(good, line=9),  # not an input line
+        ]),
+        tool_reply("record_transactions", [dict(good, line=2, amount=450), dict(good, line=1, amount=1)]),
+    ]
+    calls = []
+
+    def converse(task, prompt, extra=None, **overrides):
+        calls.append((task, prompt, extra, overrides))
+        return replies.pop(0)
+
+    monkeypatch.setattr(model_registry, "converse", converse)
+    fields, errors = extraction.extract_structured_batch(
+        "extract_batch", "transaction", "1. groceries 900\n2. rent\n3. ???", [1, 2, 3],
+        extraction.TRANSACTION_SCHEMA, clean_transaction, "Store transactions.", maxTokens=500,
+    )
+
+    assert fields == {1: clean_transaction(good)[0], 2: dict(clean_transaction(good)[0], amount=450.0)}
+    assert errors == {3: "missing from model output"}
+    spec = calls[0][2]["toolConfig"]["tools"][0]["toolSpec"]
+    assert spec["name"] == "record_transactions"
+    assert spec["inputSchema"]["json"]["properties"]["items"]["items"]["required"][0] == "line"
+    assert calls[0][3] == {"maxTokens": 500}
+    assert "line 2: invalid amount" in calls[1][1] and "line 3: missing" in calls[1][1]
+    assert "line 1:" not in calls[1][1]
+    assert extraction.stats("transaction") == {
+        "extractions": 3, "success_rate": 0.667, "repairs": 1, "repaired": 1, "avg_tokens": 46.7,
+    }
+    metrics.reset()
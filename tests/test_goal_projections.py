@@ -0,0 +1,82 @@
+from datetime import date
+
+import pytest
+
+pytest.importorskip("numpy")
+
+import goal_projections  # noqa: E402
+
+TODAY = date(2024, 6, 15)
+
+
+def goal(goal_id, user_id, target, target_date, created=date(2024, 1, 1), name="Goal"):
+    return (goal_id, user_id, name, target, target_date, "savings", created)
+
+
+def monthly(user_id, amount, months=range(1, 7)):
+    return [(user_id, date(2024, month, 1), amount) for month in months]
+
+
+def test_single_goal_gets_all_savings_since_creation():
+    [p] = goal_projections.project(
+        [goal(1, "u1", 12000, date(2024, 12, 31), created=date(2024, 1, 10))], monthly("u1", 1000), TODAY
+    )["u1"]
+    assert (p["saved"], p["remaining"], p["progress_pct"]) == (6000.0, 6000.0, 50.0)
+    assert p["monthly_rate"] == 1000.0
+    assert p["required_monthly"] == pytest.approx(917.79)
+    assert p["projected_completion"] == "2024-12-14"
+    assert p["status"] == "on_track"
+
+
+def test_savings_are_split_by_target_between_open_goals():
+    bike, laptop = goal_projections.project(
+        [goal(1, "u2", 1000, date(2024, 12, 31)), goal(2, "u2", 3000, None)], monthly("u2", 400), TODAY
+    )["u2"]
+    assert (bike["saved"], laptop["saved"]) == (600.0, 1800.0)
+    assert (bike["monthly_rate"], laptop["monthly_rate"]) == (100.0, 300.0)
+    assert laptop["required_monthly"] is None and laptop["target_date"] is None
+
+
+def test_goals_only_count_months_they_were_open():
+    [p] = goal_projections.project(
+        [goal(1, "u1", 10000, date(2024, 12, 31), created=date(2024, 4, 20))], monthly("u1", 1000), TODAY
+    )["u1"]
+    assert p["saved"] == 3000.0
+
+
+def test_statuses():
+    projections = goal_projections.project(
+        [goal(1, "u3", 5000, date(2024, 3, 31)), goal(2, "u3", 100, date(2025, 1, 1)),
+         goal(3, "u4", 500, date(2024, 12, 31))],
+        [("u3", date(2024, 1, 1), 50)] + monthly("u4", 1000),
+        TODAY,
+    )
+    overdue, behind = projections["u3"]
+    assert (overdue["status"], overdue["on_track"]) == ("overdue", False)
+    assert (behind["status"], behind["projected_completion"]) == ("behind", None)
+    [reached] = projections["u4"]
+    assert (reached["status"], reached["saved"], reached["remaining"]) == ("reached", 500.0, 0.0)
+
+
+def test_users_are_computed_independently():
+    projections = goal_projections.project(
+        [goal(1, "a", 1000, None), goal(2, "b", 1000, None)], monthly("a", 100) + monthly("b", -50), TODAY
+    )
+    assert projections["a"][0]["saved"] == 600.0
+    assert projections["b"][0]["saved"] == 0.0
+    assert projections["b"][0]["monthly_rate"] == 0.0
+
+
+def test_no_goals():
+    assert goal_projections.project([], monthly("u1", 100), TODAY) == {}
+
+
+def test_answers_name_matching_goals():
+    projections = goal_projections.project(
+        [goal(1, "u1", 1000, None, name="New bike"), goal(2, "u1", 5000, None, name="Laptop")],
+        monthly("u1", 100), TODAY,
+    )["u1"]
+    assert goal_projections.is_goal_question("How far am I from my bike goal?")
+    assert not goal_projections.is_goal_question("how much did I spend on food")
+    assert [p["goal_name"] for p in goal_projections.match_goals("bike goal progress", projections)] == ["New bike"]
+    assert goal_projections.answer("goal progress", projections).count("\n") == 1
@@ -0,0 +1,88 @@
+import json
+
+import pytest
+
+import classification_function
+import local_intent
+from local_intent import LocalIntentClassifier, NaiveBayesClassifier, RuleClassifier
+
+
+@pytest.mark.parametrize("message, intent", [
+    ("spent 200 on groceries", "transaction"),
+    ("paid ₹500 for dinner", "transaction"),
+    ("I want to save 50000 for a trip by december", "goal"),
+    ("how much did I spend on food this month?", "query"),
+])
+def test_rules_answer_clear_messages(message, intent):
+    assert LocalIntentClassifier([RuleClassifier()]).classify(message)[0] == intent
+
+
+def test_question_cue_keeps_mixed_messages_from_being_recorded_as_transactions():
+    intent, confidence = RuleClassifier().predict("I bought a car for 5 lakh last year, how much did I spend on cars")
+    assert confidence < local_intent.RULES_THRESHOLD
+    assert LocalIntentClassifier([RuleClassifier()]).classify(
+        "I bought a car for 5 lakh last year, how much did I spend on cars") is None
+
+
+def test_explain_reports_the_best_prediction_below_threshold():
+    classifier = LocalIntentClassifier([RuleClassifier(threshold=0.99)])
+    assert classifier.explain("spent 200 on groceries")[::2] == ("transaction", "rules")
+    assert classifier.explain("spent 200 on groceries")[3] is False
+    assert classifier.explain("hmm") == (None, 0.0, None, False)
+
+
+def test_naive_bayes_learns_from_weighted_examples():
+    examples = [("netflix renewal", "transaction"), ("goa trip fund", "goal"), ("netflix plan", "query")]
+    model = NaiveBayesClassifier.train(examples, threshold=0.5, weights=[5, 1, 1])
+    assert model.class_counts == {"transaction": 5, "goal": 1, "query": 1}
+    assert model.predict("netflix")[0] == "transaction"
+    restored = NaiveBayesClassifier(**model.to_dict())
+    assert restored.predict("goa trip") == model.predict("goa trip")
+
+
+def test_intent_log_reader_weights_shadow_labels(tmp_path):
+    path = tmp_path / "log.jsonl"
+    path.write_text("\n".join([
+        '2024-06-01T00:00:00Z INFO {"intent_log": {"message": "paid 5", "stage": "rules", "answer": "transaction",'
+        ' "intent": "transaction", "label_source": "shadow", "shadow_rate": 0.05}}',
+        '{"intent_log": {"message": "spent 9", "stage": "rules", "answer": "transaction", "intent": null}}',
+        '{"message": "what did I spend", "intent": "query"}',
+        "not json",
+    ]))
+    records = local_intent.read_intent_log(str(path))
+    assert len(records) == 3
+    assert [local_intent.label_weight(r) for r in local_intent.labelled_records(records)] == [20.0, 1.0]
+    assert local_intent.read_labelled_messages(str(path)) == [("paid 5", "transaction"), ("what did I spend", "query")]
+
+
+def intent_logs(capsys):
+    return [json.loads(line)["intent_log"] for line in capsys.readouterr().out.splitlines()
+            if line.startswith('{"intent_log"')]
+
+
+def test_router_logs_locally_answered_messages_with_their_prediction(monkeypatch, capsys):
+    monkeypatch.setattr(classification_function, "INTENT_SHADOW_RATE", 0.0)
+    assert classification_function.classify_intent("paid 750 for uber") == "transaction"
+    [record] = intent_logs(capsys)
+    assert record["stage"] == "rules" and record["local_intent"] == "transaction"
+    assert record["confidence"] >= local_intent.RULES_THRESHOLD
+    assert record["intent"] is None and record["shadow_rate"] == 0.0
+
+
+def test_sampled_local_answers_get_a_shadow_label(monkeypatch, capsys):
+    monkeypatch.setattr(classification_function, "INTENT_SHADOW_RATE", 1.0)
+    monkeypatch.setattr(classification_function, "bedrock_label", lambda text, fallback=None: ("transaction", {}))
+    assert classification_function.classify_intent("paid 820 for cab") == "transaction"
+    classification_function._shadow_executor.submit(lambda: None).result()
+    [record] = intent_logs(capsys)
+    assert (record["stage"], record["answer"], record["intent"], record["label_source"]) == \
+        ("rules", "transaction", "transaction", "shadow")
+
+
+def test_bedrock_answers_are_logged_with_the_local_prediction(monkeypatch, capsys):
+    monkeypatch.setattr(classification_function, "bedrock_label", lambda text, fallback=None: ("query", {}))
+    message = "I bought a bike for 1 lakh in may, how much did I spend on bikes"
+    assert classification_function.classify_intent(message) == "query"
+    [record] = intent_logs(capsys)
+    assert (record["stage"], record["local_intent"], record["intent"], record["label_source"]) == \
+        ("bedrock", "transaction", "query", "bedrock")
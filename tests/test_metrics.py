@@ -0,0 +1,25 @@
+import json
+
+import metrics
+
+
+def test_log_stats_is_off_by_default(monkeypatch, capsys):
+    monkeypatch.setattr(metrics, "LOG_STATS_EVERY", 0)
+
+    def stats():
+        raise AssertionError("stats computed while logging is off")
+
+    assert metrics.log_stats("cache", stats) is False
+    assert capsys.readouterr().out == ""
+
+
+def test_log_stats_logs_first_and_every_nth_call(monkeypatch, capsys):
+    monkeypatch.setattr(metrics, "LOG_STATS_EVERY", 3)
+    metrics.reset()
+    logged = [metrics.log_stats("cache", lambda: {"hits": 1}) for _ in range(7)]
+    assert logged == [True, False, False, True, False, False, True]
+    assert metrics.log_stats("other", dict) is True  # counted per name
+
+    lines = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert lines == [{"cache": {"hits": 1}}] * 3 + [{"other": {}}]
+    metrics.reset()
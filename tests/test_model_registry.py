@@ -0,0 +1,63 @@
+import pytest
+
+import bedrock_gateway
+import metrics
+import model_registry
+
+
+def reply(text, input_tokens=100, output_tokens=10):
+    return {
+        "output": {"message": {"role": "assistant", "content": [{"text": text}]}},
+        "usage": {"inputTokens": input_tokens, "outputTokens": output_tokens},
+        "metrics": {"latencyMs": 5},
+    }
+
+
+@pytest.fixture
+def bedrock(monkeypatch):
+    """Scripted gateway: each entry is a reply text, or None for a fallback answer."""
+    metrics.reset()
+    script, requests = [], []
+
+    def converse(fallback=None, **request):
+        requests.append(request["modelId"])
+        text = script.pop(0)
+        return reply(text) if text is not None else bedrock_gateway.fallback_response(fallback())
+
+    monkeypatch.setattr(bedrock_gateway, "converse", converse)
+    yield script, requests
+    metrics.reset()
+
+
+def test_invalid_reply_escalates_once(bedrock):
+    script, requests = bedrock
+    script += ["maybe", "query"]
+    response = model_registry.converse("classify", "prompt", validate=lambda t: t == "query")
+    assert model_registry.text(response) == "query"
+    assert requests == [model_registry.TASKS["classify"]["model"], model_registry.TASKS["classify"]["escalate_to"]]
+
+    stats = model_registry.stats()["classify"]
+    assert (stats["calls"], stats["invalid"], stats["escalations"], stats["fallbacks"]) == (2, 1, 1, 0)
+    assert stats["avg_input_tokens"] == 100
+
+
+def test_fallbacks_are_not_counted_as_model_calls(bedrock):
+    script, _ = bedrock
+    script += ["maybe", None]
+    response = model_registry.converse(
+        "classify", "prompt", validate=lambda t: t == "query", fallback=lambda: "unknown"
+    )
+    assert response["fallback"] and model_registry.text(response) == "unknown"
+
+    stats = model_registry.stats()["classify"]
+    assert (stats["calls"], stats["fallbacks"], stats["escalations"]) == (1, 1, 1)
+    assert metrics.snapshot("model.classify.latency")["model.classify.latency"]["count"] == 1
+    assert metrics.counter("model.classify.input_tokens") == 100
+
+
+def test_stats_list_tasks_that_only_fell_back(bedrock):
+    script, _ = bedrock
+    script.append(None)
+    model_registry.converse("answer", "prompt", fallback=lambda: "later")
+    stats = model_registry.stats()["answer"]
+    assert (stats["calls"], stats["fallbacks"], stats["avg_input_tokens"], stats["p50_ms"]) == (0, 1, None, None)
@@ -0,0 +1,97 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import classification_function
+import prefetch
+
+
+@pytest.fixture
+def loaders(monkeypatch):
+    """Replace the loaders with ones that record their calls; returns the call log."""
+    monkeypatch.setattr(prefetch, "_executor", ThreadPoolExecutor(max_workers=4))
+    calls = []
+
+    def loader(name, result=None, delay=0.0, error=None, gate=None):
+        def load(user_id, message):
+            calls.append((name, user_id, message))
+            if gate is not None:
+                gate.wait(5)
+            time.sleep(delay)
+            if error is not None:
+                raise error
+            return result if result is not None else f"{name} for {user_id}"
+
+        monkeypatch.setitem(prefetch.LOADERS, name, load)
+
+    for name in list(prefetch.LOADERS):
+        loader(name)
+    loader.calls = calls
+    return loader
+
+
+def test_collect_returns_only_what_the_intent_uses(loaders):
+    pending = prefetch.start(42, "am I over budget this week")
+    results = pending.collect("budget_guardian")
+    assert results == {name: f"{name} for 42" for name in ("guardian_memory", "spending", "goals")}
+    assert {name for name, _, _ in loaders.calls} <= set(prefetch.LOADERS)
+    assert set(pending.timings) <= set(prefetch.LOADERS)
+    assert prefetch.start(42, "hi").collect("greeting") == {}
+
+
+def test_loads_run_concurrently(loaders):
+    for name in prefetch.PREFETCH_BY_INTENT["budget_guardian"]:
+        loaders(name, delay=0.1)
+    started = time.perf_counter()
+    results = prefetch.Prefetch("42", "message", names=prefetch.PREFETCH_BY_INTENT["budget_guardian"]).collect(
+        "budget_guardian"
+    )
+    assert len(results) == 3
+    assert time.perf_counter() - started < 0.25
+
+
+def test_failed_and_late_loads_are_left_out(loaders):
+    loaders("guardian_memory", error=RuntimeError("db down"))
+    gate = threading.Event()
+    loaders("goals", gate=gate)
+    try:
+        results = prefetch.start(42, "message").collect("budget_guardian", timeout=0.05)
+    finally:
+        gate.set()
+    assert results == {"spending": "spending for 42"}
+
+
+def test_unused_queued_loads_are_cancelled(loaders, monkeypatch):
+    monkeypatch.setattr(prefetch, "_executor", ThreadPoolExecutor(max_workers=1))
+    gate = threading.Event()
+    loaders("guardian_memory", gate=gate)
+    pending = prefetch.Prefetch("42", "hi", names=["guardian_memory", "query_context"])
+    while not loaders.calls:  # guardian_memory holds the only worker
+        time.sleep(0.001)
+    try:
+        assert pending.collect("greeting") == {}
+    finally:
+        gate.set()
+    assert pending.futures["query_context"].cancelled()
+    assert not pending.futures["guardian_memory"].cancelled()
+    assert [name for name, _, _ in loaders.calls] == ["guardian_memory"]
+
+
+def test_router_passes_prefetched_context_to_the_handler(loaders, monkeypatch):
+    monkeypatch.setattr(prefetch, "PREFETCH_ENABLED", True)
+    monkeypatch.setattr(classification_function, "CLASSIFY_MODE", "separate")
+
+    def classify(text, before_model=None):
+        before_model()  # the router starts prefetching when Bedrock is needed
+        return "query"
+
+    payloads = []
+    monkeypatch.setattr(classification_function, "classify_intent", classify)
+    monkeypatch.setattr(classification_function, "route_to_child", lambda intent, payload: payloads.append(payload))
+    monkeypatch.setattr(classification_function, "child_reply", lambda response: "answer")
+
+    update = {"message": {"chat": {"id": 42}, "text": "how much did I spend on food"}}
+    assert classification_function.process_update(update) == (42, "answer")
+    assert payloads[0]["prefetched"] == {"query_context": "query_context for 42"}
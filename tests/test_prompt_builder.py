@@ -0,0 +1,132 @@
+import json
+import types
+
+import conversation_memory
+import prompt_builder
+from prompt_builder import compact_rows, estimate_tokens, fit_turns, truncate, turn_time
+
+
+class FakeMemory:
+    def __init__(self, turns, summary=None):
+        self.turns = turns
+        self.stored_summary = summary
+        self.writes = []
+
+    def recent(self, namespace, user_id, limit=None):
+        return list(self.turns[-limit:] if limit else self.turns)
+
+    def summary(self, namespace, user_id):
+        return self.stored_summary
+
+    def set_summary(self, namespace, user_id, text, covered_through):
+        self.writes.append((text, covered_through))
+        self.stored_summary = {"text": text, "covered_through": covered_through}
+
+
+def turns(timestamps):
+    return [{"user": f"q{i}", "agent": f"a{i}", "timestamp": t} for i, t in enumerate(timestamps)]
+
+
+def use(monkeypatch, memory, reply="summary"):
+    prompts = []
+
+    def converse(task, prompt):
+        prompts.append(prompt)
+        return {"reply": reply}
+
+    monkeypatch.setattr(conversation_memory, "get_store", lambda: memory)
+    monkeypatch.setattr(
+        prompt_builder, "model_registry", types.SimpleNamespace(converse=converse, text=lambda r: r["reply"])
+    )
+    return prompts
+
+
+def test_estimate_and_truncate():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("abcde") == 2
+    assert truncate("short", 10) == "short"
+    cut = truncate("x" * 100, 5)
+    assert cut.endswith("...") and len(cut) <= 20
+
+
+def test_fit_turns_keeps_the_newest_that_fit():
+    history = [{"user": "u" * 40, "agent": "a" * 40, "timestamp": ""} for _ in range(5)]
+    one = estimate_tokens(conversation_memory.format_turns(history[:1]))
+    assert fit_turns(history, one * 2) == history[-2:]
+    assert fit_turns(history, one - 1) == []
+
+
+def test_conversation_context_stays_within_budget(monkeypatch):
+    memory = FakeMemory(
+        turns(["2024-06-01T10:00:0%d" % i for i in range(4)]) * 5,
+        {"text": "s" * 2000, "covered_through": ""},
+    )
+    use(monkeypatch, memory)
+    context = prompt_builder.conversation_context("agent", 1, max_tokens=100, recent_turns=4)
+    assert context.startswith("Summary of earlier conversation: ")
+    assert estimate_tokens(context) <= 100
+
+
+def test_compact_rows_passes_small_results_and_summarizes_large_ones():
+    small = [{"category": "food", "amount": 10}]
+    assert compact_rows(small, 100) == json.dumps(small)
+
+    rows = [{"category": "food", "amount": i} for i in range(500)]
+    compact = json.loads(compact_rows(rows, 200))
+    assert compact["row_count"] == 500
+    assert 0 < len(compact["sample_rows"]) < 500
+    assert estimate_tokens(json.dumps(compact)) <= 200
+
+
+def test_turn_time_compares_naive_and_offset_timestamps():
+    assert turn_time("2024-06-01T10:00:00.000001") > turn_time("2024-06-01T10:00:00+00:00")
+    assert turn_time("2024-06-01T10:00:00") == turn_time("2024-06-01T10:00:00+00:00")
+    assert turn_time("2024-06-01T12:00:00+02:00") == turn_time("2024-06-01T10:00:00")
+    assert turn_time("") < turn_time("2000-01-01T00:00:00")
+
+
+def test_refresh_summary_waits_for_enough_uncovered_turns(monkeypatch):
+    memory = FakeMemory(turns(["2024-06-01T10:00:0%d" % i for i in range(5)]))
+    prompts = use(monkeypatch, memory)
+    assert prompt_builder.refresh_summary("agent", 1, recent_turns=2, every=4) is False
+    assert prompt_builder.refresh_summary("agent", 1, recent_turns=2, every=3) is True
+    assert memory.writes == [("summary", "2024-06-01T10:00:02")]
+    assert "q2" in prompts[0] and "q3" not in prompts[0]
+
+
+def test_refresh_summary_coverage_across_timestamp_formats(monkeypatch):
+    # Coverage written by the Postgres store (offset, no zero microseconds);
+    # turns read back from SQLite (naive, with microseconds).
+    memory = FakeMemory(
+        turns([
+            "2024-06-01T09:59:59.999999",
+            "2024-06-01T10:00:00",
+            "2024-06-01T10:00:00.000001",
+            "2024-06-01T10:00:01",
+            "2024-06-01T10:00:02",
+        ]),
+        {"text": "old", "covered_through": "2024-06-01T10:00:00+00:00"},
+    )
+    prompts = use(monkeypatch, memory)
+    assert prompt_builder.refresh_summary("agent", 1, recent_turns=1, every=3) is False
+    assert prompt_builder.refresh_summary("agent", 1, recent_turns=1, every=2) is True
+    assert "q2" in prompts[0] and "q3" in prompts[0] and "q1" not in prompts[0]
+    assert memory.writes == [("summary", "2024-06-01T10:00:01")]
+
+    # And the other way round: naive coverage against offset timestamps
+    memory = FakeMemory(
+        turns(["2024-06-01T10:00:00+00:00", "2024-06-01T10:00:01+00:00", "2024-06-01T10:00:02+00:00"]),
+        {"text": "old", "covered_through": "2024-06-01T10:00:00.500000"},
+    )
+    use(monkeypatch, memory)
+    assert prompt_builder.refresh_summary("agent", 1, recent_turns=1, every=1) is True
+    assert memory.writes == [("summary", "2024-06-01T10:00:01+00:00")]
+
+    # Postgres renders timestamps in the session time zone
+    memory = FakeMemory(
+        turns(["2024-06-01T10:00:00", "2024-06-01T10:00:01", "2024-06-01T10:00:02"]),
+        {"text": "old", "covered_through": "2024-06-01T15:30:00+05:30"},
+    )
+    use(monkeypatch, memory)
+    assert prompt_builder.refresh_summary("agent", 1, recent_turns=1, every=1) is True
+    assert memory.writes == [("summary", "2024-06-01T10:00:01")]
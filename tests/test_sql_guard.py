@@ -0,0 +1,111 @@
+import pytest
+
+import sql_guard
+from lambda_query_agent import scope_sql_to_user
+from sql_guard import QueryRejected, ensure_read_only, ensure_relations, referenced_relations
+
+ALLOWED = ["transactions", "goal", "daily_spending"]
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT category, SUM(amount) FROM transactions GROUP BY category",
+    "WITH t AS (SELECT * FROM transactions) SELECT COUNT(*) FROM t;",
+    "SELECT 'drop table x; --' AS note FROM goal",
+    "SELECT EXTRACT(MONTH FROM transaction_date) FROM transactions",
+])
+def test_read_only_accepts_single_select(sql):
+    ensure_read_only(sql)
+
+
+@pytest.mark.parametrize("sql", [
+    "DELETE FROM transactions",
+    "SELECT 1; DROP TABLE goal",
+    "SELECT 1 /* ; */ ; UPDATE goal SET target_amount = 0",
+    "WITH x AS (DELETE FROM goal RETURNING *) SELECT * FROM x",
+    "SELECT pg_sleep(10)",
+    "SELECT current_setting('app.user_id')",
+    "SELECT set_config('role', 'postgres', true)",
+    "SELECT query_to_xml('select * from pg_shadow', true, true, '')",
+    "SELECT E'\\x27' FROM goal",
+    "SELECT $$x$$ FROM goal",
+    "SELECT U&'\\0041' FROM goal",
+])
+def test_read_only_rejects_side_effects_and_opaque_quoting(sql):
+    with pytest.raises(QueryRejected):
+        ensure_read_only(sql)
+
+
+def test_referenced_relations_follows_joins_subqueries_and_comma_lists():
+    sql = """
+        SELECT g.goal_name, (SELECT SUM(amount) FROM transactions t WHERE t.category = g.category)
+        FROM goal g JOIN daily_spending d ON d.user_id = g.user_id, public.transactions
+        WHERE g.id IN (SELECT id FROM "Goal")
+    """
+    assert referenced_relations(sql) == ["transactions", "goal", "daily_spending", "public.transactions", "Goal"]
+
+
+def test_referenced_relations_ignores_from_inside_expressions():
+    sql = """
+        SELECT EXTRACT(YEAR FROM transaction_date), SUBSTRING(category FROM 1 FOR 3)
+        FROM transactions WHERE category IS DISTINCT FROM 'other'
+    """
+    assert referenced_relations(sql) == ["transactions"]
+
+
+def test_table_functions_are_not_relations():
+    sql = "SELECT d FROM generate_series('2024-01-01'::date, '2024-02-01', '1 day') AS d"
+    assert referenced_relations(sql) == []
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT * FROM transactions_p202401",
+    "SELECT * FROM transactions_default",
+    "SELECT * FROM public.transactions",
+    "SELECT * FROM archive.transactions_p201001",
+    "SELECT usename FROM pg_catalog.pg_user",
+    "SELECT * FROM pg_shadow",
+    "SELECT * FROM conversation_turns",
+    "SELECT * FROM information_schema.tables",
+    "SELECT * FROM goal, conversation_turns",
+    "SELECT (SELECT user_text FROM conversation_turns LIMIT 1) FROM goal",
+    "SELECT * FROM goal WHERE EXISTS (SELECT 1 FROM ONLY transactions_default)",
+    "SELECT * FROM goal JOIN LATERAL pg_ls_dir('.') AS f ON true",
+    "SELECT * FROM (VALUES (1)) v JOIN schema_migrations s ON true",
+])
+def test_ensure_relations_rejects_everything_outside_the_allowlist(sql):
+    with pytest.raises(QueryRejected):
+        ensure_relations(sql, ALLOWED)
+
+
+def test_ensure_relations_allows_own_ctes():
+    sql = "WITH monthly AS (SELECT * FROM transactions) SELECT * FROM monthly JOIN goal ON true"
+    ensure_relations(sql, ALLOWED)
+
+
+def test_function_in_from_is_rejected_unless_allowlisted():
+    with pytest.raises(QueryRejected):
+        ensure_relations("SELECT * FROM dblink_get_connections()", ALLOWED)
+
+
+def test_scope_sql_to_user_shadows_tables_with_filtered_ctes():
+    sql, params = scope_sql_to_user("SELECT SUM(amount) FROM transactions WHERE category LIKE 'gro%';", "42")
+    assert params == {"user_id": "42"}
+    assert sql.startswith("WITH transactions AS NOT MATERIALIZED (SELECT * FROM public.transactions "
+                          "WHERE user_id = %(user_id)s)")
+    assert sql.endswith("SELECT SUM(amount) FROM transactions WHERE category LIKE 'gro%%'")
+
+
+def test_scope_sql_to_user_merges_with_an_existing_with_clause():
+    sql, _ = scope_sql_to_user("WITH RECURSIVE n AS (SELECT 1) SELECT * FROM n, goal", "42")
+    assert sql.startswith("WITH RECURSIVE transactions AS NOT MATERIALIZED")
+    assert "daily_spending AS NOT MATERIALIZED (SELECT * FROM public.daily_spending WHERE user_id = %(user_id)s),\n" \
+           "n AS (SELECT 1)" in sql
+
+
+def test_scope_sql_to_user_rejects_unscoped_relations():
+    with pytest.raises(QueryRejected):
+        scope_sql_to_user("SELECT * FROM transactions_p202401", "42")
+
+
+def test_with_limit_wraps_the_query():
+    assert sql_guard.with_limit("SELECT 1;", 10).endswith("LIMIT 10")
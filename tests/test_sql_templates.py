@@ -0,0 +1,57 @@
+import sql_templates
+from cache import TieredCache
+from sql_templates import SQLTemplateCache, bind, extract_slots, make_template
+
+SPEND_SQL = ("SELECT SUM(amount) FROM transactions WHERE category = 'grocery' "
+             "AND transaction_date >= '2024-03-01' AND transaction_date < '2024-04-01'")
+
+
+def test_extract_slots_replaces_values_with_placeholders():
+    shape, slots = extract_slots("How much did I spend on grocery in March 2024?")
+    assert shape == "how much did i spend on slotcat in slotmonth"
+    assert slots == [("cat", {"value": "grocery"}), ("month", {"start": "2024-03-01", "end": "2024-04-01"})]
+
+
+def test_template_binds_another_questions_values():
+    _, slots = extract_slots("how much did I spend on grocery in march 2024")
+    template, fixed = make_template(SPEND_SQL, slots)
+    assert fixed == {}
+    assert "'{slot0.value}'" in template and "'{slot1.end}'" in template
+
+    _, other = extract_slots("how much did I spend on transport in december 2023")
+    assert bind(template, other) == (
+        "SELECT SUM(amount) FROM transactions WHERE category = 'transport' "
+        "AND transaction_date >= '2023-12-01' AND transaction_date < '2024-01-01'"
+    )
+
+
+def test_unexplained_dates_are_not_templated():
+    _, slots = extract_slots("how much did I spend on grocery")
+    assert make_template("SELECT SUM(amount) FROM transactions WHERE category = 'grocery' "
+                         "AND transaction_date >= '2024-01-01'", slots) is None
+
+
+def test_slots_sharing_a_literal_are_not_templated():
+    _, slots = extract_slots("transactions above 500 and below 500")
+    assert make_template("SELECT * FROM transactions WHERE amount > 500 AND amount < 500", slots) is None
+
+
+def test_numbers_bind_without_touching_other_digits():
+    _, slots = extract_slots("show transactions above 1,500")
+    template, _ = make_template("SELECT * FROM transactions WHERE amount > 1500 LIMIT 15000", slots)
+    assert template == "SELECT * FROM transactions WHERE amount > {slot0.value} LIMIT 15000"
+    assert bind(template, extract_slots("show transactions above 250.50")[1]).endswith("amount > 250.5 LIMIT 15000")
+
+
+def test_cache_learns_and_reuses_templates():
+    cache = SQLTemplateCache(TieredCache("test_sql_templates", maxsize=10, store=None))
+    assert cache.lookup("how much did I spend on grocery in march 2024") is None
+    assert cache.learn("how much did I spend on grocery in march 2024", SPEND_SQL, generation_ms=800)
+    bound = cache.lookup("How much did I spend on restaurant in May 2024")
+    assert "category = 'restaurant'" in bound and "'2024-05-01'" in bound
+
+
+def test_contextual_questions_are_never_cached():
+    cache = SQLTemplateCache(TieredCache("test_sql_templates_ctx", maxsize=10, store=None))
+    assert sql_templates.is_contextual("and what about last month?")
+    assert not cache.learn("and what about grocery in march 2024?", SPEND_SQL)
@@ -0,0 +1,119 @@
+import pytest
+
+import aws_clients
+import bedrock_gateway
+import fakes
+import streaming
+import telegram
+from streaming import TelegramStreamWriter
+
+
+class BrokenStreamBedrock(fakes.FakeBedrock):
+    """Streams the first `chunks` chunks of the reply, then fails."""
+
+    def __init__(self, chunks, **options):
+        super().__init__(**options)
+        self.chunks = chunks
+
+    def converse_stream(self, **kwargs):
+        events = super().converse_stream(**kwargs)["stream"]
+
+        def broken():
+            sent = 0
+            for event in events:
+                if "contentBlockDelta" in event:
+                    if sent == self.chunks:
+                        raise ConnectionError("stream reset")
+                    sent += 1
+                yield event
+
+        return {"stream": broken()}
+
+
+@pytest.fixture
+def install(monkeypatch):
+    monkeypatch.setattr(telegram, "call", telegram.call)
+    monkeypatch.setitem(aws_clients._clients, ("bedrock-runtime", aws_clients.BEDROCK_REGION), None)
+    monkeypatch.setattr(bedrock_gateway, "_backoff", lambda attempt: 0)
+
+    def install_fakes(bedrock=None, **options):
+        options.setdefault("first_token_delay", 0)
+        options.setdefault("token_delay", 0)
+        return fakes.install(bedrock=bedrock, **options)
+
+    return install_fakes
+
+
+def methods(bot):
+    return [method for method, _ in bot.calls]
+
+
+def test_writer_sends_once_then_throttles_edits(install, monkeypatch):
+    _, bot = install()
+    clock = [100.0]
+    monkeypatch.setattr(streaming.time, "perf_counter", lambda: clock[0])
+
+    writer = TelegramStreamWriter(42, interval=1.0)
+    for at, delta in [(100.0, "Hello"), (100.1, " there"), (100.2, ","), (101.5, " how"), (101.6, " are")]:
+        clock[0] = at
+        writer.write(delta)
+    assert methods(bot) == ["sendMessage", "editMessageText"]
+    assert bot.messages[1] == "Hello there, how"
+
+    clock[0] = 101.7
+    writer.write(" you?")
+    writer.close()
+    writer.close()  # nothing new to show
+    assert methods(bot) == ["sendMessage", "editMessageText", "editMessageText"]
+    assert bot.messages[1] == "Hello there, how are you?"
+    assert writer.edits == 2
+
+
+def test_writer_waits_for_visible_text(install):
+    _, bot = install()
+    writer = TelegramStreamWriter(42)
+    writer.write("  ")
+    writer.close()
+    assert bot.calls == []
+
+
+def test_converse_text_streams_into_one_message(install):
+    reply = "You spent 1,200 on food this week, mostly on weekends."
+    bedrock, bot = install(reply=reply)
+
+    assert streaming.converse_text("answer", "prompt", chat_id=42) == reply
+    assert [name for name, _ in bedrock.requests] == ["converse_stream"]
+    assert methods(bot)[0] == "sendMessage"
+    assert set(methods(bot)[1:]) <= {"editMessageText"}
+    assert bot.messages == {1: reply}
+
+
+def test_converse_text_without_chat_id_does_not_stream(install):
+    bedrock, bot = install(reply="Done.")
+    assert streaming.converse_text("answer", "prompt") == "Done."
+    assert [name for name, _ in bedrock.requests] == ["converse"]
+    assert bot.calls == []
+
+
+def test_broken_stream_replaces_partial_message_with_fallback(install):
+    bedrock = BrokenStreamBedrock(2, reply="one two three four five six", first_token_delay=0, token_delay=0)
+    _, bot = install(bedrock=bedrock)
+
+    text = streaming.converse_text("answer", "prompt", chat_id=42, fallback=lambda: "Here is a summary instead.")
+    assert text == "Here is a summary instead."
+    assert methods(bot)[0] == "sendMessage"
+    assert methods(bot)[-1] == "editMessageText"
+    assert bot.messages == {1: "Here is a summary instead."}
+
+
+def test_broken_stream_without_fallback_shows_error_text(install):
+    _, bot = install(bedrock=BrokenStreamBedrock(1, reply="one two three", first_token_delay=0, token_delay=0))
+    assert streaming.converse_text("answer", "prompt", chat_id=42) == streaming.STREAM_ERROR_TEXT
+    assert bot.messages == {1: streaming.STREAM_ERROR_TEXT}
+
+
+def test_stream_failing_before_any_text_sends_the_fallback(install):
+    _, bot = install(bedrock=BrokenStreamBedrock(0, reply="one two", first_token_delay=0, token_delay=0))
+    assert streaming.converse_text("answer", "prompt", chat_id=42, fallback=lambda: "Later.") == "Later."
+    assert methods(bot) == ["sendMessage"]
+    assert bot.messages == {1: "Later."}
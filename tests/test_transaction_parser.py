@@ -0,0 +1,42 @@
+from datetime import date
+
+import pytest
+
+from transaction_parser import parse_amount, parse_date, parse_transaction
+
+TODAY = date(2024, 6, 12)  # a Wednesday
+
+
+@pytest.mark.parametrize("message, expected", [
+    ("spent 200 on groceries today", (200, "debit", "2024-06-12", "grocery")),
+    ("paid ₹1,200 for uber yesterday", (1200, "debit", "2024-06-11", "transport")),
+    ("received salary of 50k", (50000, "credit", "2024-06-12", "salary")),
+    ("spent 2.5k on movie last friday", (2500, "debit", "2024-06-07", "entertainment")),
+    ("paid rs 450 for pizza 3 days ago", (450, "debit", "2024-06-09", "restaurant")),
+])
+def test_parses_unambiguous_messages(message, expected):
+    parsed = parse_transaction(message, TODAY)
+    assert (parsed["amount"], parsed["transaction_type"], parsed["transaction_date"], parsed["category"]) == expected
+
+
+@pytest.mark.parametrize("message", [
+    "spent 200 on groceries on 5th june",  # explicit dates go to the model
+    "spent 200 and 300 on food",            # two amounts
+    "got 500",                              # no category
+    "spent 200 on groceries\npaid 100",     # several records
+    "",
+])
+def test_returns_none_when_any_field_is_ambiguous(message):
+    assert parse_transaction(message, TODAY) is None
+
+
+def test_amount_suffixes():
+    assert parse_amount("1.5 lakh") == 150000
+    assert parse_amount("rs. 99.50") == 99.5
+    assert parse_amount("nothing here") is None
+
+
+def test_relative_dates():
+    assert parse_date("day before yesterday", TODAY) == date(2024, 6, 10)
+    assert parse_date("last wednesday", TODAY) == date(2024, 6, 5)
+    assert parse_date("on 12/05", TODAY) is None
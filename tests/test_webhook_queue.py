@@ -0,0 +1,148 @@
+import json
+import time
+
+import pytest
+
+import aws_clients
+import classification_function
+import metrics
+import webhook_queue
+from cache import LRUCache
+from webhook_queue import LambdaEventQueue, LocalQueue
+
+
+class FakeLambda:
+    def __init__(self):
+        self.invocations = []
+
+    def invoke(self, **kwargs):
+        self.invocations.append(kwargs)
+
+
+class ListQueue:
+    def __init__(self):
+        self.jobs = []
+
+    def put(self, job):
+        self.jobs.append(job)
+
+    def depth(self):
+        return len(self.jobs)
+
+
+class BrokenQueue:
+    def put(self, job):
+        raise RuntimeError("queue unavailable")
+
+    def depth(self):
+        return None
+
+
+@pytest.fixture(autouse=True)
+def fresh_metrics():
+    metrics.reset()
+    yield
+    metrics.reset()
+
+
+def job(update=None):
+    return {"update": update or {}, "received_at": time.time()}
+
+
+def test_run_job_records_outcomes():
+    webhook_queue.run_job(lambda j: None, job())
+
+    def fail(j):
+        raise ValueError("bad update")
+
+    webhook_queue.run_job(fail, job())
+    assert metrics.counter("webhook.processed") == 1
+    assert metrics.counter("webhook.failed") == 1
+    assert metrics.snapshot("webhook.end_to_end")["webhook.end_to_end"]["count"] == 2
+
+
+def test_local_queue_processes_jobs_in_order():
+    seen = []
+    local = LocalQueue(lambda j: seen.append(j["update"]["n"]))
+    for n in range(5):
+        local.put(job({"n": n}))
+    assert local.flush(timeout=2)
+    assert seen == [0, 1, 2, 3, 4]
+    assert local.depth() == 0
+    stats = webhook_queue.stats(local)
+    assert (stats["queue"], stats["enqueued"], stats["processed"]) == ("LocalQueue", 5, 5)
+
+
+def test_lambda_queue_invokes_the_worker_asynchronously(monkeypatch):
+    client = FakeLambda()
+    monkeypatch.setitem(aws_clients._clients, ("lambda", None), client)
+    update = job({"update_id": 7})
+    LambdaEventQueue("worker").put(update)
+
+    [call] = client.invocations
+    assert (call["FunctionName"], call["InvocationType"]) == ("worker", "Event")
+    assert json.loads(call["Payload"]) == {"async_update": update}
+    assert metrics.counter("webhook.enqueued") == 1
+
+
+def test_lambda_queue_requires_a_worker():
+    with pytest.raises(RuntimeError):
+        LambdaEventQueue(function_name=None).put(job())
+
+
+def test_make_queue():
+    assert isinstance(webhook_queue.make_queue("local", print), LocalQueue)
+    assert isinstance(webhook_queue.make_queue("lambda", print), LambdaEventQueue)
+
+
+@pytest.fixture
+def async_router(monkeypatch):
+    monkeypatch.setattr(classification_function, "WEBHOOK_MODE", "async")
+    monkeypatch.setattr(classification_function, "_seen_updates", LRUCache(maxsize=16, ttl=60))
+    monkeypatch.setattr(classification_function.startup, "report_once", lambda: None)
+    replies = []
+    monkeypatch.setattr(classification_function, "reply_in_background", lambda j: replies.append(j["update"]))
+    return replies
+
+
+def webhook(update):
+    return {"body": json.dumps(update)}
+
+
+def test_router_acknowledges_and_drops_redeliveries(monkeypatch, async_router):
+    queued = ListQueue()
+    monkeypatch.setattr(classification_function, "webhook_jobs", queued)
+
+    for _ in range(2):
+        response = classification_function.lambda_handler(webhook({"update_id": 1, "message": {}}), None)
+        assert response == {"statusCode": 200, "body": ""}
+    assert [j["update"]["update_id"] for j in queued.jobs] == [1]
+    assert metrics.counter("webhook.duplicate") == 1
+    assert async_router == []
+
+
+def test_router_processes_inline_when_enqueue_fails(monkeypatch, async_router):
+    monkeypatch.setattr(classification_function, "webhook_jobs", BrokenQueue())
+    response = classification_function.lambda_handler(webhook({"update_id": 2}), None)
+    assert response["statusCode"] == 200
+    assert async_router == [{"update_id": 2}]
+    assert metrics.counter("webhook.enqueue_failed") == 1
+
+
+def test_router_leaves_failed_updates_for_redelivery(monkeypatch, async_router):
+    monkeypatch.setattr(classification_function, "webhook_jobs", BrokenQueue())
+
+    def fail(j):
+        raise RuntimeError("telegram down")
+
+    monkeypatch.setattr(classification_function, "reply_in_background", fail)
+    assert classification_function.lambda_handler(webhook({"update_id": 3}), None)["statusCode"] == 500
+    assert classification_function._seen_updates.get(3) is None
+
+
+def test_worker_invocation_runs_the_job(monkeypatch, async_router):
+    monkeypatch.setattr(classification_function, "webhook_jobs", LambdaEventQueue("worker"))
+    update = job({"update_id": 4})
+    assert classification_function.lambda_handler({"async_update": update}, None) == {"statusCode": 200}
+    assert async_router == [{"update_id": 4}]
+    assert metrics.counter("webhook.processed") == 1